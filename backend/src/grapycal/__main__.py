@@ -1,23 +1,83 @@
 # grapycal
 
 import os
+import sys
 from grapycal import GrapycalApp
 from .utils import usersettings
 import argparse
 
 
+def run_main(argv: list[str]):
+    """
+    Entry function of `grapycal run`, which runs a workspace without the server
+    """
+    parser = argparse.ArgumentParser(prog='grapycal run', description='Run a workspace without the server or a client, e.g. for batch jobs')
+    parser.add_argument('path', type=str, help='path to workspace file')
+    parser.add_argument('--source', type=str, action='append', help='node id or node type to trigger. Can be given multiple times. By default, all source nodes without an edge to their run port are triggered')
+    parser.add_argument('--workers', type=int, default=1, help='number of threads running node tasks')
+    parser.add_argument('--max-pending', type=int, default=10000, help='number of queued node tasks at which sources are throttled. 0 means unbounded')
+    parser.add_argument('--memory-budget', type=int, default=0, help='MB of data that edges may hold before the memory policy applies. 0 means no budget')
+    parser.add_argument('--memory-policy', type=str, default='warn', choices=['warn', 'evict'], help='what to do when edges hold more data than the memory budget')
+    parser.add_argument('--cache-budget', type=int, default=256, help='MB of results that cacheable nodes may keep. 0 disables the cache')
+    parser.add_argument('--idle-grace', type=float, default=0.5, help='seconds the runner must stay idle before exiting')
+    parser.add_argument('--stats', type=str, help='path to write the runtime and node stats to, as JSON')
+    if len(argv) == 0 and os.path.exists('run'):
+        parser.error('the following arguments are required: path. To open the workspace file named run, use grapycal ./run')
+    args = parser.parse_args(argv)
+
+    from grapycal.core.headless import run_headless
+    sys.exit(run_headless(
+        args.path,
+        args.source,
+        args.workers,
+        args.max_pending,
+        args.memory_budget,
+        args.memory_policy,
+        args.cache_budget,
+        args.idle_grace,
+        args.stats,
+    ))
+
+
+def export_main(argv: list[str]):
+    """
+    Entry function of `grapycal export`, which exports a workspace to a Python module
+    """
+    parser = argparse.ArgumentParser(prog='grapycal export', description='Export the graph of a workspace to a Python module that runs without Grapycal\'s runtime')
+    parser.add_argument('path', type=str, help='path to workspace file')
+    parser.add_argument('out', type=str, help='path to write the module to')
+    if len(argv) == 0 and os.path.exists('export'):
+        parser.error('the following arguments are required: path, out. To open the workspace file named export, use grapycal ./export')
+    args = parser.parse_args(argv)
+
+    from grapycal.core.export import export_workspace
+    sys.exit(export_workspace(args.path, args.out))
+
+
 def main():
     """
     Entry function of backend server
     """
+    if sys.argv[1:2] == ['run']:
+        run_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['export']:
+        export_main(sys.argv[2:])
+        return
     here = os.path.dirname(os.path.abspath(__file__))
     #parse arguments
-    parser = argparse.ArgumentParser(description='Grapycal backend server')
-    parser.add_argument('path', type=str, help='path to workspace file', nargs='?', default=None)
+    parser = argparse.ArgumentParser(description='Grapycal backend server', epilog='Run "grapycal run -h" and "grapycal export -h" for the other commands.')
+    parser.add_argument('path', type=str, help='path to workspace file. A file named run or export must be given as ./run or ./export, as those are commands', nargs='?', default=None)
     parser.add_argument('--port', type=int, help='port to listen on')
     parser.add_argument('--http-port', type=int, help='http port to listen on (to serve webpage)')
     parser.add_argument('--host', type=str, help='host to listen on')
     parser.add_argument('--no-http', action='store_true', help='if set, the server does not serve the webpage')
+    parser.add_argument('--workers', type=int, help='number of threads running node tasks. Tasks of nodes not connected by an edge can run in parallel')
+    parser.add_argument('--max-pending', type=int, help='number of queued node tasks at which sources are throttled. 0 means unbounded')
+    parser.add_argument('--memory-budget', type=int, help='MB of data that edges may hold before the memory policy applies. 0 means no budget')
+    parser.add_argument('--memory-policy', type=str, choices=['warn', 'evict'], help='what to do when edges hold more data than the memory budget')
+    parser.add_argument('--cache-budget', type=int, help='MB of results that cacheable nodes may keep. 0 disables the cache')
+    parser.add_argument('--output-log-dir', type=str, help='directory to write the full output of each node to. Empty to disable')
     parser.add_argument('--restart', action='store_true', help='if set, the workspace restarts when it exits. Convenient for development')
     args = parser.parse_args()
     s = usersettings.Settings("Grapycal")
@@ -25,6 +85,12 @@ def main():
     s.add_setting("http_port", int, default=9001) #type: ignore
     s.add_setting("host", str, default="localhost") #type: ignore
     s.add_setting("path", str, default=os.path.join(here,"Welcome.grapycal")) #type: ignore
+    s.add_setting("workers", int, default=1) #type: ignore
+    s.add_setting("max_pending", int, default=10000) #type: ignore
+    s.add_setting("memory_budget", int, default=0) #type: ignore
+    s.add_setting("memory_policy", str, default="warn") #type: ignore
+    s.add_setting("cache_budget", int, default=256) #type: ignore
+    s.add_setting("output_log_dir", str, default="") #type: ignore
     s.load_settings()
     if args.port:
         s['port'] = args.port
@@ -34,6 +100,18 @@ def main():
         s['path'] = args.path
     if args.http_port:
         s['http_port'] = args.http_port
+    if args.workers:
+        s['workers'] = args.workers
+    if args.max_pending is not None:
+        s['max_pending'] = args.max_pending
+    if args.memory_budget is not None:
+        s['memory_budget'] = args.memory_budget
+    if args.memory_policy:
+        s['memory_policy'] = args.memory_policy
+    if args.cache_budget is not None:
+        s['cache_budget'] = args.cache_budget
+    if args.output_log_dir is not None:
+        s['output_log_dir'] = args.output_log_dir
     s.save_settings()
     s['no_http'] = args.no_http
     s['restart'] = args.restart
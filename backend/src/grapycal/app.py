@@ -131,6 +131,18 @@ class GrapycalApp:
                 self._config["path"],
                 "--workspace_id",
                 str(workspace_id),
+                "--workers",
+                str(self._config["workers"]),
+                "--max-pending",
+                str(self._config["max_pending"]),
+                "--memory-budget",
+                str(self._config["memory_budget"]),
+                "--memory-policy",
+                self._config["memory_policy"],
+                "--cache-budget",
+                str(self._config["cache_budget"]),
+                "--output-log-dir",
+                self._config["output_log_dir"],
             ],
             start_new_session=True,
         )
@@ -3,43 +3,301 @@ logger = logging.getLogger(__name__)
 
 from collections import deque
 from contextlib import contextmanager
-from queue import Queue
-import queue
+import sys
+import threading
 import traceback
-from typing import Callable, Iterator
+from typing import Callable, Hashable, Iterable, Iterator, Literal
 import signal
 from .stdout_helper import orig_print
+from .tracer import Tracer
 
-class BackgroundRunner:
+# Waiting for a lock can't be interrupted by signals on Windows, so idle workers wake up periodically there to let
+# SIGINT and SIGTERM handlers run. On POSIX the wait is interrupted by signals directly.
+_WAIT_TIMEOUT = 0.5 if sys.platform == 'win32' else None
+
+Priority = Literal['interactive', 'normal', 'bulk']
+
+# Share of runner time each priority gets when all of them have work.
+PRIORITY_WEIGHTS: dict[Priority, int] = {
+    'interactive': 8,
+    'normal': 4,
+    'bulk': 1,
+}
+
+# What happens to a task pushed while the runner is full. See BackgroundRunner.push.
+Backpressure = Literal['block', 'drop', 'yield']
+
+class TaskCancelled(Exception):
+    '''
+    Raised by a task to stop after it has been cancelled. The runner treats it like a normal return.
+    '''
+
+class CancellationToken:
+    '''
+    Lets a running task know that it has been cancelled. Cancellation is cooperative: long-running tasks should call
+    `raise_if_cancelled()` regularly, or wait with `sleep()`, which wakes up as soon as the token is cancelled.
+    '''
     def __init__(self):
-        self._inputs: Queue = Queue()
-        self._queue: deque = deque()
-        self._stack: deque = deque()
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise TaskCancelled()
+
+    def sleep(self, seconds: float):
+        '''
+        Like time.sleep, but raises TaskCancelled as soon as the token is cancelled.
+        '''
+        if self._event.wait(seconds):
+            raise TaskCancelled()
+
+class _Entry:
+    '''
+    A task waiting in the runner. `group` identifies the owner of the task (usually a node id). Tasks of the same group
+    never run concurrently, and neither do tasks whose group is in each other's `conflicts`.
+    '''
+    __slots__ = ('task', 'group', 'conflicts', 'level', 'coalesce_key', 'yields', 'running', 'cancelled', 'trace')
+
+    def __init__(self, task: Callable|Iterator, group: Hashable|None, conflicts: frozenset, level: '_Level',
+                 coalesce_key: Hashable|None = None, yields: bool = False):
+        self.task = task
+        self.group = group
+        self.conflicts = conflicts
+        self.level = level
+        self.coalesce_key = coalesce_key
+        self.yields = yields # held back on the stack while the runner is full
+        self.running = False # an iterator stays on the stack while it is being advanced
+        self.cancelled = False # a running iterator is closed after its current step
+        self.trace: tuple[int, float]|None = None # set by the tracer when the task is pushed
+
+class _Level:
+    '''
+    The queue and stack of one priority.
+    '''
+    def __init__(self, name: Priority, weight: int):
+        self.name = name
+        self.weight = weight
+        self.credit = 0
+        self.queue: deque[_Entry] = deque()
+        self.stack: deque[_Entry] = deque()
+        # the group that ran the latest tasks from the queue and how many in a row
+        self.streak_group: Hashable|None = None
+        self.streak = 0
+
+    def __len__(self):
+        return len(self.queue) + len(self.stack)
+
+class BackgroundRunner:
+    '''
+    Runs tasks pushed by nodes. Each task has a priority. Priorities share the runner by weighted round robin
+    (see PRIORITY_WEIGHTS), so bulk work can't starve interactive tasks and vice versa.
+
+    Within a priority, tasks pushed to the queue run in FIFO order and are prioritized over tasks pushed to the stack,
+    which run in LIFO order. If a task returns an iterable, it is pushed to the stack and advanced one step at a time.
+    After `node_quota` consecutive queued tasks of one group, tasks of other groups in the same queue go first.
+
+    A task pushed with a `coalesce_key` replaces the pending task with the same key, if that one hasn't started yet.
+    The replacement keeps the place of the old task, so high-rate sources can't make the runner fall behind.
+
+    With `num_workers` > 1, tasks are run by a pool of threads. The thread calling `run()` is one of the workers, so
+    interrupting with SIGINT only affects the task running on it.
+
+    The runner is full when `max_pending` tasks are waiting in the queues. Producers pushing more are throttled
+    according to their backpressure policy (see `push`), so fast sources can't grow the queues without bound.
+    '''
+    def __init__(self, num_workers: int = 1, node_quota: int = 32, max_pending: int|None = None):
+        self._levels: dict[Priority, _Level] = {name: _Level(name, weight) for name, weight in PRIORITY_WEIGHTS.items()}
+        self._node_quota = node_quota
         self._exit_flag = False
-        self._exception_callback: Callable[[Exception|KeyboardInterrupt], None]|None=None
+        self._num_workers = max(1, num_workers)
+        lock = threading.Lock()
+        self._condition = threading.Condition(lock) # waited on by idle workers
+        self._idle_workers = 0
+        self._active = 0 # number of tasks being run
+        self._busy_groups: set[Hashable] = set()
+        self._blocked: dict[Hashable, int] = {} # groups of running tasks and their conflicts
+        self._coalescing: dict[Hashable, _Entry] = {} # pending tasks that have a coalesce key
+        self._max_pending = max_pending
+        self._queued = 0 # number of tasks in the queues of all priorities
+        self._not_full = threading.Condition(lock) # waited on by blocked producers
+        self._blocked_producers = 0
+        self._local = threading.local() # holds the exception callback of each worker and whether the thread is one
+        self._tracer: Tracer|None = None
+        self._main_running = False # whether a task is running on the thread that called run()
 
-    def push(self, task: Callable, to_queue: bool = True):
-        self._inputs.put((task, to_queue))
+    def push(self, task: Callable, to_queue: bool = True, group: Hashable|None = None, conflicts: Iterable[Hashable] = (),
+             priority: Priority = 'normal', coalesce_key: Hashable|None = None, backpressure: Backpressure = 'yield') -> bool:
+        '''
+        Push a task. If the runner is full, `backpressure` decides what happens:
+
+        - ``block``: wait until there is room. Only producer threads should wait. Workers can't wait for themselves, and
+          a thread marked with `set_non_blocking` must stay responsive, so there this acts like ``yield``.
+        - ``drop``: discard the task.
+        - ``yield``: accept the task, but hold back the stack tasks (iterators and continuations pushed with
+          `to_queue=False`) of the pusher until there is room again, so generator-like producers pause.
+
+        Interactive tasks and tasks replacing a pending one by `coalesce_key` are always accepted. Returns whether the
+        task was accepted.
+        '''
+        level = self._levels[priority]
+        entry = _Entry(task, group, frozenset(conflicts), level, coalesce_key, yields=backpressure != 'drop')
+        tracer = self._tracer # may be set to None by another thread meanwhile
+        if tracer is not None:
+            entry.trace = tracer.pushed()
+        with self._condition:
+            if coalesce_key is not None:
+                pending = self._coalescing.get(coalesce_key)
+                if pending is not None:
+                    pending.task = task # the old task and the data it captured are released here
+                    return True
+            if priority != 'interactive' and self._is_full():
+                if backpressure == 'drop':
+                    return False
+                can_wait = not getattr(self._local, 'is_worker', False) and not getattr(self._local, 'non_blocking', False)
+                if backpressure == 'block' and can_wait:
+                    self._blocked_producers += 1
+                    try:
+                        while self._is_full() and not self._exit_flag:
+                            self._not_full.wait(_WAIT_TIMEOUT)
+                    finally:
+                        self._blocked_producers -= 1
+            if coalesce_key is not None:
+                self._coalescing[coalesce_key] = entry
+            if to_queue:
+                level.queue.appendleft(entry)
+                self._queued += 1
+            else:
+                level.stack.append(entry)
+                pushes = getattr(self._local, 'stack_pushes', None)
+                if pushes is not None: # pushed by a task running on this worker, see _run_entry
+                    pushes.append(entry)
+            if self._idle_workers > 0:
+                self._condition.notify()
+            return True
 
     def push_to_queue(self, task: Callable):
-        self._inputs.put((task, True))
+        self.push(task, True)
 
     def push_to_stack(self, task: Callable):
-        self._inputs.put((task, False))
+        self.push(task, False)
 
     def interrupt(self):
-        signal.raise_signal(signal.SIGINT)
+        '''
+        Interrupt the task running on the thread that called `run()` with SIGINT. Does nothing if no task is running
+        there, so the KeyboardInterrupt can't escape to code outside of a task.
+        '''
+        if self._main_running:
+            signal.raise_signal(signal.SIGINT)
 
     def clear_tasks(self):
-        self._queue.clear()
-        self._stack.clear()
+        with self._condition:
+            for level in self._levels.values():
+                level.queue.clear()
+                level.stack.clear()
+            self._coalescing.clear()
+            self._queued = 0
+            self._not_full.notify_all()
+
+    def cancel(self, groups: Iterable[Hashable]):
+        '''
+        Remove the pending tasks of the groups and close their iterators. An iterator being advanced right now is closed
+        after the current step. Running tasks are not interrupted; they should cooperate through a CancellationToken.
+        Iterators are closed on the workers, so their cleanup code doesn't run on the caller's thread. Tasks pushed
+        without a group are in the group None.
+        '''
+        groups = set(groups)
+        closing_level = self._levels['interactive']
+        with self._condition:
+            closing = []
+            for level in self._levels.values():
+                for tasks in (level.queue, level.stack):
+                    kept = []
+                    for entry in tasks:
+                        if entry.group not in groups:
+                            kept.append(entry)
+                        elif entry.running:
+                            entry.cancelled = True
+                            kept.append(entry)
+                        elif isinstance(entry.task, Iterator):
+                            closing.append(_Entry(entry.task.close, entry.group, entry.conflicts, closing_level))
+                        else:
+                            if entry.coalesce_key is not None:
+                                del self._coalescing[entry.coalesce_key]
+                            if tasks is level.queue:
+                                self._queued -= 1
+                    tasks.clear()
+                    tasks.extend(kept)
+            closing_level.queue.extendleft(closing)
+            self._queued += len(closing)
+            if self._idle_workers > 0:
+                self._condition.notify_all()
+            if self._blocked_producers > 0 and not self._is_full():
+                self._not_full.notify_all()
+
+    def is_full(self) -> bool:
+        '''
+        Returns whether `max_pending` tasks are waiting in the queues. Sources that receive data outside of the runner
+        can check this to leave the data where it comes from (e.g. a socket) until the runner catches up.
+        '''
+        with self._condition:
+            return self._is_full()
+
+    def _is_full(self) -> bool:
+        return self._max_pending is not None and self._queued >= self._max_pending
+
+    def get_queue_depths(self) -> dict[str, int]:
+        '''
+        Returns the number of pending tasks (queue and stack) of each priority.
+        '''
+        with self._condition:
+            return {name: len(level) for name, level in self._levels.items()}
+
+    def set_non_blocking(self):
+        '''
+        Never wait for room in `push` on the current thread, even with ``block`` backpressure. For threads that serve
+        others, like the one handling the clients' messages, which runs nodes from event handlers.
+        '''
+        self._local.non_blocking = True
 
     def set_exception_callback(self, callback: Callable[[Exception|KeyboardInterrupt], None]|None):
-        self._exception_callback = callback
+        '''
+        Set the exception callback of the current worker thread.
+        '''
+        self._local.exception_callback = callback
+
+    def set_tracer(self, tracer: Tracer|None):
+        '''
+        Start recording tasks with the tracer, or stop recording if it is None.
+        '''
+        self._tracer = tracer
+
+    def get_num_workers(self) -> int:
+        return self._num_workers
 
-    def exit(self):
+    def is_idle(self) -> bool:
+        '''
+        Returns whether no task is running or waiting to run.
+        '''
+        with self._condition:
+            return self._active == 0 and all(len(level) == 0 for level in self._levels.values())
+
+    def exit(self, interrupt: bool = True):
+        '''
+        Stop the workers after their current tasks. If `interrupt` is True, the task running on the thread that called
+        `run()` is interrupted instead of finished, see `interrupt`.
+        '''
         self._exit_flag = True
-        self.interrupt()
+        with self._condition:
+            self._condition.notify_all()
+            self._not_full.notify_all()
+        if interrupt:
+            self.interrupt()
 
     @contextmanager
     def no_interrupt(self):
@@ -54,51 +312,220 @@ class BackgroundRunner:
             signal.signal(signal.SIGINT, original_sigint_handler)
 
     def run(self):
+        workers = []
+        for i in range(1, self._num_workers):
+            worker = threading.Thread(target=self._work, daemon=True, name=f'BackgroundRunner-{i}')
+            worker.start()
+            workers.append(worker)
+        self._work(is_main=True)
+
+    def _work(self, is_main: bool = False):
+        self._local.is_worker = True
         while True:
             if self._exit_flag:
                 break
+            entry = None
             try:
-                # Queue.get() blocks signal.
-                while not self._inputs.empty() or (len(self._queue) == 0 and len(self._stack) == 0):
-                    try:
-                        inp = self._inputs.get(timeout=0.2)
-                    except queue.Empty:
-                        continue
-                    task, push_to_queue = inp
-                    if push_to_queue:
-                        self._queue.appendleft(task)
-                    else:
-                        self._stack.append(task)
-
-
-                # queue is prioritized
-                if len(self._queue) > 0:
-                    task_to_run = self._queue.pop()
-                else:
-                    task_to_run = self._stack.pop()
+                entry = self._take()
+                if entry is None:
+                    continue
 
-                if isinstance(task_to_run, Iterator):
-                    try:
-                        self._stack.append(task_to_run)
-                        next(task_to_run)
-                    except StopIteration:
-                        self._stack.pop()
+                tracer = self._tracer
+                if is_main:
+                    self._main_running = True
+                if tracer is None:
+                    self._run_entry(entry)
                 else:
-                    ret = task_to_run()
-                    # if ret is a generator, push it to stack
-                    if ret is not None:
-                        self._stack.append(iter(ret))
+                    with tracer.running(entry.group, isinstance(entry.task, Iterator), entry.trace):
+                        self._run_entry(entry)
 
             except KeyboardInterrupt as e:
                 logger.info("Runner interrupted")
-                if self._exception_callback is None:
+                callback = getattr(self._local, 'exception_callback', None)
+                if callback is None:
                     pass
                 else:
-                    self._exception_callback(e)
+                    callback(e)
+
+            except TaskCancelled:
+                pass
 
             except Exception as e:
-                self.clear_tasks()
-                if self._exception_callback is None:
+                # Workers may run other pipelines meanwhile, so a failing node only loses its own pending tasks
+                if entry is not None and entry.group is not None:
+                    self.cancel([entry.group])
+                else:
+                    self.clear_tasks()
+                callback = getattr(self._local, 'exception_callback', None)
+                if callback is None:
                     orig_print('No exception callback',e)
                 else:
-                    self._exception_callback(e)
\ No newline at end of file
+                    callback(e)
+
+            finally:
+                if is_main:
+                    self._main_running = False
+                if entry is not None:
+                    with self._condition:
+                        self._active -= 1
+                        if entry.group is not None:
+                            self._release(entry)
+
+    def _run_entry(self, entry: _Entry):
+        task_to_run = entry.task
+        stack = entry.level.stack
+        if isinstance(task_to_run, Iterator):
+            finished = True
+            try:
+                if not entry.cancelled:
+                    next(task_to_run)
+                    finished = entry.cancelled
+            except (StopIteration, TaskCancelled):
+                pass
+            finally:
+                if finished:
+                    with self._condition:
+                        self._remove_from_stack(entry)
+                entry.running = False
+            if finished and entry.cancelled:
+                task_to_run.close()
+        else:
+            pushes: list[_Entry] = []
+            outer, self._local.stack_pushes = getattr(self._local, 'stack_pushes', None), pushes
+            try:
+                ret = task_to_run()
+            finally:
+                self._local.stack_pushes = outer
+            # if ret is a generator, push it to stack, below the tasks pushed by the task itself that are still there.
+            # Other workers may have pushed or popped meanwhile, so they are looked up rather than counted.
+            if ret is not None:
+                own = {pushed for pushed in pushes if pushed.level is entry.level}
+                with self._condition:
+                    generator = _Entry(iter(ret), entry.group, entry.conflicts, entry.level, yields=entry.yields)
+                    index = len(stack)
+                    if len(own) > 0:
+                        index = next((i for i, other in enumerate(stack) if other in own), index)
+                    stack.insert(index, generator)
+
+    def _remove_from_stack(self, entry: _Entry):
+        # The entry is usually near the top. It may be gone if the tasks were cleared meanwhile.
+        stack = entry.level.stack
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i] is entry:
+                del stack[i]
+                return
+
+    def _take(self) -> _Entry|None:
+        '''
+        Wait for the next task that is allowed to run and pop it. Iterators are not popped but marked running, so
+        tasks they push while being advanced land above them. The group of the returned task is marked busy until
+        the task finishes. Returns None if the runner is exiting or the wait timed out.
+        '''
+        with self._condition:
+            while True:
+                if self._exit_flag:
+                    return None
+                entry = self._pop_next()
+                if entry is not None:
+                    break
+                self._idle_workers += 1
+                try:
+                    notified = self._condition.wait(_WAIT_TIMEOUT)
+                finally:
+                    self._idle_workers -= 1
+                if not notified:
+                    return None
+            self._active += 1
+            if entry.group is not None:
+                self._acquire(entry)
+            return entry
+
+    def _pop_next(self) -> _Entry|None:
+        # Smooth weighted round robin: every priority with pending tasks earns its weight, and the chosen one pays
+        # back the total. If the richest priority has nothing runnable, the next richest is tried.
+        pending = [level for level in self._levels.values() if len(level) > 0]
+        if len(pending) == 0:
+            return None
+        if len(pending) == 1:
+            level = pending[0]
+            level.credit = 0
+            return self._pop_from_level(level)
+
+        for level in pending:
+            level.credit += level.weight
+        for level in sorted(pending, key=lambda level: level.credit, reverse=True):
+            entry = self._pop_from_level(level)
+            if entry is not None:
+                level.credit -= sum(other.weight for other in pending)
+                return entry
+        # Nothing runnable. Take the credit back so waiting doesn't count as being skipped.
+        for level in pending:
+            level.credit -= level.weight
+        return None
+
+    def _pop_from_level(self, level: _Level) -> _Entry|None:
+        # queue is prioritized
+        entry = self._pop_from_queue(level)
+        if entry is None:
+            entry = self._pop_runnable(level.stack)
+        return entry
+
+    def _pop_from_queue(self, level: _Level) -> _Entry|None:
+        entry = None
+        if level.streak >= self._node_quota:
+            # The group that ran the latest tasks has used up its quota. Let another group go first if there is one.
+            entry = self._pop_runnable(level.queue, skip_group=level.streak_group)
+            if entry is None:
+                level.streak = 0
+        if entry is None:
+            entry = self._pop_runnable(level.queue)
+        if entry is None:
+            return None
+        if entry.group is not None and entry.group == level.streak_group:
+            level.streak += 1
+        else:
+            level.streak_group = entry.group
+            level.streak = 1
+        return entry
+
+    def _acquire(self, entry: _Entry):
+        self._busy_groups.add(entry.group)
+        for group in (entry.group, *entry.conflicts):
+            self._blocked[group] = self._blocked.get(group, 0) + 1
+
+    def _release(self, entry: _Entry):
+        self._busy_groups.discard(entry.group)
+        for group in (entry.group, *entry.conflicts):
+            if self._blocked[group] == 1:
+                del self._blocked[group]
+            else:
+                self._blocked[group] -= 1
+        if self._idle_workers > 0:
+            # tasks held back by this group may be runnable now
+            self._condition.notify_all()
+
+    def _pop_runnable(self, tasks: deque[_Entry], skip_group: Hashable|None = None) -> _Entry|None:
+        # Both the queue and the stack are consumed from the right.
+        if len(tasks) == 0:
+            return None
+        for i in range(len(tasks) - 1, -1, -1):
+            entry = tasks[i]
+            if entry.running:
+                continue
+            if skip_group is not None and entry.group == skip_group:
+                continue
+            if entry.yields and tasks is entry.level.stack and self._is_full():
+                continue
+            if entry.group is None or (entry.group not in self._blocked and self._busy_groups.isdisjoint(entry.conflicts)):
+                if isinstance(entry.task, Iterator):
+                    entry.running = True
+                else:
+                    del tasks[i]
+                    if entry.coalesce_key is not None:
+                        del self._coalescing[entry.coalesce_key]
+                    if tasks is entry.level.queue:
+                        self._queued -= 1
+                        if self._blocked_producers > 0 and not self._is_full():
+                            self._not_full.notify_all()
+                return entry
+        return None
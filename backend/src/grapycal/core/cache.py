@@ -0,0 +1,149 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from grapycal.utils.sizing import estimate_size
+
+try:
+    import torch
+    HAS_TORCH = True
+except:
+    HAS_TORCH = False
+
+try :
+    import numpy as np
+    HAS_NUMPY = True
+except:
+    HAS_NUMPY = False
+
+class _Unhashable(Exception):
+    pass
+
+def content_hash(value: Any) -> bytes|None:
+    '''
+    Hash the content of a value with BLAKE2b. Arrays and tensors are hashed from their buffers, without copying them
+    unless they are not contiguous or not on the CPU. Returns None if the value contains something whose content can't
+    be hashed: objects other than None, numbers, strings, bytes, arrays, tensors and lists, tuples and dicts of them,
+    and tensors that require grad, since a cached result would share their autograd graph.
+    '''
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        _update(h, value)
+    except (_Unhashable, TypeError, ValueError, RuntimeError):
+        return None
+    return h.digest()
+
+def _put(h, data):
+    # Every chunk is prefixed with its length, so different values can't hash the same by splitting the bytes
+    # differently, like ['abstr', ''] and ['ab', 'str'].
+    data = memoryview(data).cast('B')
+    h.update(len(data).to_bytes(8, 'little'))
+    h.update(data)
+
+def _update(h, value: Any):
+    _put(h, type(value).__name__.encode())
+    if value is None or isinstance(value, (bool, int, float, complex)):
+        _put(h, repr(value).encode())
+    elif isinstance(value, str):
+        _put(h, value.encode())
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        _put(h, value)
+    elif isinstance(value, (list, tuple)):
+        _put(h, str(len(value)).encode())
+        for item in value:
+            _update(h, item)
+    elif isinstance(value, dict):
+        _put(h, str(len(value)).encode())
+        for k, v in value.items():
+            _update(h, k)
+            _update(h, v)
+    elif HAS_NUMPY and isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise _Unhashable()
+        _put(h, f'{value.dtype.str}{value.shape}'.encode())
+        _put(h, np.ascontiguousarray(value).data) # no copy if already contiguous
+    elif HAS_NUMPY and isinstance(value, np.generic):
+        _put(h, value.dtype.str.encode())
+        _put(h, value.tobytes())
+    elif HAS_TORCH and isinstance(value, torch.Tensor):
+        if value.requires_grad:
+            raise _Unhashable()
+        _put(h, f'{value.dtype}{tuple(value.shape)}{value.device}'.encode())
+        data = value.detach().cpu().contiguous().reshape(-1).view(torch.uint8)
+        _put(h, data.numpy().data)
+    else:
+        raise _Unhashable()
+
+class ResultCache:
+    '''
+    Workspace-level cache of node results, used by FunctionNodes with `cacheable` set. Entries belong to a node and are
+    keyed by the content hash of the inputs. When the estimated size of the entries exceeds `budget` bytes, the least
+    recently used ones are evicted. A budget of None disables the cache.
+    '''
+    def __init__(self, budget: int|None):
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[Hashable, bytes], tuple[Any, int]] = OrderedDict()
+        self._keys_of_owner: dict[Hashable, set[bytes]] = {}
+        self._size = 0
+
+    def is_enabled(self) -> bool:
+        return self.budget is not None
+
+    def get(self, owner: Hashable, key: bytes) -> tuple[bool, Any]:
+        '''
+        Returns whether the result is cached and the result.
+        '''
+        with self._lock:
+            entry = self._entries.get((owner, key))
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end((owner, key))
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, owner: Hashable, key: bytes, result: Any):
+        if self.budget is None:
+            return
+        size = estimate_size(result)
+        if size > self.budget:
+            return
+        with self._lock:
+            self._remove((owner, key))
+            self._entries[(owner, key)] = (result, size)
+            self._keys_of_owner.setdefault(owner, set()).add(key)
+            self._size += size
+            while self._size > self.budget:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, owner: Hashable):
+        '''
+        Remove the results of an owner.
+        '''
+        with self._lock:
+            for key in list(self._keys_of_owner.get(owner, ())):
+                self._remove((owner, key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_of_owner.clear()
+            self._size = 0
+
+    def get_size(self) -> int:
+        return self._size
+
+    def _remove(self, entry_key: tuple[Hashable, bytes]):
+        entry = self._entries.pop(entry_key, None)
+        if entry is None:
+            return
+        self._size -= entry[1]
+        owner, key = entry_key
+        keys = self._keys_of_owner[owner]
+        keys.discard(key)
+        if len(keys) == 0:
+            del self._keys_of_owner[owner]
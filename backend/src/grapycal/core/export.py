@@ -0,0 +1,527 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import ast
+import keyword
+import os
+from typing import TYPE_CHECKING, Any
+
+import grapycal
+from grapycal.core.topological import CycleError, topological_order
+from grapycal.sobjects.controls.control import Control
+from grapycal.sobjects.controls.nullControl import NullControl
+from grapycal.sobjects.functionNode import FunctionNode
+from grapycal.sobjects.node import Node
+from grapycal.sobjects.port import InputPort, OutputPort
+from grapycal.sobjects.sourceNode import SourceNode
+from objectsync import Topic
+
+if TYPE_CHECKING:
+    from grapycal.sobjects.editor import Editor
+
+class ExportError(Exception):
+    pass
+
+# Attributes every node has for the UI. They are left out of the node state in the exported module.
+_UI_ATTRIBUTES = {
+    'shape', 'output', 'label', 'label_offset', 'translation', 'is_preview', 'category_', 'exposed_attributes',
+    'globally_exposed_attributes', 'css_classes', 'icon_path', 'type_topic', 'in_ports', 'out_ports', 'controls',
+}
+
+# Included in every exported module. It lets node methods run on bare node instances, outside a workspace.
+_RUNTIME = """
+import ast as _ast
+import os as _os
+
+class _Value:
+    '''The value of a topic or a control of a node at export time.'''
+    def __init__(self, value, **children):
+        self._value = value
+        self.__dict__.update(children)
+
+    def get(self):
+        return self._value
+
+    def get_value(self):
+        return self._value
+
+    def value_ready(self):
+        return True
+
+    def __iter__(self):
+        return iter(self._value)
+
+    def __len__(self):
+        return len(self._value)
+
+    def __getitem__(self, key):
+        return self._value[key]
+
+class _Workspace:
+    def vars(self):
+        return globals()
+
+_workspace = _Workspace()
+
+def _node(cls, node_id, state):
+    '''Create a node without building it. The state replaces its topics and controls.'''
+    node = cls.__new__(cls)
+    node.__dict__.update(state)
+    node.workspace = _workspace
+    node._tasks = [] # run by _run_node() in order, so a task scheduling the next one doesn't recurse
+    node.run = lambda task, *args, **kwargs: node._tasks.append(task)
+    node.print = print
+    node.flash_running_indicator = lambda: None
+    node.set_running = lambda running: None
+    node.is_destroyed = lambda: False
+    node.get_id = lambda: node_id
+    def print_exception(e, truncate=0):
+        raise e
+    node.print_exception = print_exception
+    return node
+
+def _module_node(cls, node_id, state, mode):
+    node = _node(cls, node_id, state)
+    node.module = node.create_module()
+    if node_id in _WEIGHTS:
+        node.module.load_state_dict(_WEIGHTS[node_id])
+    node.on_mode_changed(mode)
+    return node
+
+def _load_weights(file_name):
+    path = _os.path.join(_os.path.dirname(_os.path.abspath(__file__)), file_name)
+    if not _os.path.exists(path):
+        return {}
+    import torch
+    return torch.load(path)
+
+def _exec(script, vars, print_last_expr):
+    '''Like exec(), but evaluates a trailing expression and returns it, as ExecNode does.'''
+    stmts = _ast.parse(script).body
+    if len(stmts) == 0 or not isinstance(stmts[-1], _ast.Expr):
+        exec(script, vars)
+        return None
+    exec(compile(_ast.Module(body=stmts[:-1], type_ignores=[]), '<exec>', 'exec'), vars)
+    last = eval(compile(_ast.Expression(body=stmts[-1].value), '<exec>', 'eval'), vars)
+    if last is not None and print_last_expr:
+        print(last)
+    return last
+
+class _Edge:
+    def __init__(self, value):
+        self._value = value
+
+    def get_data(self):
+        return self._value
+
+    def peek_data(self):
+        return self._value
+
+    def is_data_ready(self):
+        return True
+
+_NO_DEFAULT = object()
+
+class _InputPort:
+    def __init__(self, name, values, default=_NO_DEFAULT):
+        self.name = _Value(name)
+        self.edges = [_Edge(value) for value in values]
+        self.use_default = len(values) == 0 and default is not _NO_DEFAULT
+        self._default = default
+
+    def get_name(self):
+        return self.name.get()
+
+    def is_all_edge_ready(self):
+        return self.use_default or len(self.edges) > 0
+
+    def get_data(self):
+        return [self._default] if self.use_default else [edge.get_data() for edge in self.edges]
+
+    def get_one_data(self, allow_no_data=False):
+        if self.use_default:
+            return self._default
+        if len(self.edges) == 0 and allow_no_data:
+            return None
+        return self.edges[0].get_data()
+
+class _OutputPort:
+    def __init__(self, node, name, connected, pushed):
+        self.name = _Value(name)
+        self.edges = [self] if connected else [] # so nodes pushing to each edge push to the port once
+        self._node = node
+        self._pushed = pushed
+
+    def get_name(self):
+        return self.name.get()
+
+    def push_data(self, data=None, label=None, retain=False):
+        name = self.name.get()
+        if name in self._pushed:
+            raise RuntimeError(
+                f'{type(self._node).__name__} {self._node.get_id()} pushed to {name} more than once. '
+                'The exported module runs each node once per call.'
+            )
+        self._pushed[name] = data
+
+class _Pushed(dict):
+    def __init__(self, node):
+        super().__init__()
+        self._node = node
+
+    def __missing__(self, name):
+        raise RuntimeError(f'{type(self._node).__name__} {self._node.get_id()} did not push to {name}')
+
+def _run_node(node, inputs, defaults, outputs, port_attributes, activate, is_source):
+    '''
+    Run a node the way the workspace would, with ports that hold the input values and record what is pushed.
+    Returns the pushed values by output port name.
+    '''
+    pushed = _Pushed(node)
+    in_ports = {}
+    for name, values in inputs.items():
+        if name in defaults:
+            in_ports[name] = _InputPort(name, values, defaults[name])
+        else:
+            in_ports[name] = _InputPort(name, values)
+    out_ports = {name: _OutputPort(node, name, connected, pushed) for name, connected in outputs.items()}
+    node.in_ports = list(in_ports.values())
+    node.out_ports = list(out_ports.values())
+    for attribute, (is_input, name) in port_attributes.items():
+        setattr(node, attribute, in_ports[name] if is_input else out_ports[name])
+    if activate is not None:
+        port = in_ports[activate]
+        node.edge_activated(port.edges[-1], port)
+    if is_source:
+        node._tasks.append(node.task)
+    while len(node._tasks) > 0:
+        ret = node._tasks.pop(0)()
+        if ret is not None: # a generator task, which the runner would advance step by step
+            for _ in ret:
+                pass
+    return pushed
+"""
+
+def generate_module(editor: 'Editor', nodes: list[Node] | None = None, weights_file: str = 'weights.pt') -> tuple[str, dict[str, dict]]:
+    '''
+    Generate the source of a Python module that does what the nodes of the editor do, without a workspace. The module
+    has a function run(inputs), which runs each node once in topological order and returns a dict of output values.
+
+    How a node runs depends on its type:
+
+    - FunctionNodes: calculate() is called with the values of the upstream nodes.
+    - LambdaNodes: the expressions become lambdas of the module.
+    - ExecNodes: the statements are executed in the module's namespace.
+    - torch SimpleModuleNodes: create_module() is called when the module is imported, and forward() in run().
+    - Other nodes fall back to a mini-runtime included in the module, which gives the node stand-in ports and calls
+      edge_activated(), and task() for SourceNodes. It fails if the node pushes more than once to a port.
+
+    The node classes are imported from their extensions, and topics and controls are replaced with their current
+    values. The workspace namespace is the module's namespace.
+
+    If `nodes` is given, only they are exported. Values of the edges from other nodes become the inputs of run(),
+    keyed by ``<node id>.<port name>`` of the tail. The outputs of run() are the output ports with edges to other
+    nodes and the output ports with no edges, keyed the same way.
+
+    Returns the source and the state dicts of torch modules, keyed by node id, to be saved to `weights_file` next to
+    the module. Raises ExportError if the graph has a cycle or an input port that can never get data.
+    '''
+    if nodes is None:
+        nodes = editor.top_down_search(type=Node)
+    try:
+        order = topological_order(nodes)
+    except CycleError as e:
+        raise ExportError(str(e)) from e
+    return _ModuleWriter(order, weights_file).write()
+
+def export_module(editor: 'Editor', path: str, nodes: list[Node] | None = None):
+    '''
+    Write the module generated by generate_module() to `path`, and the weights of torch modules, if any, to a
+    ``.pt`` file with the same name.
+    '''
+    weights_file = os.path.splitext(os.path.basename(path))[0] + '.pt'
+    source, weights = generate_module(editor, nodes, weights_file)
+    with open(path, 'w') as f:
+        f.write(source)
+    if len(weights) > 0:
+        import torch
+        torch.save(weights, os.path.join(os.path.dirname(os.path.abspath(path)), weights_file))
+    logger.info(f'Exported {len(nodes) if nodes is not None else "all"} nodes to {path}.')
+
+def export_workspace(path: str, out_path: str) -> int:
+    '''
+    Load a workspace file without a server and export its main editor with export_module(). Returns the exit code:
+    0 on success, 1 if the graph can't be exported, 2 if the workspace is not found.
+    '''
+    from grapycal.core.workspace import Workspace
+    from grapycal.utils.io import file_exists
+    if not file_exists(path):
+        logger.error(f'No workspace file found at {path}.')
+        return 2
+
+    workspace = Workspace(0, 'localhost', path, 0, headless=True)
+    result = {'exit_code': 0}
+
+    def export():
+        try:
+            export_module(workspace.get_workspace_object().main_editor, out_path)
+        except ExportError as e:
+            logger.error(f'Cannot export {path}: {e}')
+            result['exit_code'] = 1
+        workspace.background_runner.exit(interrupt=False)
+
+    workspace.background_runner.push(export, priority='interactive')
+    workspace.run()
+    return result['exit_code']
+
+def _literal(value: Any) -> str | None:
+    '''
+    Returns the source of the value if it's a literal that evaluates back to an equal value, otherwise None.
+    '''
+    source = repr(value)
+    try:
+        if ast.literal_eval(source) == value:
+            return source
+    except Exception: # not a literal, or values that don't compare to bool, like arrays
+        pass
+    return None
+
+def _is_type(node: Node, class_name: str, extension: str) -> bool:
+    # Extension node types are recognized by name so that core doesn't import the extensions
+    return any(cls.__name__ == class_name and cls.__module__.split('.')[0] == extension for cls in type(node).__mro__)
+
+def _is_plain_function_node(node: Node) -> bool:
+    cls = type(node)
+    return (
+        isinstance(node, FunctionNode)
+        and cls.task is FunctionNode.task
+        and cls.edge_activated is FunctionNode.edge_activated
+    )
+
+def _kwargs(args: dict[str, str]) -> str:
+    items = []
+    for name, value in args.items():
+        if name.isidentifier() and not keyword.iskeyword(name):
+            items.append(f'{name}={value}')
+        else:
+            items.append(f'**{{{name!r}: {value}}}')
+    return ', '.join(items)
+
+class _ModuleWriter:
+    def __init__(self, order: list[Node], weights_file: str):
+        self.order = order
+        self.weights_file = weights_file
+        self.members = set(order)
+        self.index = {node: i for i, node in enumerate(order)}
+        self.class_names: dict[type, str] = {}
+        self.imports: list[str] = []
+        self.setup: list[str] = [] # module-level lines after the imports
+        self.body: list[str] = [] # lines of run()
+        self.values: dict[OutputPort, str] = {} # the expression of each output port's value in run()
+        self.inputs: dict[str, str] = {} # input key -> description
+        self.outputs: dict[str, str] = {} # output key -> expression
+        self.weights: dict[str, dict] = {}
+
+    def write(self) -> tuple[str, dict[str, dict]]:
+        for node in self.order:
+            i = self.index[node]
+            self.body.append(f'    # {node.get_type_name()} {node.get_id()}')
+            if _is_type(node, 'LambdaNode', 'grapycal_builtin'):
+                self._write_lambda(node, i)
+            elif _is_type(node, 'ExecNode', 'grapycal_builtin'):
+                self._write_exec(node, i)
+            elif _is_type(node, 'SimpleModuleNode', 'grapycal_torch'):
+                self._write_module(node, i)
+            elif _is_plain_function_node(node):
+                self._write_function(node, i) # type: ignore
+            else:
+                self._write_fallback(node, i)
+
+        for node in self.order:
+            for port in node.out_ports:
+                if port not in self.values:
+                    continue
+                if len(port.edges) == 0 or any(edge.get_head().node not in self.members for edge in port.edges):
+                    self.outputs[self._key(port)] = self.values[port]
+        return self._assemble(), self.weights
+
+    def _key(self, port: OutputPort) -> str:
+        return f'{port.node.get_id()}.{port.get_name()}'
+
+    def _class_name(self, cls: type) -> str:
+        if cls not in self.class_names:
+            name = cls.__name__
+            if name in self.class_names.values():
+                name = f'{name}_{len(self.class_names)}'
+            self.class_names[cls] = name
+            alias = '' if name == cls.__name__ else f' as {name}'
+            self.imports.append(f'from {cls.__module__} import {cls.__name__}{alias}')
+        return self.class_names[cls]
+
+    def _describe(self, node: Node) -> str:
+        return f'{node.get_type_name()} {node.get_id()}'
+
+    def _edge_values(self, port: InputPort) -> list[str]:
+        values = []
+        for edge in port.edges:
+            tail = edge.get_tail()
+            if tail.node in self.members:
+                values.append(self.values[tail])
+            else:
+                key = self._key(tail)
+                self.inputs[key] = self._describe(tail.node)
+                values.append(f'inputs[{key!r}]')
+        return values
+
+    def _require_edges(self, node: Node, port: InputPort):
+        if len(port.edges) == 0:
+            raise ExportError(f'{self._describe(node)} can never run because its input {port.get_name()} has no edges')
+
+    def _state(self, node: Node) -> str:
+        items = []
+        for attribute, value in vars(node).items():
+            if attribute.startswith('_') or attribute in _UI_ATTRIBUTES:
+                continue
+            if isinstance(value, Topic):
+                source = _literal(value.get())
+                if source is not None:
+                    items.append(f'{attribute!r}: _Value({source})')
+            elif isinstance(value, Control):
+                items.append(f'{attribute!r}: {self._control_state(value)}')
+        return '{' + ', '.join(items) + '}'
+
+    def _control_state(self, control: Control) -> str:
+        args = []
+        value = None
+        for method in ('get', 'get_value'):
+            if hasattr(control, method):
+                try:
+                    value = getattr(control, method)()
+                except Exception:
+                    continue
+                break
+        args.append(_literal(value) or 'None')
+        for attribute, topic in vars(control).items():
+            if attribute.startswith('_') or not isinstance(topic, Topic) or not attribute.isidentifier():
+                continue
+            source = _literal(topic.get())
+            if source is not None:
+                args.append(f'{attribute}=_Value({source})')
+        return f'_Value({", ".join(args)})'
+
+    def _write_function(self, node: FunctionNode, i: int):
+        self.setup.append(f'_n{i} = _node({self._class_name(type(node))}, {node.get_id()!r}, {self._state(node)})')
+        args = {}
+        for port in node._get_func_ins():
+            self._require_edges(node, port)
+            values = self._edge_values(port)
+            args[port.get_name()] = values[0] if port.max_edges.get() == 1 else f'[{", ".join(values)}]'
+        self.body.append(f'    v{i} = _n{i}.calculate({_kwargs(args)})')
+        outs = node._get_func_outs()
+        if len(outs) == 1:
+            self.values[outs[0]] = f'v{i}'
+        else:
+            for port in outs:
+                self.values[port] = f'v{i}[{port.get_name()!r}]'
+
+    def _write_lambda(self, node: Node, i: int):
+        args = [str(arg) for arg in node.input_args] # type: ignore
+        values = []
+        for arg in args:
+            port = node.get_in_port(arg)
+            self._require_edges(node, port)
+            values.append(self._edge_values(port)[0])
+        for k, (name, control) in enumerate(node.text_controls.get().items()): # type: ignore
+            expr = control.text.get()
+            try:
+                ast.parse(expr, mode='eval')
+            except SyntaxError as e:
+                raise ExportError(f'{self._describe(node)} has an invalid expression for {name}: {e}') from e
+            self.setup.append(f'_lambda{i}_{k} = lambda {", ".join(args)}: (\n    {expr}\n)')
+            self.body.append(f'    v{i}_{k} = _lambda{i}_{k}({", ".join(values)})')
+            self.values[node.get_out_port(name)] = f'v{i}_{k}'
+
+    def _write_exec(self, node: Node, i: int):
+        self.setup.append(f'_exec{i} = {node.text_control.text.get()!r}') # type: ignore
+        updates = []
+        for name in node.inputs: # type: ignore
+            port = node.get_in_port(name)
+            if len(port.edges) > 0:
+                updates.append(f'{name!r}: {self._edge_values(port)[0]}')
+        if len(updates) > 0:
+            self.body.append(f'    globals().update({{{", ".join(updates)}}})')
+        print_last_expr = node.print_last_expr.get() == 'yes' # type: ignore
+        self.body.append(f'    v{i} = _exec(_exec{i}, globals(), {print_last_expr})')
+        self.values[node.out_port] = f'v{i}' # type: ignore
+        for k, name in enumerate(node.outputs): # type: ignore
+            self.body.append(f'    v{i}_{k} = globals()[{name!r}]')
+            self.values[node.get_out_port(name)] = f'v{i}_{k}'
+
+    def _write_module(self, node: Node, i: int):
+        node_id = node.get_id()
+        mode = node.mode.get() # type: ignore
+        self.setup.append(f'_n{i} = _module_node({self._class_name(type(node))}, {node_id!r}, {self._state(node)}, {mode!r})')
+        if node.module is not None: # type: ignore
+            self.weights[node_id] = {k: v.detach().cpu() for k, v in node.module.state_dict().items()} # type: ignore
+        args = {}
+        for port in node.in_ports:
+            self._require_edges(node, port)
+            args[port.get_name()] = self._edge_values(port)[0]
+        self.body.append(f'    v{i} = _n{i}.forward({_kwargs(args)})')
+        if len(node.out_ports) == 1:
+            self.values[node.out_ports[0]] = f'v{i}'
+        else:
+            for k, port in enumerate(node.out_ports):
+                self.values[port] = f'v{i}[{k}]'
+
+    def _write_fallback(self, node: Node, i: int):
+        self.setup.append(f'_n{i} = _node({self._class_name(type(node))}, {node.get_id()!r}, {self._state(node)})')
+        run_port = node.run_port if isinstance(node, SourceNode) else None
+        inputs = []
+        defaults = []
+        activate = None
+        for port in node.in_ports:
+            values = self._edge_values(port)
+            inputs.append(f'{port.get_name()!r}: [{", ".join(values)}]')
+            if len(port.edges) == 0 and not isinstance(port.default_control, NullControl):
+                source = _literal(port.default_control.get_value()) # type: ignore
+                if source is None:
+                    raise ExportError(f'{self._describe(node)} has a default value for {port.get_name()} that cannot be exported')
+                defaults.append(f'{port.get_name()!r}: {source}')
+            if len(port.edges) > 0 and port is not run_port:
+                activate = port.get_name()
+        outputs = [f'{port.get_name()!r}: {len(port.edges) > 0}' for port in node.out_ports]
+        port_attributes = []
+        for attribute, value in vars(node).items():
+            if isinstance(value, (InputPort, OutputPort)) and value.node is node:
+                port_attributes.append(f'{attribute!r}: ({isinstance(value, InputPort)}, {value.get_name()!r})')
+
+        self.body.append(
+            f'    o{i} = _run_node(_n{i}, {{{", ".join(inputs)}}}, {{{", ".join(defaults)}}}, '
+            f'{{{", ".join(outputs)}}}, {{{", ".join(port_attributes)}}}, {activate!r}, {run_port is not None})'
+        )
+        for port in node.out_ports:
+            self.values[port] = f'o{i}[{port.get_name()!r}]'
+
+    def _assemble(self) -> str:
+        lines = [
+            "'''",
+            f'Exported from a Grapycal workspace by Grapycal {grapycal.__version__}.',
+            '',
+            'Call run() with a dict of the inputs below. It returns a dict of the outputs below.',
+            '',
+            'Inputs:',
+        ]
+        lines += [f'    {key}: from {description}' for key, description in self.inputs.items()] or ['    (none)']
+        lines += ['', 'Outputs:']
+        lines += [f'    {key}' for key in self.outputs] or ['    (none)']
+        lines += ["'''", _RUNTIME.strip(), '']
+        lines += self.imports
+        lines += ['', f'_WEIGHTS = _load_weights({self.weights_file!r})' if len(self.weights) > 0 else '_WEIGHTS = {}', '']
+        lines += self.setup
+        lines += ['', 'def run(inputs=None):', '    inputs = inputs or {}']
+        lines += self.body
+        lines += ['    return {']
+        lines += [f'        {key!r}: {value},' for key, value in self.outputs.items()]
+        lines += ['    }', '']
+        return '\n'.join(lines)
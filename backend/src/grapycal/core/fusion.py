@@ -0,0 +1,138 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import keyword
+from typing import TYPE_CHECKING, Any, Callable
+
+from grapycal.core.background_runner import TaskCancelled
+
+if TYPE_CHECKING:
+    from grapycal.sobjects.edge import Edge
+    from grapycal.sobjects.functionNode import FunctionNode
+
+class FusedNodeError(Exception):
+    '''
+    Raised by a fused region when the calculation of one of its nodes fails. The original exception is the cause.
+    '''
+    def __init__(self, index: int):
+        super().__init__(index)
+        self.index = index
+
+class FusedRegion:
+    '''
+    A run of pure FunctionNodes starting at `head`, compiled into one Python function that passes values between the
+    nodes directly. Only the edges leaving the region are pushed to, so the per-hop costs of Edge.push_data (locking,
+    running indicators, labels), port activation and scheduling a task are paid once per region instead of per node.
+
+    A node downstream of the head joins the region if it is a plain pure FunctionNode and all of its inputs come from
+    nodes already in the region, so the region is a DAG whose only entry is the head.
+    '''
+    def __init__(self, nodes: list['FunctionNode'], function: Callable[[dict[str, Any]], tuple], source: str):
+        self.nodes = nodes
+        self.source = source
+        self._function = function
+        # (index of the node, edges leaving the region from its output)
+        self._boundary: list[tuple[int, list['Edge']]] = []
+        members = set(nodes)
+        for i, node in enumerate(nodes):
+            edges = [edge for edge in node._get_func_outs()[0].edges if edge.get_head().node not in members]
+            if len(edges) > 0:
+                self._boundary.append((i, edges))
+
+    def run(self, inputs: dict[str, Any]):
+        '''
+        Run the region with the inputs of the head and push the results to the boundary edges. If a node fails,
+        the exception is printed to that node and nothing is pushed.
+        '''
+        try:
+            values = self._function(inputs)
+        except FusedNodeError as e:
+            node = self.nodes[e.index]
+            if node is self.nodes[0] or isinstance(e.__cause__, TaskCancelled):
+                raise e.__cause__ # type: ignore # the head reports its own errors as usual
+            node.stats.record_exception()
+            node.print_exception(e.__cause__)
+            return
+        for i, edges in self._boundary:
+            value = values[i]
+            for edge in edges:
+                edge.push_data(value)
+
+def is_fusible(node) -> bool:
+    from grapycal.sobjects.functionNode import FunctionNode
+    cls = type(node)
+    return (
+        isinstance(node, FunctionNode)
+        and node.pure
+        and not node.use_process_pool
+        and node._plan is None
+        and not node.cacheable
+        and cls.task is FunctionNode.task
+        and cls.edge_activated is FunctionNode.edge_activated
+        and len(node._get_func_outs()) == 1
+        and all(len(port.edges) > 0 for port in node._get_func_ins())
+        and not node.is_destroyed()
+    )
+
+def build_region(head: 'FunctionNode') -> FusedRegion|None:
+    '''
+    Find the region of fusible nodes starting at head and compile it. Returns None if no other node can join.
+    '''
+    if not is_fusible(head):
+        return None
+    nodes = [head]
+    index = {head: 0}
+    candidates = [edge.get_head().node for edge in head._get_func_outs()[0].edges]
+    while candidates:
+        node = candidates.pop()
+        if node in index or not is_fusible(node):
+            continue
+        if not _all_inputs_from(node, index):
+            continue # may join later, when the rest of its inputs have joined
+        index[node] = len(nodes)
+        nodes.append(node)
+        candidates.extend(edge.get_head().node for edge in node._get_func_outs()[0].edges)
+    if len(nodes) == 1:
+        return None
+    source = _generate_source(nodes, index)
+    namespace: dict[str, Any] = {'FusedNodeError': FusedNodeError}
+    for i, node in enumerate(nodes):
+        namespace[f'calc_{i}'] = node.calculate
+    exec(compile(source, f'<fused region of {head.get_id()}>', 'exec'), namespace)
+    logger.debug(f'Fused {len(nodes)} nodes starting at {head.get_id()}')
+    return FusedRegion(nodes, namespace['fused'], source)
+
+def _all_inputs_from(node: 'FunctionNode', index: dict) -> bool:
+    for port in node._get_func_ins():
+        for edge in port.edges:
+            tail = edge.get_tail()
+            if tail.node not in index or tail is not tail.node._get_func_outs()[0]:
+                return False
+    return True
+
+def _generate_source(nodes: list['FunctionNode'], index: dict) -> str:
+    calcs = ', '.join(f'calc_{i}=calc_{i}' for i in range(len(nodes)))
+    lines = [
+        f'def fused(inputs, {calcs}):',
+        '    step = 0',
+        '    try:',
+        '        v0 = calc_0(**inputs)',
+    ]
+    for i, node in enumerate(nodes[1:], 1):
+        args = []
+        for port in node._get_func_ins():
+            sources = [f'v{index[edge.get_tail().node]}' for edge in port.edges]
+            value = sources[0] if port.max_edges.get() == 1 else f'[{", ".join(sources)}]'
+            name = port.get_name()
+            if name.isidentifier() and not keyword.iskeyword(name):
+                args.append(f'{name}={value}')
+            else:
+                args.append(f'**{{{name!r}: {value}}}')
+        lines.append(f'        step = {i}')
+        lines.append(f'        v{i} = calc_{i}({", ".join(args)})')
+    lines += [
+        '    except Exception as e:',
+        '        raise FusedNodeError(step) from e',
+        f'    return ({", ".join(f"v{i}" for i in range(len(nodes)))},)',
+    ]
+    return '\n'.join(lines) + '\n'
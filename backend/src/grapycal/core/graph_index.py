@@ -0,0 +1,155 @@
+from typing import TYPE_CHECKING, Iterable
+
+from grapycal.core.topological import topological_order
+
+if TYPE_CHECKING:
+    from grapycal.sobjects.edge import Edge
+    from grapycal.sobjects.editor import Editor
+    from grapycal.sobjects.node import Node
+
+class GraphIndex:
+    '''
+    The connections between the nodes of an editor, kept up to date by the ports as edges are added and removed, so
+    graph queries don't walk ports and edges every time.
+
+    Adding or removing an edge updates the adjacency in O(1). The results of downstream(), upstream() and
+    topological_order() are memoized until the editor's graph_version changes.
+    '''
+    def __init__(self, editor: 'Editor'):
+        self.editor = editor
+        # successors[a][b] is the number of edges from a to b. Nodes without edges have no entry.
+        self._successors: dict['Node', dict['Node', int]] = {}
+        self._predecessors: dict['Node', dict['Node', int]] = {}
+        self._edges: dict['Node', set['Edge']] = {}
+        self._memo_version = -1
+        self._downstream: dict['Node', frozenset['Node']] = {}
+        self._upstream: dict['Node', frozenset['Node']] = {}
+        self._order: list['Node'] | None = None
+
+    def add(self, edge: 'Edge'):
+        '''
+        Called by a port when the edge gets its second end.
+        '''
+        tail, head = self._ends(edge)
+        if edge in self._edges.get(tail, ()):
+            return
+        self._edges.setdefault(tail, set()).add(edge)
+        self._edges.setdefault(head, set()).add(edge)
+        successors = self._successors.setdefault(tail, {})
+        successors[head] = successors.get(head, 0) + 1
+        predecessors = self._predecessors.setdefault(head, {})
+        predecessors[tail] = predecessors.get(tail, 0) + 1
+
+    def remove(self, edge: 'Edge'):
+        '''
+        Called by a port when the edge loses one of its ends.
+        '''
+        tail, head = self._ends(edge)
+        if edge not in self._edges.get(tail, ()):
+            return
+        self._discard(self._edges, tail, edge)
+        self._discard(self._edges, head, edge)
+        self._decrement(self._successors, tail, head)
+        self._decrement(self._predecessors, head, tail)
+
+    def edges_of(self, node: 'Node') -> set['Edge']:
+        '''
+        The edges connected to the node.
+        '''
+        return set(self._edges.get(node, ()))
+
+    def successors(self, node: 'Node') -> list['Node']:
+        '''
+        The nodes that receive data from the node through an edge.
+        '''
+        return list(self._successors.get(node, ()))
+
+    def predecessors(self, node: 'Node') -> list['Node']:
+        '''
+        The nodes that send data to the node through an edge.
+        '''
+        return list(self._predecessors.get(node, ()))
+
+    def downstream(self, node: 'Node') -> frozenset['Node']:
+        '''
+        The nodes reachable from the node by following edges. The node itself is included only if it is on a cycle.
+        '''
+        self._check_version()
+        if node not in self._downstream:
+            self._downstream[node] = self._reach(node, self._successors)
+        return self._downstream[node]
+
+    def upstream(self, node: 'Node') -> frozenset['Node']:
+        '''
+        The nodes the node is reachable from. The node itself is included only if it is on a cycle.
+        '''
+        self._check_version()
+        if node not in self._upstream:
+            self._upstream[node] = self._reach(node, self._predecessors)
+        return self._upstream[node]
+
+    def reachable_between(self, a: 'Node', b: 'Node') -> set['Node']:
+        '''
+        The nodes on the paths from a to b, including a and b. Empty if b is not reachable from a.
+        '''
+        if a is b:
+            return {a}
+        downstream = self.downstream(a)
+        if b not in downstream:
+            return set()
+        return (downstream & self.upstream(b)) | {a, b}
+
+    def topological_order(self, nodes: Iterable['Node'] | None = None) -> list['Node']:
+        '''
+        Sort the nodes, all nodes of the editor by default, so every node comes after the nodes it receives data
+        from. Only edges between the given nodes are considered. Raises CycleError if there is a cycle.
+        '''
+        from grapycal.sobjects.node import Node # avoid circular import
+
+        if nodes is None:
+            self._check_version()
+            if self._order is None:
+                self._order = topological_order(self.editor.get_children_of_type(Node), self.successors)
+            return list(self._order)
+        return topological_order(nodes, self.successors)
+
+    def _check_version(self):
+        # Invalidation only drops the memos, so editing the graph stays O(1)
+        if self._memo_version != self.editor.graph_version:
+            self._memo_version = self.editor.graph_version
+            self._downstream = {}
+            self._upstream = {}
+            self._order = None
+
+    @staticmethod
+    def _reach(node: 'Node', adjacency: dict['Node', dict['Node', int]]) -> frozenset['Node']:
+        reached = set()
+        stack = [node]
+        while stack:
+            for neighbor in adjacency.get(stack.pop(), ()):
+                if neighbor not in reached:
+                    reached.add(neighbor)
+                    stack.append(neighbor)
+        return frozenset(reached)
+
+    @staticmethod
+    def _ends(edge: 'Edge') -> tuple['Node', 'Node']:
+        state = edge._state
+        assert state.tail is not None and state.head is not None
+        return state.tail.port.node, state.head.port.node # type: ignore
+
+    @staticmethod
+    def _discard(index: dict, key, value):
+        values = index[key]
+        values.discard(value)
+        if len(values) == 0:
+            del index[key]
+
+    @staticmethod
+    def _decrement(adjacency: dict['Node', dict['Node', int]], a: 'Node', b: 'Node'):
+        counts = adjacency[a]
+        counts[b] -= 1
+        if counts[b] == 0:
+            del counts[b]
+            if len(counts) == 0:
+                del adjacency[a]
@@ -0,0 +1,131 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import json
+import threading
+import time
+
+from grapycal.core.memory import MemoryPolicy
+from grapycal.core.workspace import Workspace
+from grapycal.sobjects.editor import Editor
+from grapycal.sobjects.node import Node
+from grapycal.sobjects.sourceNode import SourceNode
+from grapycal.utils.io import file_exists
+
+def find_sources(editor: Editor, names: list[str] | None) -> list[Node]:
+    '''
+    Find the nodes to trigger. Each name can be a node id, a node type (``grapycal_builtin.ForNode``) or a node type
+    without the extension name (``ForNode``). Without names, the SourceNodes whose run port has no edges are used.
+    Raises ValueError if a name matches no node.
+    '''
+    nodes = editor.top_down_search(type=Node)
+    if names is None:
+        return [node for node in nodes if isinstance(node, SourceNode) and len(node.run_port.edges) == 0]
+    sources = []
+    for name in names:
+        matches = [
+            node for node in nodes
+            if name in (node.get_id(), node.get_type_name(), node.get_type_name().split('.')[-1])
+        ]
+        if len(matches) == 0:
+            raise ValueError(f'No node matches {name}')
+        sources += [node for node in matches if node not in sources]
+    return sources
+
+def run_headless(
+    path: str,
+    sources: list[str] | None = None,
+    workers: int = 1,
+    max_pending: int = 10000,
+    memory_budget: int = 0,
+    memory_policy: MemoryPolicy = 'warn',
+    cache_budget: int = 256,
+    idle_grace: float = 0.5,
+    stats_path: str | None = None,
+) -> int:
+    '''
+    Run a workspace file without a server or clients, for batch jobs. The workspace is loaded, the source nodes are
+    triggered as if double clicked, in the given order, and the runner runs until it has been idle for `idle_grace`
+    seconds. Then the runtime and the stats of each node are printed, and written as JSON to `stats_path` if given.
+    The workspace file is not modified.
+
+    Returns the exit code: 0 on success, 1 if a node raised an exception, 2 if the workspace or a source is not found.
+    '''
+    if not file_exists(path):
+        logger.error(f'No workspace file found at {path}.')
+        return 2
+
+    workspace = Workspace(0, 'localhost', path, 0, workers, max_pending, memory_budget, memory_policy, cache_budget, headless=True)
+    if stats_path is not None: # the bytes output by each node are written to it
+        workspace.measure_sizes = True
+    runner = workspace.background_runner
+    result = {'exit_code': 0, 'start': 0.0, 'end': 0.0}
+
+    def wait_until_idle():
+        # Nodes may still have work outside the runner, like timers or threads, so the runner must stay idle a while.
+        idle_since = None
+        while True:
+            time.sleep(0.05)
+            if runner.is_idle() and workspace.process_pool.get_num_pending() == 0:
+                if idle_since is None:
+                    idle_since = time.perf_counter()
+                elif time.perf_counter() - idle_since >= idle_grace:
+                    break
+            else:
+                idle_since = None
+        result['end'] = idle_since
+        runner.exit(interrupt=False)
+
+    def trigger_sources():
+        try:
+            nodes = find_sources(workspace.get_workspace_object().main_editor, sources)
+        except ValueError as e:
+            logger.error(str(e))
+            result['exit_code'] = 2
+            runner.exit(interrupt=False)
+            return
+        logger.info(f'Triggering {", ".join(f"{node.get_type_name()} {node.get_id()}" for node in nodes)}')
+        result['start'] = time.perf_counter()
+        for node in nodes:
+            node.double_click()
+        threading.Thread(target=wait_until_idle, daemon=True).start()
+
+    # runs after the workspace is loaded
+    runner.push(trigger_sources, priority='interactive')
+    try:
+        workspace.run()
+    except KeyboardInterrupt:
+        logger.info('Interrupted.')
+        return 130
+    if result['exit_code'] != 0:
+        return result['exit_code']
+
+    runtime = result['end'] - result['start']
+    stats = {node_id: node_stats.to_dict() for node_id, node_stats in workspace._node_stats.items()}
+    print_report(runtime, stats)
+    if stats_path is not None:
+        with open(stats_path, 'w') as f:
+            json.dump({'runtime': runtime, 'nodes': stats}, f, indent=2)
+
+    if any(entry['exceptions'] > 0 for entry in stats.values()):
+        return 1
+    return 0
+
+def print_report(runtime: float, stats: dict[str, dict]):
+    print(f'Finished in {runtime:.3f} s')
+    active = sorted(
+        ((node_id, entry) for node_id, entry in stats.items() if entry['tasks'] > 0),
+        key=lambda item: item[1]['total_time'],
+        reverse=True,
+    )
+    if len(active) == 0:
+        return
+    header = f'{"node":<40} {"tasks":>8} {"total (s)":>10} {"mean (ms)":>10} {"max (ms)":>10} {"errors":>7}'
+    print(header)
+    print('-' * len(header))
+    for node_id, entry in active:
+        name = f'{entry["type"].split(".")[-1]} {node_id}'
+        print(
+            f'{name:<40} {entry["tasks"]:>8} {entry["total_time"]:>10.3f} {entry["mean_time"] * 1000:>10.3f} '
+            f'{entry["max_time"] * 1000:>10.3f} {entry["exceptions"]:>7}'
+        )
@@ -0,0 +1,234 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import queue
+import threading
+from typing import Any, Callable
+
+import objectsync
+from objectsync.sobject import SObject
+from objectsync.topic import WrappedTopic
+from topicsync.change import Change, DictChangeTypes
+
+from grapycal.utils.io import append_workspace_journal, compress_workspace, read_workspace, write_workspace
+
+class WorkspaceJournal:
+    '''
+    Saves a workspace as a base snapshot followed by an append-only journal, so saving costs as much as what changed
+    since the last save instead of as much as the whole workspace.
+
+    The journal tracks which objects changed, were created or were removed, from the changes objectsync sends to the
+    clients. A save appends one entry with those objects, without their children, to the file the last base snapshot
+    was written to, or to the file the workspace was loaded from (see rebase()). Other saves write a new base snapshot:
+    to another file, or after most objects changed. read_workspace() replays the entries.
+
+    The files are written by a thread of the journal, so the caller doesn't wait for compression and the disk. The
+    objects are serialized by the caller though, as they can only be read consistently while no change is made. Every `compact_every`
+    entries, that thread also compacts the file: it reads it, replays the entries and writes a new base snapshot.
+    '''
+    def __init__(self, server: objectsync.Server, compact_every: int = 100):
+        self.compact_every = compact_every
+        self._server = server
+        self._changed: set[str] = set() # ids of objects changed or created since the last save
+        self._removed: set[str] = set() # ids of objects removed since the last save
+        self._path: str|None = None # the file the changes are relative to
+        self._entries = 0 # entries in that file since its base snapshot
+        self._writes: queue.Queue[Callable[[], None]|None] = queue.Queue()
+        self._writer: threading.Thread|None = None
+        self._base: bytes|None = None # a snapshot to replace the file with before appending to it, see rebase()
+        self._enabled = _on_changes(server, self._track)
+        if not self._enabled:
+            logger.warning('Changes to the workspace can\'t be tracked with this version of objectsync. Every save '
+                           'writes the whole workspace.')
+
+    def _track(self, changes: list[Change]):
+        for change in changes:
+            name = change.topic_name
+            if name == '_objects':
+                if isinstance(change, DictChangeTypes.AddChange):
+                    self._changed.add(change.key)
+                elif isinstance(change, DictChangeTypes.PopChange):
+                    self._removed.add(change.key)
+                continue
+            if name == '_topicsync/topic_list': # an attribute added after the object was created
+                if not isinstance(change, DictChangeTypes.AddChange):
+                    continue
+                name = change.key
+            if name.startswith('a/'):
+                self._changed.add(name[2:name.find('/', 2)])
+            elif name.startswith('parent_id/'):
+                self._changed.add(name[10:])
+
+    def can_append(self, path: str) -> bool:
+        '''
+        Whether a save to `path` can be appended as an entry. If most objects changed, a new snapshot is no larger.
+        '''
+        return self._enabled and path == self._path and os.path.exists(path) and \
+            len(self._changed) <= len(self._server.get_objects()) // 2
+
+    def append(self, path: str, workspace: SObject, metadata: dict, data: dict, on_done: Callable[[int], None]):
+        '''
+        Append an entry with the changes since the last save. Must be called in a record, so no change is made
+        while the changed objects are serialized. `on_done` is called with the file size after the file is written.
+        '''
+        assert self.can_append(path)
+        entry = {
+            'metadata': metadata,
+            'data': data,
+            'removed': [id for id in self._removed if not self._server.has_object(id)],
+            'objects': self._serialize_changed(workspace),
+        }
+        self._changed.clear()
+        self._removed.clear()
+        self._entries += 1
+        compact = self._entries >= self.compact_every
+        if compact:
+            self._entries = 0
+
+        def write():
+            if self._base is not None:
+                self._write_bytes(path, self._base)
+                self._base = None
+            size = append_workspace_journal(path, entry)
+            if compact:
+                size = self._compact(path)
+            on_done(size)
+        self._submit(write)
+
+    def write_snapshot(self, path: str, metadata: dict, data: dict, on_done: Callable[[int], None]):
+        '''
+        Write a new base snapshot. `data` holds the serialized workspace, taken in the same record as this call.
+        Later saves to `path` are appended to it as entries.
+        '''
+        self._changed.clear()
+        self._removed.clear()
+        self._path = path
+        self._entries = 0
+        def write():
+            self._base = None
+            on_done(self._write_file(path, metadata, data))
+        self._submit(write)
+
+    def rebase(self, path: str, metadata: dict, data: dict):
+        '''
+        Make later saves to `path`, which the workspace was just loaded from, append to it. Loading doesn't keep the ids
+        of all objects, so the entries can't be relative to the snapshot in the file. `data` holds the workspace
+        serialized after loading instead. It's compressed by the journal's thread, and replaces the file before the
+        first entry is appended, so the file is not modified until then.
+        '''
+        if not self._enabled:
+            return
+        self._changed.clear()
+        self._removed.clear()
+        self._path = path
+        self._entries = 0
+        def compress():
+            self._base = compress_workspace(metadata, data)
+        self._submit(compress)
+
+    def _serialize_changed(self, workspace: SObject) -> list[list[Any]]:
+        objects = []
+        for id in self._changed:
+            if not self._server.has_object(id):
+                continue
+            obj = self._server.get_object(id)
+            depth = _depth_in(obj, workspace)
+            if depth is None: # not saved with the workspace
+                continue
+            parent_id = 'root' if obj is workspace else obj.get_parent().get_id()
+            objects.append((depth, parent_id, obj))
+        # parents first, so a new object's parent already exists when it's replayed
+        objects.sort(key=lambda item: item[0])
+        return [[parent_id, self._serialize_shallow(obj)] for _, parent_id, obj in objects]
+
+    def _serialize_shallow(self, obj: SObject) -> dict[str, Any]:
+        # SObject.serialize() without the children, as they have entries of their own if they changed
+        attributes = []
+        wrapped_topics = []
+        for name, attr in obj._attributes.items():
+            if isinstance(attr, WrappedTopic):
+                value = attr.get_raw()
+                wrapped_topics.append(attr.get_name().split('/')[-1])
+            else:
+                value = attr.get()
+            attributes.append([name, attr.get_type_name(), value, attr.is_stateful(), attr.is_order_strict()])
+        return {
+            'id': obj.get_id(),
+            'type': self._server.get_object_type_name(obj.__class__),
+            'attributes': attributes,
+            'children': {},
+            'user_attribute_references': dict(obj._user_attribute_references),
+            'user_sobject_references': dict(obj._user_sobject_references),
+            'wrapped_topics': wrapped_topics,
+        }
+
+    def _compact(self, path: str) -> int:
+        _, metadata, data = read_workspace(path)
+        size = self._write_file(path, metadata, data)
+        logger.info(f'Compacted the journal of {path}.')
+        return size
+
+    def _write_file(self, path: str, metadata: dict, data: dict) -> int:
+        # write next to the file and then replace it, so a failed save leaves the old file intact
+        temp_path = path + '.tmp'
+        write_workspace(temp_path, metadata, data, compress=True)
+        os.replace(temp_path, path)
+        return os.path.getsize(path)
+
+    def _write_bytes(self, path: str, content: bytes):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+    def _submit(self, write: Callable[[], None]):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name='journal', daemon=True)
+            self._writer.start()
+        self._writes.put(write)
+
+    def _write_loop(self):
+        while True:
+            write = self._writes.get()
+            if write is None:
+                return
+            try:
+                write()
+            except Exception:
+                logger.exception('Failed to save the workspace.')
+
+    def close(self):
+        '''
+        Wait for the pending writes.
+        '''
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+
+def _depth_in(obj: SObject, ancestor: SObject) -> int|None:
+    depth = 0
+    while obj is not ancestor:
+        if obj.is_root():
+            return None
+        obj = obj.get_parent()
+        depth += 1
+    return depth
+
+def _on_changes(server: objectsync.Server, callback: Callable[[list[Change]], None]) -> bool:
+    '''
+    Call `callback` with every change made to the objects. Returns False if that's not possible.
+    '''
+    # objectsync has no hook for every change. Its transition callback misses undo, redo and the topics that are not
+    # stateful, so wrap the callback that the state machine sends the changes to the clients with instead. It's not
+    # public, so check that it's still there.
+    state_machine = getattr(getattr(server, '_topicsync', None), '_state_machine', None)
+    send = getattr(state_machine, '_changes_callback', None)
+    if not callable(send):
+        return False
+    def changes_callback(changes: list[Change], action_id: str):
+        callback(changes)
+        send(changes, action_id)
+    state_machine._changes_callback = changes_callback
+    return True
@@ -0,0 +1,101 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import threading
+from typing import TYPE_CHECKING, Literal
+
+from grapycal.utils.logging import user_logger
+
+if TYPE_CHECKING:
+    from grapycal.sobjects.edge import Edge
+
+MemoryPolicy = Literal['warn', 'evict']
+
+def format_bytes(size: int) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024 # type: ignore
+    return f'{size:.1f} TB'
+
+class MemoryAccountant:
+    '''
+    Keeps track of the estimated bytes of data held by edges (until their head node gets it) and by output ports that
+    retain their data. Sizes are estimated with utils.sizing.estimate_size.
+
+    When the total exceeds `budget`, the ``warn`` policy warns the user once until the total drops below the budget
+    again, and the ``evict`` policy clears the data of the edges that have held it the longest, except the edge that
+    is pushing. Retained data is never evicted because it belongs to the node.
+    '''
+    def __init__(self, budget: int|None = None, policy: MemoryPolicy = 'warn'):
+        self.budget = budget
+        self.policy: MemoryPolicy = policy
+        self._lock = threading.Lock()
+        self._held: dict[object, int] = {} # insertion order is the eviction order
+        self._total = 0
+        self._high_watermark = 0
+        self._warned = False
+
+    def hold(self, holder: object, size: int):
+        '''
+        Record that `holder` now holds `size` bytes, replacing what it held before.
+        '''
+        with self._lock:
+            self._total += size - self._held.pop(holder, 0)
+            self._held[holder] = size
+            if self._total > self._high_watermark:
+                self._high_watermark = self._total
+            if self.budget is None or self._total <= self.budget:
+                self._warned = False
+                return
+            if self.policy == 'evict':
+                victims = self._pick_victims(exclude=holder)
+            elif self._warned:
+                return
+            else:
+                self._warned = True
+                victims = None
+            total, budget = self._total, self.budget
+
+        if victims is None:
+            user_logger.warning(
+                f'Data held by edges takes {format_bytes(total)}, more than the budget of {format_bytes(budget)}. '
+                'Nodes that never read their inputs may be keeping large objects alive.'
+            )
+            return
+        for edge in victims:
+            edge.clear_data() # releases the data
+        if len(victims) > 0:
+            logger.info(f'Evicted data from {len(victims)} edges to stay within the memory budget.')
+
+    def release(self, holder: object) -> int:
+        '''
+        Record that `holder` no longer holds data. Returns the bytes released.
+        '''
+        with self._lock:
+            size = self._held.pop(holder, 0)
+            self._total -= size
+            return size
+
+    def get_total(self) -> int:
+        return self._total
+
+    def get_high_watermark(self) -> int:
+        return self._high_watermark
+
+    def get_held(self, holder: object) -> int:
+        return self._held.get(holder, 0)
+
+    def _pick_victims(self, exclude: object) -> list['Edge']:
+        from grapycal.sobjects.edge import Edge
+        assert self.budget is not None
+        victims = []
+        excess = self._total - self.budget
+        for holder, size in self._held.items():
+            if excess <= 0:
+                break
+            if holder is exclude or not isinstance(holder, Edge) or holder.reaquirable:
+                continue
+            victims.append(holder)
+            excess -= size
+        return victims
@@ -0,0 +1,151 @@
+import os
+import threading
+from collections import deque
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from grapycal.utils.io import OutputFlusher
+    from objectsync import ListTopic
+
+class OutputSpill:
+    '''
+    The full output of a node in a file on disk, rotated when it grows past `max_bytes`: `<path>.1` is the previous
+    file, `<path>.2` the one before, and so on up to `backups`. Clients read it page by page with read_page().
+    '''
+    def __init__(self, path: str, max_bytes: int = 1024 * 1024, backups: int = 4):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+
+    def write(self, text: str):
+        data = text.encode('utf-8')
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                self._file = open(self.path, 'ab')
+                self._size = self._file.tell()
+            if self._size > 0 and self._size + len(data) > self.max_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._size += len(data)
+
+    def _rotate(self):
+        assert self._file is not None
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{i}'):
+                os.replace(f'{self.path}.{i}', f'{self.path}.{i + 1}')
+        if self.backups > 0:
+            os.replace(self.path, f'{self.path}.1')
+        self._file = open(self.path, 'wb')
+        self._size = 0
+
+    def read_page(self, page: int = 0, page_size: int = 64 * 1024) -> dict:
+        '''
+        Read the output `page` pages before the end. Page 0 is the latest output.
+        '''
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            paths = [f'{self.path}.{i}' for i in range(self.backups, 0, -1)] + [self.path]
+            paths = [path for path in paths if os.path.exists(path)]
+            sizes = [os.path.getsize(path) for path in paths]
+            total = sum(sizes)
+            end = max(total - page * page_size, 0)
+            start = max(end - page_size, 0)
+            chunks = []
+            offset = 0 # of the current file in the concatenation of the files
+            for path, size in zip(paths, sizes):
+                if offset + size > start and offset < end:
+                    with open(path, 'rb') as f:
+                        f.seek(max(start - offset, 0))
+                        chunks.append(f.read(min(end, offset + size) - max(start, offset)))
+                offset += size
+        return {
+            'text': b''.join(chunks).decode('utf-8', errors='replace'),
+            'page': page,
+            'num_pages': (total + page_size - 1) // page_size,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+class OutputLog:
+    '''
+    The output of a node shown by the clients, kept in the node's `output` topic as [type, text] entries.
+
+    The topic is a ring buffer capped at `max_entries` entries and `max_bytes` characters. When it's full, only the
+    oldest entries are evicted. An entry longer than `max_bytes` is cut to its end. Appends are collected and sent once
+    per tick by the OutputFlusher, and consecutive outputs (not errors) are merged into one entry, so printing in a
+    loop costs one message per tick. If `spill` is given, every append is also written to it, so the full output can be
+    read later.
+    '''
+    def __init__(self, topic: 'ListTopic', flusher: 'OutputFlusher', spill: OutputSpill | None = None, max_entries: int = 100, max_bytes: int = 256 * 1024):
+        self.topic = topic
+        self.spill = spill
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._flusher = flusher
+        self._lock = threading.Lock()
+        self._pending: list[tuple[str, list[str]]] = [] # entries appended since the last flush
+        self._pending_bytes = 0
+        self._dirty = False
+        self._closed = False
+        self._sizes: deque[int] = deque() # the lengths of the entries in the topic
+        self._bytes = 0
+
+    def append(self, type: str, text: str):
+        '''
+        Append an entry of type "output" or "error". Can be called from any thread.
+        '''
+        if text == '':
+            return
+        if self.spill is not None:
+            self.spill.write(text)
+        with self._lock:
+            if self._closed:
+                return
+            if type == 'output' and len(self._pending) > 0 and self._pending[-1][0] == 'output':
+                self._pending[-1][1].append(text)
+            else:
+                self._pending.append((type, [text]))
+            self._pending_bytes += len(text)
+            # what would be evicted right away doesn't need to wait in memory
+            while len(self._pending) > self.max_entries or (self._pending_bytes > 2 * self.max_bytes and len(self._pending) > 1):
+                self._pending_bytes -= sum(len(chunk) for chunk in self._pending.pop(0)[1])
+            if not self._dirty:
+                self._dirty = True
+                self._flusher.add(self)
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._pending_bytes = 0
+            self._dirty = False
+        if len(self.topic) != len(self._sizes): # changed by someone else, e.g. cleared by a client
+            self._sizes = deque(len(entry[1]) for entry in self.topic)
+            self._bytes = sum(self._sizes)
+        for type, chunks in pending:
+            text = ''.join(chunks)
+            if len(text) > self.max_bytes:
+                note = f'({len(text)} characters, only the last ones are kept)\n'
+                text = note + text[len(text) - self.max_bytes + len(note):]
+            self.topic.insert([type, text])
+            self._sizes.append(len(text))
+            self._bytes += len(text)
+            while len(self._sizes) > self.max_entries or (self._bytes > self.max_bytes and len(self._sizes) > 1):
+                self.topic.pop(0)
+                self._bytes -= self._sizes.popleft()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._pending = []
+        if self.spill is not None:
+            self.spill.close()
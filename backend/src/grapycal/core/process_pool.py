@@ -0,0 +1,60 @@
+import logging
+logger = logging.getLogger(__name__)
+
+from concurrent.futures import Future, ProcessPoolExecutor
+import multiprocessing
+import pickle
+import threading
+from typing import Any
+
+def _calculate(payload: bytes) -> Any:
+    node_type, inputs = pickle.loads(payload)
+    # Nodes that run in the process pool must not depend on node state in calculate(), so an uninitialized
+    # instance is enough here.
+    node = node_type.__new__(node_type)
+    return node.calculate(**inputs)
+
+class ProcessPool:
+    '''
+    A persistent pool of processes that runs FunctionNode.calculate outside of the workspace process, so CPU-bound
+    calculations neither block the runner nor hold the GIL. The processes are started on first use.
+    '''
+    def __init__(self, max_workers: int|None = None):
+        self._max_workers = max_workers
+        self._executor: ProcessPoolExecutor|None = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, node_type: type, inputs: dict[str, Any]) -> Future|None:
+        '''
+        Run node_type.calculate(**inputs) in the pool. Returns None if the node type or the inputs cannot be pickled,
+        in which case the caller should run the calculation itself.
+        '''
+        try:
+            payload = pickle.dumps((node_type, inputs), protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e: # pickle raises PicklingError, TypeError or AttributeError depending on the object
+            logger.debug(f'Cannot send inputs of {node_type.__name__} to the process pool: {e}')
+            return None
+        if self._executor is None:
+            # Forking a process with running threads is unsafe, so always spawn.
+            self._executor = ProcessPoolExecutor(self._max_workers, mp_context=multiprocessing.get_context('spawn'))
+        future = self._executor.submit(_calculate, payload)
+        with self._lock:
+            self._pending += 1
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future):
+        with self._lock:
+            self._pending -= 1
+
+    def get_num_pending(self) -> int:
+        '''
+        Returns the number of submitted calculations that haven't finished.
+        '''
+        return self._pending
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
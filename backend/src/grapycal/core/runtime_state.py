@@ -0,0 +1,48 @@
+import threading
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from grapycal.sobjects.port import Port
+
+class PortState:
+    '''
+    The part of a Port that the execution hot path reads, in slots. `edges` mirrors port.edges with the states of the
+    edges, and only structural edits (adding or removing an edge) change it. For input ports, `num_ready` counts the
+    edges with data ready. Edges from different nodes may be pushed to by different workers at once, so it's only
+    changed under `lock`.
+    '''
+    __slots__ = ('port', 'node_id', 'edges', 'num_ready', 'lock')
+
+    def __init__(self, port: 'Port', node_id: str):
+        self.port = port
+        self.node_id = node_id
+        self.edges: list[EdgeState] = []
+        self.num_ready = 0
+        self.lock = threading.Lock()
+
+class EdgeState:
+    '''
+    The per-push state of an Edge, in slots. `tail` and `head` are the states of the ports the edge connects, so
+    walking the graph on the hot path doesn't go through topics.
+    '''
+    __slots__ = ('data', 'ready', 'activated', 'reaquirable', 'tail', 'head')
+
+    def __init__(self):
+        self.data: Any = None
+        self.ready = False
+        self.activated = False
+        self.reaquirable = False
+        self.tail: PortState | None = None
+        self.head: PortState | None = None
+
+    def set_ready(self, ready: bool):
+        # The head port counts its ready edges, so it must see every change
+        head = self.head
+        if head is None:
+            self.ready = ready
+            return
+        with head.lock:
+            if ready == self.ready:
+                return
+            self.ready = ready
+            head.num_ready += 1 if ready else -1
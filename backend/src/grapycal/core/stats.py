@@ -0,0 +1,59 @@
+class NodeStats:
+    '''
+    Execution counters of a node. They are updated by the node and its ports on every activation, so updating is just
+    a few attribute writes. Workspace publishes the changed ones to the ``node_stats`` topic on each clock tick.
+    '''
+    __slots__ = ('node_type', 'activations', 'tasks', 'total_time', 'max_time', 'exceptions', 'bytes_out', 'cache_hits',
+                 'cache_misses', 'changed')
+
+    def __init__(self, node_type: str):
+        self.node_type = node_type
+        self.activations = 0
+        self.tasks = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.exceptions = 0
+        self.bytes_out = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.changed = True
+
+    def record_activation(self):
+        self.activations += 1
+        self.changed = True
+
+    def record_task(self, duration: float):
+        self.tasks += 1
+        self.total_time += duration
+        if duration > self.max_time:
+            self.max_time = duration
+        self.changed = True
+
+    def record_exception(self):
+        self.exceptions += 1
+        self.changed = True
+
+    def record_output(self, size: int):
+        self.bytes_out += size
+        self.changed = True
+
+    def record_cache_lookup(self, hit: bool):
+        if hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+        self.changed = True
+
+    def to_dict(self) -> dict:
+        return {
+            'type': self.node_type,
+            'activations': self.activations,
+            'tasks': self.tasks,
+            'total_time': round(self.total_time, 6),
+            'mean_time': round(self.total_time / self.tasks, 6) if self.tasks > 0 else 0,
+            'max_time': round(self.max_time, 6),
+            'exceptions': self.exceptions,
+            'bytes_out': self.bytes_out,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
@@ -0,0 +1,248 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Iterable
+
+from grapycal.core.background_runner import TaskCancelled
+from grapycal.core.cache import content_hash
+from grapycal.utils.sizing import estimate_size
+
+if TYPE_CHECKING:
+    from grapycal.sobjects.edge import Edge
+    from grapycal.sobjects.editor import Editor
+    from grapycal.sobjects.functionNode import FunctionNode
+    from grapycal.sobjects.node import Node
+    from grapycal.sobjects.port import OutputPort
+
+class CycleError(Exception):
+    pass
+
+_FAILED = object() # returned by a calculation that raised
+
+def _port_successors(node: 'Node') -> list['Node']:
+    return [edge.get_head().node for port in node.out_ports for edge in port.edges]
+
+def topological_order(nodes: Iterable['Node'], get_successors: Callable[['Node'], Iterable['Node']] = _port_successors) -> list['Node']:
+    '''
+    Sort the nodes so every node comes after the nodes it receives data from. Only edges between the given nodes are
+    considered. Ties keep the order of `nodes`, so the result is deterministic. Raises CycleError if there is a cycle.
+    By default the edges are found through the ports. Editor.graph passes its index instead.
+    '''
+    nodes = list(nodes)
+    members = set(nodes)
+    in_degree = {node: 0 for node in nodes}
+    successors: dict['Node', list['Node']] = {node: [] for node in nodes}
+    for node in nodes:
+        for head in get_successors(node):
+            if head in members:
+                successors[node].append(head)
+                in_degree[head] += 1
+
+    order = []
+    ready = [node for node in reversed(nodes) if in_degree[node] == 0]
+    while ready:
+        node = ready.pop()
+        order.append(node)
+        new_ready = []
+        for successor in successors[node]:
+            in_degree[successor] -= 1
+            if in_degree[successor] == 0:
+                new_ready.append(successor)
+        ready.extend(reversed(new_ready))
+    if len(order) < len(nodes):
+        raise CycleError(f'{len(nodes) - len(order)} nodes are on a cycle')
+    return order
+
+class TopologicalPlan:
+    '''
+    Pull-based execution of a subgraph of FunctionNodes. The nodes don't react to their inputs one by one as in the
+    push model. Instead, an activation from outside the subgraph schedules an evaluation, which runs each node once in
+    topological order and passes values inside the subgraph directly. Only the edges leaving the subgraph are pushed
+    to. Evaluations scheduled while one is pending are merged, so a burst of inputs causes one evaluation.
+
+    The order is computed once and recomputed only when the editor's graph changes.
+
+    A node is skipped, along with the nodes depending on it, when an input coming from outside the subgraph has no
+    data yet, when its calculation fails or when it is cancelled. The data of a skipped node's inputs is left on the
+    edges for the next evaluation. A calculation runs in the node's context, like a task of the node in the push model,
+    and its exceptions are reported on the node. Cancelling a member node also drops the pending evaluation.
+
+    If `incremental` is set, the plan keeps the last outputs of the nodes and the last data from outside the subgraph,
+    like a spreadsheet. An activation marks only the activated node dirty, and an evaluation runs the dirty nodes and
+    the nodes downstream of a node whose output changed. An output is unchanged if its content hash (see content_hash)
+    is the same as before, so recomputing to the same value stops there.
+    '''
+    def __init__(self, editor: 'Editor', nodes: Iterable['FunctionNode'], incremental: bool = False):
+        self.editor = editor
+        self.nodes = list(nodes)
+        self.incremental = incremental
+        self.group = ('plan', id(self)) # the runner group of the evaluations. Cancelling a member node cancels it too.
+        self._order: list['FunctionNode'] = []
+        self._version = -1 # the graph version the order was computed for
+        self._lock = threading.Lock() # nodes are activated from several threads
+        self._dirty: set['FunctionNode'] = set()
+        # kept between evaluations in incremental mode
+        self._outputs: dict['OutputPort', Any] = {}
+        self._output_hashes: dict['OutputPort', bytes|None] = {}
+        self._outside_inputs: dict['Edge', Any] = {}
+
+    def get_order(self) -> list['FunctionNode']:
+        if self._version != self.editor.graph_version:
+            self.nodes = [node for node in self.nodes if not node.is_destroyed()]
+            self._order = self.editor.graph.topological_order(self.nodes) # type: ignore
+            self._version = self.editor.graph_version
+            self._forget_removed()
+            with self._lock:
+                self._dirty.update(self._order)
+        return self._order
+
+    def remove(self, node: 'FunctionNode'):
+        '''
+        Return the node to the push model.
+        '''
+        self.nodes.remove(node)
+        node._plan = None
+        self._version = -1
+
+    def activate(self, node: 'FunctionNode'):
+        '''
+        Mark the node dirty and schedule an evaluation.
+        '''
+        with self._lock:
+            self._dirty.add(node)
+        self.schedule()
+
+    def schedule(self):
+        '''
+        Run an evaluation in the background runner.
+        '''
+        runner = self.editor.workspace.background_runner
+        ids = set()
+        if runner.get_num_workers() > 1:
+            for node in self.nodes:
+                ids.add(node.get_id())
+                ids |= node.get_adjacent_node_ids()
+        runner.push(self.evaluate, group=self.group, conflicts=ids, coalesce_key=self.group)
+
+    def evaluate(self):
+        '''
+        Run the nodes of the subgraph once, in topological order. In incremental mode, only the dirty nodes and the
+        nodes affected by them run.
+        '''
+        try:
+            order = self.get_order()
+        except CycleError as e:
+            logger.warning(f'Cannot evaluate the subgraph: {e}')
+            return
+        members = set(order)
+        measure_sizes = self.editor.workspace.measure_sizes
+        with self._lock:
+            dirty = self._dirty if self.incremental else set(order)
+            self._dirty = set()
+        values = self._outputs if self.incremental else {}
+        for node in order:
+            if node not in dirty or node.is_destroyed():
+                continue
+            inputs = self._gather_inputs(node, members, values)
+            if inputs is None:
+                logger.debug(f'Skipped {node.get_id()}: some inputs have no data')
+                if self.incremental:
+                    with self._lock:
+                        self._dirty.add(node) # run it when the missing data arrives
+                continue
+            result = self._calculate(node, inputs)
+            if result is None:
+                continue
+            for port, value in result:
+                if self.incremental:
+                    new_hash = content_hash(value)
+                    if port in values and new_hash is not None and new_hash == self._output_hashes[port]:
+                        continue # unchanged, so the nodes downstream don't need to run
+                    self._output_hashes[port] = new_hash
+                values[port] = value
+                size = None # measured once for the stats and the edges, like OutputPort.push_data does
+                if measure_sizes:
+                    size = estimate_size(value)
+                    node.stats.record_output(size)
+                for edge in port.edges:
+                    head = edge.get_head().node
+                    if head in members:
+                        dirty.add(head)
+                    else:
+                        edge.push_data(value, size=size)
+
+    def _gather_inputs(self, node: 'FunctionNode', members: set, values: dict) -> dict[str, Any]|None:
+        # Check every input before reading any, so nothing is taken from the edges of a skipped node
+        for port in node._get_func_ins():
+            if port.use_default:
+                if not port.default_control.value_ready():
+                    return None
+                continue
+            if len(port.edges) == 0:
+                return None
+            for edge in port.edges:
+                tail = edge.get_tail()
+                if tail.node in members:
+                    if tail not in values:
+                        return None
+                elif not edge.is_data_ready() and edge not in self._outside_inputs:
+                    return None
+
+        inputs = {}
+        for port in node._get_func_ins():
+            if port.use_default:
+                data = [port.default_control.get_value()]
+            else:
+                data = []
+                for edge in port.edges:
+                    tail = edge.get_tail()
+                    if tail.node in members:
+                        data.append(values[tail])
+                    elif edge.is_data_ready():
+                        data.append(edge.get_data())
+                        if self.incremental:
+                            self._outside_inputs[edge] = data[-1]
+                    else:
+                        data.append(self._outside_inputs[edge])
+            inputs[port.get_name()] = data[0] if port.max_edges.get() == 1 else data
+        return inputs
+
+    def _forget_removed(self):
+        # Drop what was kept for ports and edges that left the subgraph
+        ports = set()
+        edges = set()
+        for node in self.nodes:
+            ports.update(node._get_func_outs())
+            for port in node._get_func_ins():
+                edges.update(port.edges)
+        for port in [port for port in self._outputs if port not in ports]:
+            del self._outputs[port]
+            del self._output_hashes[port]
+        for edge in [edge for edge in self._outside_inputs if edge not in edges]:
+            del self._outside_inputs[edge]
+
+    def _calculate(self, node: 'FunctionNode', inputs: dict[str, Any]) -> list[tuple['OutputPort', Any]]|None:
+        # Run in the node's context, so it sees its own cancellation token and an interrupt is reported on it
+        token = node.get_cancellation_token()
+
+        def calculate():
+            try:
+                return node.calculate_cached(inputs)
+            except TaskCancelled:
+                raise
+            except Exception as e:
+                node.stats.record_exception()
+                node.print_exception(e, truncate=1)
+                return _FAILED
+
+        result = node._run_in_context(calculate, token)
+        if result is _FAILED or token.is_cancelled():
+            return None
+
+        outs = node._get_func_outs()
+        if len(outs) == 1:
+            return [(outs[0], result)]
+        if result is None:
+            return []
+        return [(node.get_out_port(k), v) for k, v in result.items()]
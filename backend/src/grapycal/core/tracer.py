@@ -0,0 +1,107 @@
+import logging
+logger = logging.getLogger(__name__)
+
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+from itertools import count
+from typing import Any, Callable, Hashable
+
+def _now() -> float:
+    # Trace Event timestamps are in microseconds
+    return time.perf_counter_ns() / 1000
+
+class Tracer:
+    '''
+    Records when tasks of the BackgroundRunner are pushed, started and finished, and writes them in the Chrome Trace
+    Event format, which can be opened in Perfetto (https://ui.perfetto.dev) or chrome://tracing.
+
+    Each task is a slice on the thread that ran it, named by `describe(group)` (the node type for node tasks). Each
+    step of a generator task is a slice of its own. Queued tasks are linked to the push that scheduled them by an arrow.
+
+    At most `max_events` events are kept, so forgetting to stop tracing can't exhaust the memory.
+    '''
+    def __init__(self, describe: Callable[[Hashable], str]|None = None, max_events: int = 1_000_000):
+        self._describe = describe
+        self._max_events = max_events
+        self._events: list[dict[str, Any]] = []
+        self._dropped = 0
+        self._names: dict[Hashable, str] = {}
+        self._thread_names: dict[int, str] = {}
+        self._flow_ids = count(1)
+        self._pid = os.getpid()
+
+    def pushed(self) -> tuple[int, float]:
+        '''
+        Called when a task is pushed. Returns the flow id and the time, to be passed to `running` when the task runs.
+        '''
+        flow_id = next(self._flow_ids)
+        ts = _now()
+        self._add({'ph': 's', 'name': 'push', 'cat': 'task', 'id': flow_id, 'ts': ts, 'pid': self._pid,
+                   'tid': self._tid()})
+        return flow_id, ts
+
+    @contextmanager
+    def running(self, group: Hashable|None, step: bool = False, pushed: tuple[int, float]|None = None):
+        '''
+        Record the task run in the context. `step` tells that the task is a step of a generator.
+        '''
+        start = _now()
+        try:
+            yield
+        finally:
+            self._ran(group, start, _now(), step, pushed)
+
+    def _ran(self, group: Hashable|None, start: float, end: float, step: bool, pushed: tuple[int, float]|None):
+        tid = self._tid()
+        args: dict[str, Any] = {'node_id': group, 'node_type': self._name(group)}
+        if pushed is not None:
+            flow_id, pushed_at = pushed
+            args['wait_ms'] = round((start - pushed_at) / 1000, 3)
+            # the arrow ends at the slice that encloses this point
+            self._add({'ph': 'f', 'bp': 'e', 'name': 'push', 'cat': 'task', 'id': flow_id, 'ts': start,
+                       'pid': self._pid, 'tid': tid})
+        name = args['node_type'] if group is not None else 'task'
+        self._add({'ph': 'X', 'name': f'{name} (step)' if step else name, 'cat': 'step' if step else 'task', 'ts': start,
+                   'dur': end - start, 'pid': self._pid, 'tid': tid, 'args': args})
+
+    def write(self, path: str) -> int:
+        '''
+        Write the recorded events to a JSON file. Returns the number of events written.
+        '''
+        events = list(self._events)
+        metadata = [{'ph': 'M', 'name': 'thread_name', 'pid': self._pid, 'tid': tid, 'args': {'name': name}}
+                    for tid, name in list(self._thread_names.items())]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+        if self._dropped > 0:
+            logger.warning(f'The trace reached {self._max_events} events. {self._dropped} events were not recorded.')
+        return len(events)
+
+    def _add(self, event: dict[str, Any]):
+        # list.append is atomic, so workers can record without a lock
+        if len(self._events) < self._max_events:
+            self._events.append(event)
+        else:
+            self._dropped += 1
+
+    def _tid(self) -> int:
+        tid = threading.get_ident()
+        if tid not in self._thread_names:
+            self._thread_names[tid] = threading.current_thread().name
+        return tid
+
+    def _name(self, group: Hashable|None) -> str:
+        if group is None:
+            return ''
+        if group not in self._names:
+            name = None
+            if self._describe is not None:
+                try:
+                    name = self._describe(group)
+                except Exception: # the node may have been deleted
+                    pass
+            self._names[group] = name if name is not None else str(group)
+        return self._names[group]
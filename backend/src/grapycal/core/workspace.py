@@ -1,6 +1,5 @@
 from enum import Enum
 import os
-import time
 import grapycal
 from grapycal.extension.extensionManager import ExtensionManager
 from grapycal.extension.utils import Clock
@@ -14,7 +13,7 @@ from grapycal.sobjects.controls import *
 from grapycal.sobjects.editor import Editor
 from grapycal.sobjects.workspaceObject import WebcamStream, WorkspaceObject
 from grapycal.utils.httpResource import HttpResource
-from grapycal.utils.io import file_exists, read_workspace, write_workspace
+from grapycal.utils.io import OutputFlusher, file_exists, read_workspace
 
 from grapycal.utils.logging import setup_logging
 
@@ -42,6 +41,13 @@ from grapycal.sobjects.port import InputPort, OutputPort
 from grapycal.sobjects.sidebar import Sidebar
 
 from grapycal.core.background_runner import BackgroundRunner
+from grapycal.core.process_pool import ProcessPool
+from grapycal.core.cache import ResultCache
+from grapycal.core.journal import WorkspaceJournal
+from grapycal.core.memory import MemoryAccountant, MemoryPolicy, format_bytes
+from grapycal.core.output_log import OutputSpill
+from grapycal.core.stats import NodeStats
+from grapycal.core.tracer import Tracer
 from grapycal.sobjects.node import Node
 
 from grapycal.core import running_module
@@ -54,8 +60,14 @@ class ClientMsgTypes:
 
 
 class Workspace:
-    def __init__(self, port, host, path, workspace_id) -> None:
+    def __init__(self, port, host, path, workspace_id, workers=1, max_pending=10000, memory_budget=0, memory_policy: MemoryPolicy = 'warn', cache_budget=256, headless=False, output_log_dir='') -> None:
         self.path = path
+        self.headless = headless
+        '''
+        In headless mode, there is no server for clients to connect to, and the work done only for the UI is skipped:
+        running indicators, edge labels, published stats, and streaming the output of nodes, which goes to stdout
+        instead. See grapycal.core.headless.
+        '''
         self.port = port
         self.host = host
         self.workspace_id = workspace_id # used for exit message file
@@ -70,16 +82,41 @@ class Workspace:
 
         self._communication_event_loop: asyncio.AbstractEventLoop | None = None
 
-        self.background_runner = BackgroundRunner()
+        self.background_runner = BackgroundRunner(num_workers=workers, max_pending=max_pending if max_pending > 0 else None)
+
+        self.process_pool = ProcessPool()
+
+        self._tracer: Tracer | None = None
+
+        self._node_stats: dict[str, NodeStats] = {}
+
+        # memory_budget is in MB. 0 means no budget.
+        self.memory = MemoryAccountant(memory_budget * 1024 * 1024 if memory_budget > 0 else None, memory_policy)
+
+        # whether ports and edges estimate the size of the data pushed. It's only needed for the memory budget and the
+        # stats, which aren't published in headless mode. See OutputPort.push_data.
+        self.measure_sizes = memory_budget > 0 or not headless
+
+        # cache_budget is in MB. 0 disables the cache.
+        self.result_cache = ResultCache(cache_budget * 1024 * 1024 if cache_budget > 0 else None)
+
+        # if set, the full output of each node is also written to a file in this directory. See OutputLog.
+        self.output_log_dir = output_log_dir
 
         self._objectsync = objectsync.Server(port, host)
 
+        # saves append the changes to the workspace file, see WorkspaceJournal
+        self._journal = WorkspaceJournal(self._objectsync)
+
         self._extention_manager = ExtensionManager(self._objectsync, self)
 
         self.do_after_transition = self._objectsync.do_after_transition
 
         self.clock = Clock(0.1)
 
+        # flushes the output streams of the nodes, see OutputStream
+        self.output_flusher = OutputFlusher(lambda: self._objectsync.record(allow_reentry=True))
+
         self.webcam: WebcamStream | None = None
 
         self.data_yaml = HttpResource(
@@ -93,9 +130,14 @@ class Workspace:
 
     async def _async_communication_thread(self, event_loop_set_event: threading.Event):
         self._communication_event_loop = asyncio.get_event_loop()
+        # Event handlers run nodes from here, and waiting for the runner would stall every client and the clock
+        self.background_runner.set_non_blocking()
         event_loop_set_event.set()
         try:
-            await asyncio.gather(self._objectsync.serve(), self.clock.run())
+            if self.headless:
+                await self.clock.run()
+            else:
+                await asyncio.gather(self._objectsync.serve(), self.clock.run())
         except OSError as e:
             if e.errno == 10048:
                 logger.error(
@@ -116,12 +158,16 @@ class Workspace:
         t.start()
         event_loop_set_event.wait()
 
-        self._extention_manager.start()
+        if not self.headless:
+            self._extention_manager.start()
 
         self._objectsync.globals.workspace = self
 
         self._objectsync.register_service("exit", self.exit)
         self._objectsync.register_service("interrupt", self.interrupt)
+        self._objectsync.register_service("start_tracing", self.start_tracing)
+        self._objectsync.register_service("stop_tracing", self.stop_tracing)
+        self._objectsync.register_service("read_output_log", self._read_output_log)
 
         self._objectsync.register(WorkspaceObject)
         self._objectsync.register(Editor)
@@ -172,6 +218,30 @@ class Workspace:
             "meta", objectsync.DictTopic, {"workspace name": self.path}
         )
 
+        # number of pending tasks of each priority, for monitoring the runner
+        self._runner_queue_depth_topic = self._objectsync.create_topic(
+            "runner_queue_depth",
+            objectsync.DictTopic,
+            self.background_runner.get_queue_depths(),
+            is_stateful=False,
+        )
+
+        # execution counters of each node, see NodeStats. Only changed entries are sent on each tick.
+        self._node_stats_topic = self._objectsync.create_topic(
+            "node_stats", objectsync.DictTopic, {}, is_stateful=False
+        )
+
+        # bytes held by edges and retained output ports, see MemoryAccountant, and the ResultCache
+        self._memory_topic = self._objectsync.create_topic(
+            "memory", objectsync.DictTopic, self._get_memory_usage(), is_stateful=False
+        )
+
+        if not self.headless: # no client receives the topics in headless mode
+            self.clock.on_tick += self._update_runner_queue_depth
+            self.clock.on_tick += self._publish_node_stats
+            self.clock.on_tick += self._update_memory_usage
+            self.clock.on_tick += self.output_flusher.flush
+
         if not file_exists(self.path):
             self.save_workspace(
                 self.path
@@ -185,13 +255,125 @@ class Workspace:
         )
 
         self.background_runner.run()
+        self.process_pool.shutdown()
+        self._journal.close()
 
     def exit(self):
         self.background_runner.exit()
 
     def interrupt(self):
+        self.cancel(self.get_workspace_object().main_editor.top_down_search(type=Node))
+        self.background_runner.cancel([None]) # the tasks that don't belong to a node
+        # Tasks that don't check their cancellation token can only be stopped by interrupting the runner thread.
         self.background_runner.interrupt()
-        self.background_runner.clear_tasks()
+
+    def cancel(self, nodes: list[Node]):
+        '''
+        Cancel the tasks of the nodes. See Node.cancel.
+        '''
+        groups = []
+        for node in nodes:
+            node._renew_cancellation_token()
+            groups.append(node.get_id())
+            plan = getattr(node, '_plan', None) # a pending evaluation of a pull-mode subgraph runs the node too
+            if plan is not None:
+                groups.append(plan.group)
+        self.background_runner.cancel(groups)
+
+    def start_tracing(self):
+        '''
+        Start recording the tasks run by the runner. See Tracer.
+        '''
+        if self._tracer is not None:
+            return
+        self._tracer = Tracer(describe=self._describe_node)
+        self.background_runner.set_tracer(self._tracer)
+        self.send_message_to_all("Tracing started.")
+
+    def stop_tracing(self, name: str | None = None) -> str | None:
+        '''
+        Stop recording and write the trace to the file `name` in the directory of the workspace file, and return its
+        name. By default, it's named after the workspace file. The file can be opened in Perfetto or chrome://tracing.
+        '''
+        if name is None:
+            name = os.path.splitext(os.path.basename(self.path))[0] + ".trace.json"
+        # clients may only choose the name, not where the file goes
+        if os.path.basename(name) != name or name in ("", ".", ".."):
+            raise Exception(f"Invalid trace file name {name}")
+        if self._tracer is None:
+            return None
+        tracer = self._tracer
+        self._tracer = None
+        self.background_runner.set_tracer(None)
+        path = os.path.join(os.path.dirname(os.path.abspath(self.path)), name)
+
+        def write():
+            n_events = tracer.write(path)
+            logger.info(f"Trace with {n_events} events written to {path}.")
+            self.send_message_to_all(f"Trace written to {name}.")
+
+        # the trace may be large, so don't block the communication thread
+        threading.Thread(target=write, daemon=True).start()
+        return name
+
+    def _describe_node(self, node_id: str) -> str:
+        return self._objectsync.get_object(node_id).get_type_name()
+
+    def get_output_spill(self, node: Node) -> OutputSpill | None:
+        """
+        The file a node's full output is written to, or None if output is not spilled to disk.
+        """
+        if self.output_log_dir == '' or self.headless or node.editor is None:
+            return None
+        return OutputSpill(os.path.join(self.output_log_dir, f'{node.get_id()}.log'))
+
+    def _read_output_log(self, node_id: str, page: int = 0):
+        node = self._objectsync.get_object(node_id)
+        assert isinstance(node, Node)
+        return node.read_output_log(page)
+
+    def add_node_stats(self, node_id: str, stats: NodeStats):
+        self._node_stats[node_id] = stats
+
+    def remove_node_stats(self, node_id: str):
+        self._node_stats.pop(node_id, None)
+
+    def _publish_node_stats(self):
+        topic = self._node_stats_topic
+        removed = [node_id for node_id in topic.get() if node_id not in self._node_stats]
+        changed = [(node_id, stats) for node_id, stats in list(self._node_stats.items()) if stats.changed]
+        if len(removed) == 0 and len(changed) == 0:
+            return
+        with self._objectsync.record(allow_reentry=True):  # send the changes in one message
+            for node_id in removed:
+                topic.pop(node_id)
+            for node_id, stats in changed:
+                stats.changed = False
+                if node_id in topic:
+                    topic.change_value(node_id, stats.to_dict())
+                else:
+                    topic.add(node_id, stats.to_dict())
+
+    def _get_memory_usage(self) -> dict[str, int | None]:
+        return {
+            "held": self.memory.get_total(),
+            "high_watermark": self.memory.get_high_watermark(),
+            "budget": self.memory.budget,
+            "cache": self.result_cache.get_size(),
+            "cache_budget": self.result_cache.budget,
+            "cache_hits": self.result_cache.hits,
+            "cache_misses": self.result_cache.misses,
+        }
+
+    def _update_memory_usage(self):
+        usage = self._get_memory_usage()
+        if usage != self._memory_topic.get():
+            self._memory_topic.set(usage)
+
+    def _update_runner_queue_depth(self):
+        depths = self.background_runner.get_queue_depths()
+        if depths != self._runner_queue_depth_topic.get():
+            self._runner_queue_depth_topic.set(depths)
 
     def get_communication_event_loop(self) -> asyncio.AbstractEventLoop:
         assert self._communication_event_loop is not None
@@ -209,8 +391,41 @@ class Workspace:
             pass
 
     def save_workspace(self, path: str) -> None:
-        workspace_serialized = self.get_workspace_object().serialize()
+        """
+        Save the workspace to `path`. If it was last saved to the same file, only the changes since then are appended
+        to it. The file is written in the background, see WorkspaceJournal.
+
+        What is saved is serialized on the calling thread, in a record, so it is consistent. Meanwhile, no change can
+        be made to the workspace: the runner stalls at its first change, and no client is served when this is called
+        from an event handler. An appended entry serializes only the changed objects. A base snapshot (the first save
+        to a file, or a save after most objects changed) serializes every object, which takes seconds with tens of
+        thousands of nodes.
+        """
+        workspace = self.get_workspace_object()
+        metadata, data = self._get_save_info()
+        # nodes and edges are children of the editor, so no need to search the whole tree
+        editor_children = workspace.main_editor.get_children()
+        node_count = sum(isinstance(child, Node) for child in editor_children)
+        edge_count = sum(isinstance(child, Edge) for child in editor_children)
+
+        def saved(file_size: int):
+            logger.info(
+                f"Workspace saved to {path}. Node count: {node_count}. Edge count: {edge_count}. File size: {file_size//1024} KB."
+            )
+            self.send_message_to_all(
+                f"Workspace saved to {path}. Node count: {node_count}. Edge count: {edge_count}. File size: {file_size//1024} KB."
+            )
+
+        # no change can be made while the workspace is serialized
+        with self._objectsync.record(allow_reentry=True):
+            if self._journal.can_append(path):
+                self._journal.append(path, workspace, metadata, data, saved)
+            else:
+                data["workspace_serialized"] = workspace.serialize().to_dict()
+                self._journal.write_snapshot(path, metadata, data, saved)
 
+    def _get_save_info(self) -> tuple[dict, dict]:
+        # the metadata and the data other than the workspace itself
         metadata = {
             "version": grapycal.__version__,
             "extensions": self._extention_manager.get_extensions_info(),
@@ -220,22 +435,8 @@ class Workspace:
             "client_id_count": self._objectsync.get_client_id_count(),
             "id_count": self._objectsync.get_id_count(),
             "grapycal_id_count": self.grapycal_id_count,
-            "workspace_serialized": workspace_serialized.to_dict(),
         }
-        file_size = write_workspace(path, metadata, data, compress=True)
-        time_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-        node_count = len(
-            self.get_workspace_object().main_editor.top_down_search(type=Node)
-        )
-        edge_count = len(
-            self.get_workspace_object().main_editor.top_down_search(type=Edge)
-        )
-        logger.info(
-            f"Workspace saved to {path}. Node count: {node_count}. Edge count: {edge_count}. File size: {file_size//1024} KB."
-        )
-        self.send_message_to_all(
-            f"Workspace saved to {path}. Node count: {node_count}. Edge count: {edge_count}. File size: {file_size//1024} KB."
-        )
+        return metadata, data
 
     def load_workspace(self, path: str) -> None:
         version, metadata, data = read_workspace(path)
@@ -285,6 +486,12 @@ class Workspace:
 
         self._objectsync.clear_history_inclusive()
 
+        if not self.headless: # headless runs never save
+            # so the first save appends to the file instead of writing the whole workspace again
+            metadata, data = self._get_save_info()
+            data["workspace_serialized"] = self.get_workspace_object().serialize().to_dict()
+            self._journal.rebase(path, metadata, data)
+
     def _check_grapycal_version(self, version: str):
         # check if the workspace version is compatible with the current version
         workspace_version_tuple = tuple(map(int, version.split(".")))
@@ -369,10 +576,18 @@ class Workspace:
         self.grapycal_id_count += 1
         return self.grapycal_id_count
 
-    def clear_edges(self):
+    def clear_edges(self) -> int:
+        '''
+        Clear the data on all edges. Returns the estimated bytes freed.
+        '''
+        held_before = self.memory.get_total()
         edges = self.get_workspace_object().top_down_search(type=Edge)
         for edge in edges:
             edge.clear_data()
+        freed = held_before - self.memory.get_total()
+        if freed > 0:
+            logger.info(f"Cleared data on edges, freeing {format_bytes(freed)}.")
+        return freed
 
 
 if __name__ == "__main__":
@@ -383,7 +598,13 @@ if __name__ == "__main__":
     parser.add_argument("--host", type=str, default="localhost")
     parser.add_argument("--path", type=str, default="workspace.grapycal")
     parser.add_argument("--workspace_id", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--max-pending", type=int, default=10000)
+    parser.add_argument("--memory-budget", type=int, default=0)
+    parser.add_argument("--memory-policy", type=str, default="warn", choices=["warn", "evict"])
+    parser.add_argument("--cache-budget", type=int, default=256)
+    parser.add_argument("--output-log-dir", type=str, default="")
     args = parser.parse_args()
 
-    workspace = Workspace(args.port, args.host, args.path, args.workspace_id)
+    workspace = Workspace(args.port, args.host, args.path, args.workspace_id, args.workers, args.max_pending, args.memory_budget, args.memory_policy, args.cache_budget, output_log_dir=args.output_log_dir)
     workspace.run()
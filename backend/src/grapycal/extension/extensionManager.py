@@ -14,7 +14,6 @@ from os.path import join, dirname
 import shutil
 from grapycal.extension.extension import Extension
 from grapycal.sobjects.node import Node
-from grapycal.sobjects.port import Port
 import objectsync
 
 if TYPE_CHECKING:  
@@ -103,14 +102,13 @@ class ExtensionManager:
         nodes_to_recover:List[objectsync.sobject.SObjectSerialized] = []
         edges_to_recover:List[objectsync.sobject.SObjectSerialized] = []
         
+        graph = self._workspace.get_workspace_object().main_editor.graph
         for node in nodes_to_update:
             # First serialize the node
             nodes_to_recover.append(node.serialize())
-            ports: List[Port] = node.in_ports.get() + node.out_ports.get() # type: ignore
-            for port in ports:
-                for edge in port.edges.copy():
-                    edges_to_recover.append(edge.serialize())
-                    self._objectsync.destroy_object(edge.get_id())
+            for edge in graph.edges_of(node):
+                edges_to_recover.append(edge.serialize())
+                self._objectsync.destroy_object(edge.get_id())
 
             # Then destroy the node
             self._objectsync.destroy_object(node.get_id())
@@ -157,6 +155,8 @@ class ExtensionManager:
                 self._workspace.get_workspace_object().main_editor.create_node(node_type, translation='9999,9999',is_new = True)
 
     def _update_available_extensions_topic(self) -> None:
+        if self._workspace.headless:
+            return # only the UI lists extensions, and listing them fetches remote metadata
         self._workspace.add_task_to_event_loop(self._update_available_extensions_topic_async())
 
     async def _update_available_extensions_topic_async(self) -> None:
@@ -1,6 +1,8 @@
 import random
 from typing import Any
+from grapycal.core.runtime_state import EdgeState
 from grapycal.sobjects.port import InputPort, OutputPort, Port
+from grapycal.utils.sizing import estimate_size
 from objectsync import SObject, StringTopic, ObjTopic, IntTopic
 from objectsync.sobject import SObjectSerialized
 
@@ -25,10 +27,7 @@ class Edge(SObject):
         self.label = self.add_attribute('label', StringTopic, is_stateful=False)
 
     def init(self):                
-        self._data = None
-        self._activated = False
-        self._data_ready = False
-        self.reaquirable = False
+        self._state = EdgeState() # the per-push state, kept compact for the hot path
 
         self.tail.on_set2 += self.on_tail_set
         self.head.on_set2 += self.on_head_set
@@ -40,6 +39,8 @@ class Edge(SObject):
         from grapycal.sobjects.editor import Editor
         assert isinstance(parent, Editor)
         self.editor = parent
+        self._memory = self.editor.workspace.memory
+        self._headless = self.editor.workspace.headless
         
 
     def on_tail_set(self, old_tail:Port|None, new_tail:Port|None):
@@ -60,7 +61,7 @@ class Edge(SObject):
             raise Exception(f'{self} head cannot be None')
         if new_head:
             new_head.add_edge(self)
-            if self._activated:
+            if self._state.activated:
                 new_head.node.edge_activated(self, new_head)
 
     def destroy(self) -> SObjectSerialized:
@@ -71,49 +72,68 @@ class Edge(SObject):
         
         if hasattr(self, 'editor'):
             self.editor.set_running(self, False)
+            self._memory.release(self)
         return super().destroy()
 
+    @property
+    def reaquirable(self) -> bool:
+        '''
+        If True, the data stays on the edge after it's read.
+        '''
+        return self._state.reaquirable
+
+    @reaquirable.setter
+    def reaquirable(self, value: bool):
+        self._state.reaquirable = value
+
     def get_data(self)->Any:
-        if not self._data_ready:
+        state = self._state
+        if not state.ready:
             raise Exception('Data not available')
-        self._activated = False
-        temp = self._data
-        if not self.reaquirable:
-            self._data_ready = False
+        state.activated = False
+        temp = state.data
+        if not state.reaquirable:
+            state.set_ready(False)
             
-            self.editor.set_running(self, False)
-            self._data = None # reloase memory
+            if not self._headless:
+                self.editor.set_running(self, False)
+            state.data = None # reloase memory
+            self._memory.release(self)
         return temp
     
     def peek_data(self)->Any:
-        if not self._data_ready:
+        if not self._state.ready:
             raise Exception('Data not available')
-        return self._data
+        return self._state.data
     
-    def push_data(self, data, label:str|None=None):
-        self._data = data
-        self._activated = True
-        self._data_ready = True
-        with self._server.record(allow_reentry=True): # aquire a lock to prevent calling set while destroying
-            if self.is_destroyed():
-                return
-            self.editor.set_running(self, True)
-        if label:
-            self.label.set(label)
-        else:
-            label = ''
-            if HAS_TORCH and isinstance(data, torch.Tensor):
-                label = str(list(data.shape)) if list(data.shape)!=[] else 'scalar'
-            elif HAS_NUMPY and isinstance(data, np.ndarray):
-                label = str(list(data.shape)) if list(data.shape)!=[] else 'scalar'
-
-            self.label.set(label)
-
-        head = self.head.get()
-        if head:
-            head.activated_by_edge(self)
-
-        self._activated = False
+    def push_data(self, data, label:str|None=None, size:int|None=None):
+        '''
+        `size` is the estimated size of `data`, if the caller already measured it.
+        '''
+        state = self._state
+        state.data = data
+        state.activated = True
+        state.set_ready(True)
+        if self.is_destroyed(): # destroy() already released what it held, so don't hold again
+            return
+        if size is None and self.editor.workspace.measure_sizes:
+            size = estimate_size(data)
+        if size is not None:
+            self._memory.hold(self, size)
+        if not self._headless: # the running indicator and the label are only for the UI
+            if not label:
+                label = ''
+                if HAS_TORCH and isinstance(data, torch.Tensor):
+                    label = str(list(data.shape)) if list(data.shape)!=[] else 'scalar'
+                elif HAS_NUMPY and isinstance(data, np.ndarray):
+                    label = str(list(data.shape)) if list(data.shape)!=[] else 'scalar'
+            # buffered by the editor and sent on the next tick
+            self.editor.edge_pushed(self, label)
+
+        if state.head is not None:
+            state.head.port.activated_by_edge(self) # type: ignore
+
+        state.activated = False
 
     def clear_data(self):
         if self.is_data_ready():
@@ -123,10 +143,10 @@ class Edge(SObject):
         self.label.set(label)
     
     def is_activated(self):
-        return self._activated
+        return self._state.activated
     
     def is_data_ready(self):
-        return self._data_ready
+        return self._state.ready
 
     def get_tail(self):
         tail = self.tail.get()
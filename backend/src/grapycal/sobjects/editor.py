@@ -9,10 +9,12 @@ from grapycal.utils.logging import user_logger, warn_extension
 from typing import Any, Dict, List
 from dacite import from_dict
 from grapycal.extension.utils import NodeInfo
+from grapycal.core.graph_index import GraphIndex
+from grapycal.core.topological import CycleError, TopologicalPlan
 from grapycal.sobjects.edge import Edge
 from grapycal.sobjects.node import Node, NodeMeta
 from grapycal.sobjects.port import InputPort, OutputPort, Port
-from objectsync import ObjSetTopic, SObject, SObjectSerialized
+from objectsync import ListTopic, ObjSetTopic, SObject, SObjectSerialized
 from itertools import count
 
 
@@ -28,12 +30,25 @@ class Editor(SObject):
 
         # used by frontend
         self._running_nodes = self.add_attribute("running_nodes", ObjSetTopic, is_stateful=False)
-        self._set_running_true = set()
-        self._set_running_true_2 = set()
-        self._running = set()
-        self._set_running_lock = threading.Lock()
+        # the subgraphs in pull mode, as {"nodes": [node ids], "incremental": bool}. Only kept to be saved with the
+        # workspace, so it's not undoable. See set_pull_mode.
+        self.pull_mode = self.add_attribute("pull_mode", ListTopic, [], is_stateful=False)
+        # Threads report running state changes and edge labels to their own buffer, without a lock. The buffers are
+        # drained on each tick. See check_running_nodes.
+        self._running_buffers: dict[threading.Thread, list[tuple[int, Node|Edge, bool, str|None]]] = {}
+        self._running_buffers_lock = threading.Lock() # only taken when a thread reports for the first time
+        self._local = threading.local()
+        self._running_seq = count() # orders the reports of different threads
+        # Only touched on ticks
+        self._running = set() # set running and not unset
+        self._set_running_true = set() # set running since the last tick
+        self._set_running_true_2 = set() # set running in the tick before
+        self._shown_running = set() # what the clients have
+        self.graph_version = 0 # incremented whenever an edge is added or removed
+        self.graph = GraphIndex(self) # kept up to date by the ports
         
-        self.workspace.clock.on_tick += self.check_running_nodes
+        if not self.workspace.headless:
+            self.workspace.clock.on_tick += self.check_running_nodes
 
         if old is not None:
             # If the editor is loaded from a save, we need to recreate the nodes and edges.
@@ -52,6 +67,7 @@ class Editor(SObject):
                         extra={"key": f"{type_name} node not defined"},
                     )
             self.restore(nodes, edges)
+            self._restore_pull_mode(old.get_attribute("pull_mode") or [])
 
         # called by client
         self.register_service("create_edge", self.create_edge_from_port_id)
@@ -59,21 +75,153 @@ class Editor(SObject):
         self.register_service("copy", self._copy)
         self.register_service("paste", self._paste, pass_sender=True)
         self.register_service("delete", self._delete)
+        self.register_service("set_pull_mode", self._set_pull_mode_service)
 
 
     def check_running_nodes(self):
-        with self._set_running_lock:
-            self._running_nodes.set(list(self._running | self._set_running_true | self._set_running_true_2))
-            self._set_running_true_2 = self._set_running_true
-            self._set_running_true = set()
+        """
+        Called every tick. Sends the running indicators and the edge labels changed since the last tick to the
+        clients in one transition, so their cost doesn't grow with the rate of pushes. An object set running is shown
+        for at least two ticks so short tasks are visible. Only the objects added or removed are sent, and nothing is
+        done if nothing changed.
+        """
+        reports = self._drain_running_buffers()
+        if len(reports) == 0 and len(self._set_running_true) == 0 and len(self._set_running_true_2) == 0:
+            return # nothing can have changed
 
-    def set_running(self, node: Node|Edge, running: bool):
-        with self._set_running_lock:
+        labels: dict[Edge, str] = {} # the last label of each edge
+        set_running_true = set()
+        for _, obj, running, label in reports:
             if running:
-                self._set_running_true.add(node)
-                self._running.add(node)
+                self._running.add(obj)
+                set_running_true.add(obj)
             else:
-                self._running.discard(node)
+                self._running.discard(obj)
+            if label is not None:
+                labels[obj] = label # type: ignore
+        self._set_running_true_2 = self._set_running_true
+        self._set_running_true = set_running_true
+        shown = self._running | self._set_running_true | self._set_running_true_2
+        if len(labels) == 0 and shown == self._shown_running:
+            return
+
+        # hold the record lock so the objects are not destroyed meanwhile
+        with self._server.record(allow_reentry=True):
+            destroyed = {obj for obj in shown if obj.is_destroyed()}
+            if destroyed: # forget objects destroyed while running
+                shown -= destroyed
+                self._running -= destroyed
+            for edge, label in labels.items():
+                if not edge.is_destroyed() and edge.label.get() != label:
+                    edge.label.set(label)
+            for obj in self._shown_running - shown:
+                self._running_nodes.remove(obj)
+            for obj in shown - self._shown_running:
+                self._running_nodes.append(obj)
+        self._shown_running = shown
+
+    def _drain_running_buffers(self) -> list[tuple[int, Node|Edge, bool, str|None]]:
+        reports = []
+        with self._running_buffers_lock:
+            buffers = list(self._running_buffers.items())
+        for thread, buffer in buffers:
+            # Taking the first n items and deleting them are each atomic, so appends meanwhile are kept
+            n = len(buffer)
+            if n > 0:
+                reports += buffer[:n]
+                del buffer[:n]
+            if not thread.is_alive():
+                with self._running_buffers_lock:
+                    self._running_buffers.pop(thread)
+                reports += buffer # reported between the deletion and the check
+        reports.sort(key=lambda report: report[0])
+        return reports
+
+    def _get_running_buffer(self) -> list[tuple[int, Node|Edge, bool, str|None]]:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = []
+            with self._running_buffers_lock:
+                self._running_buffers[threading.current_thread()] = buffer
+        return buffer
+
+    def set_running(self, node: Node|Edge, running: bool):
+        if self.workspace.headless:
+            return  # check_running_nodes doesn't run, so nothing would drain the buffers
+        self._get_running_buffer().append((next(self._running_seq), node, running, None))
+
+    def edge_pushed(self, edge: Edge, label: str):
+        """
+        Called by an edge when data is pushed to it. The running indicator and the label are sent on the next tick,
+        and only the last label counts.
+        """
+        self._get_running_buffer().append((next(self._running_seq), edge, True, label))
+
+    def set_pull_mode(self, nodes: list[Node], enabled: bool = True, incremental: bool = False) -> TopologicalPlan | None:
+        """
+        Switch the FunctionNodes among `nodes` between the push model and pull-based execution as one subgraph, which
+        recomputes only what changed if `incremental` is set. See :class:`.TopologicalPlan`. Other nodes are ignored.
+        A node can be in only one subgraph; nodes taken from another subgraph leave it. The subgraphs are saved with the
+        workspace.
+        """
+        from grapycal.sobjects.functionNode import FunctionNode  # avoid circular import
+
+        function_nodes = [node for node in nodes if isinstance(node, FunctionNode)]
+        if enabled:
+            self.graph.topological_order(function_nodes)  # raises CycleError before changing anything
+        for node in function_nodes:
+            if node._plan is not None:
+                node._plan.remove(node)
+        self.graph_version += 1  # fused regions may change
+        if not enabled or len(function_nodes) == 0:
+            self._save_pull_mode()
+            return None
+
+        plan = TopologicalPlan(self, function_nodes, incremental)
+        for node in function_nodes:
+            node._plan = plan
+        self._save_pull_mode()
+        plan.schedule()
+        return plan
+
+    def _save_pull_mode(self):
+        from grapycal.sobjects.functionNode import FunctionNode  # avoid circular import
+
+        plans: dict[TopologicalPlan, None] = {}  # in the order of the nodes
+        for child in self.get_children():
+            if isinstance(child, FunctionNode) and child._plan is not None:
+                plans[child._plan] = None
+        self.pull_mode.set([
+            {"nodes": [node.get_id() for node in plan.nodes if not node.is_destroyed()], "incremental": plan.incremental}
+            for plan in plans
+        ])
+
+    def _restore_pull_mode(self, subgraphs: list[dict[str, Any]]):
+        # Like set_pull_mode, but nothing is evaluated until the nodes are activated, as loading doesn't run nodes
+        from grapycal.sobjects.functionNode import FunctionNode  # avoid circular import
+
+        for subgraph in subgraphs:
+            nodes = [self._server.get_object(id) for id in subgraph["nodes"] if self._server.has_object(id)]
+            function_nodes = [node for node in nodes if isinstance(node, FunctionNode)]
+            if len(function_nodes) == 0:
+                continue
+            plan = TopologicalPlan(self, function_nodes, subgraph["incremental"])
+            for node in function_nodes:
+                node._plan = plan
+        self.graph_version += 1  # fused regions may change
+        self._save_pull_mode()
+
+    def _set_pull_mode_service(self, ids: list[str], enabled: bool = True, incremental: bool = False):
+        nodes = [self._server.get_object(id) for id in ids]
+        try:
+            plan = self.set_pull_mode([node for node in nodes if isinstance(node, Node)], enabled, incremental)
+        except CycleError as e:
+            user_logger.warning(f"Cannot use pull mode on nodes forming a cycle: {e}")
+            return
+        if plan is not None:
+            user_logger.info(f"Pull mode enabled on {len(plan.nodes)} nodes")
+        else:
+            user_logger.info("Pull mode disabled")
 
     def restore(self, nodes: list[SObjectSerialized], edges: list[SObjectSerialized]):
         # restore the nodes and edges
@@ -428,9 +576,7 @@ class Editor(SObject):
         
         # also include the edges connected to the nodes
         for node in nodes:
-            for port in node.in_ports.get() + node.out_ports.get():
-                for edge in port.edges:
-                    edges.add(edge)
+            edges |= self.graph.edges_of(node)
         
         # check for duplicate deletion
         # this happens when the previous delete message are still flying to the client
@@ -486,9 +632,7 @@ class Editor(SObject):
 
         # also include the edges connected to the nodes
         for node in nodes:
-            for port in node.in_ports.get() + node.out_ports.get():
-                for edge in port.edges:
-                    edges.add(edge)
+            edges |= self.graph.edges_of(node)
 
         # check for duplicate deletion
         # this happens when the previous delete message are still flying to the client
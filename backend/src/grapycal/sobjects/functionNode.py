@@ -1,11 +1,39 @@
+import threading
+from collections import deque
+from concurrent.futures import Future
 from typing import Any
+from grapycal.core.cache import content_hash
+from grapycal.core.fusion import FusedRegion, build_region
+from grapycal.core.topological import TopologicalPlan
 from grapycal.sobjects.edge import Edge
 from grapycal.sobjects.node import Node
+from grapycal.sobjects.port import InputPort, OutputPort
+from objectsync import Topic
 class FunctionNode(Node):
     inputs = []
     max_in_degree = []
     outputs = []
     display_port_names = True
+    use_process_pool = False
+    '''
+    If set to True, calculate() runs in the workspace's process pool instead of the runner thread. Use it for CPU-bound
+    nodes. calculate() must then only depend on its inputs, and the node class and the inputs must be picklable.
+    Otherwise calculate() runs in the runner thread as usual.
+    '''
+    pure = False
+    '''
+    Set to True if calculate() has no side effects and its result depends only on its inputs and the node's own
+    attributes and controls. Runs of connected pure nodes are then fused into one compiled function that passes values
+    directly, and only the edges leaving the run are updated in the UI. See FusedRegion.
+    '''
+    cacheable = False
+    '''
+    Set to True to reuse results. When calculate() gets inputs with the same content as before, the result is taken from
+    the workspace's ResultCache instead. Use it for expensive nodes whose result depends only on their inputs and the
+    node's own attributes and controls, and which return new objects that other nodes don't modify in place. Changing
+    the node's attributes or controls invalidates its results. Inputs whose content can't be hashed (see content_hash)
+    are never cached.
+    '''
 
     def build_node(self):
         self._max_in_degree = self.max_in_degree[:]
@@ -24,7 +52,26 @@ class FunctionNode(Node):
         self.label.set('f')
         self.shape.set('round')
 
+    def init(self):
+        # set before init_node() so subclasses overriding init_node() without calling super() still work
+        self._process_results: deque[tuple[Future, bytes | None]] = deque() # futures and the cache keys of their inputs
+        self._fused_region: FusedRegion | None = None
+        self._fused_version = -1 # the graph version the region was built for
+        self._plan: TopologicalPlan | None = None # set by Editor.set_pull_mode
+        self._func_ins: list[InputPort] | None = None # cached by _get_func_ins
+        self._func_outs: list[OutputPort] | None = None # cached by _get_func_outs
+        self._watched_ports: set[str] = set() # ids of the ports whose name changes invalidate those
+        self._inputs_lock = threading.Lock() # see _take_inputs
+        self.in_ports.on_set.add_raw(self._port_lists_changed)
+        self.out_ports.on_set.add_raw(self._port_lists_changed)
+        super().init()
+        if self.cacheable:
+            self._watch_for_invalidation()
+
     def edge_activated(self, edge: Edge, port):
+        if self._plan is not None:
+            self._plan.activate(self)
+            return
         for port in self._get_func_ins():
             if not port.is_all_edge_ready():
                 return
@@ -33,14 +80,116 @@ class FunctionNode(Node):
     def task(self):
         if self.is_destroyed():
             return
-        inputs = {}
-        for port in self._get_func_ins():
-            if port.max_edges.get() == 1:
-                inputs[port.get_name()] = port.edges[0].get_data()
+        inputs = self._take_inputs()
+        if inputs is None:
+            return
+
+        if self.use_process_pool:
+            key = self._get_cache_key(inputs)
+            hit, result = self._lookup_cache(key)
+            if hit:
+                future = Future()
+                future.set_result(result)
             else:
-                inputs[port.get_name()] = [edge.get_data() for edge in port.edges]
+                future = self.workspace.process_pool.submit(type(self), inputs)
+                if future is None and len(self._process_results) > 0:
+                    # The inputs can't be sent to the pool. Calculate here, but push after the results still pending.
+                    future = Future()
+                    try:
+                        future.set_result(self.calculate_cached(inputs))
+                    except Exception as e:
+                        future.set_exception(e)
+                    key = None # cached by calculate_cached
+            if future is not None:
+                self._process_results.append((future, None if hit else key))
+                future.add_done_callback(lambda _: self.run(self._push_process_results))
+                return
+
+        region = self._get_fused_region()
+        if region is not None:
+            region.run(inputs)
+            return
+
+        self._push_result(self.calculate_cached(inputs))
+
+    def _take_inputs(self) -> dict[str, Any] | None:
+        '''
+        Take the data of the inputs if all of them are ready, or return None. Producers running on different workers
+        may both see the inputs ready and run the task twice, so the check and the taking are one step, and the second
+        task finds nothing to take.
+        '''
+        with self._inputs_lock:
+            ports = self._get_func_ins()
+            for port in ports:
+                if not port.is_all_edge_ready():
+                    return None
+            inputs = {}
+            for port in ports:
+                if port.max_edges.get() == 1:
+                    inputs[port.get_name()] = port.edges[0].get_data()
+                else:
+                    inputs[port.get_name()] = [edge.get_data() for edge in port.edges]
+            return inputs
+
+    def _push_process_results(self):
+        # Push in submission order so the outputs keep the order of the inputs
+        while len(self._process_results) > 0 and self._process_results[0][0].done():
+            future, key = self._process_results.popleft()
+            if self.is_destroyed():
+                continue
+            try:
+                result = future.result()
+            except Exception as e:
+                # reported here, so the results queued behind it are still pushed
+                self.stats.record_exception()
+                self.print_exception(e, truncate=1)
+                continue
+            if key is not None:
+                self.workspace.result_cache.put(self.get_id(), key, result)
+            self._push_result(result)
+
+    def calculate_cached(self, inputs: dict[str, Any]) -> Any:
+        '''
+        Call calculate() with the inputs, or take the result from the cache if the node is cacheable.
+        '''
+        key = self._get_cache_key(inputs)
+        hit, result = self._lookup_cache(key)
+        if hit:
+            return result
         result = self.calculate(**inputs)
+        if key is not None:
+            self.workspace.result_cache.put(self.get_id(), key, result)
+        return result
+
+    def invalidate_cache(self):
+        '''
+        Discard the cached results of this node.
+        '''
+        self.workspace.result_cache.invalidate(self.get_id())
+
+    def _get_cache_key(self, inputs: dict[str, Any]) -> bytes | None:
+        if not self.cacheable or not self.workspace.result_cache.is_enabled():
+            return None
+        return content_hash(inputs)
+
+    def _lookup_cache(self, key: bytes | None) -> tuple[bool, Any]:
+        if not self.cacheable or not self.workspace.result_cache.is_enabled():
+            return False, None
+        if key is None:
+            self.stats.record_cache_lookup(False)
+            return False, None
+        hit, result = self.workspace.result_cache.get(self.get_id(), key)
+        self.stats.record_cache_lookup(hit)
+        return hit, result
+
+    def _watch_for_invalidation(self):
+        # Results depend on the settings of the node, so changing any of them invalidates the results
+        for obj in [self, *self.controls.get().values()]:
+            for name, topic in obj._attributes.items():
+                if isinstance(topic, Topic) and topic.is_stateful() and name != 'translation':
+                    topic.on_set.add_raw(lambda *_: self.invalidate_cache())
 
+    def _push_result(self, result):
         if len(self._get_func_outs()) == 1:
             self._get_func_outs()[0].push_data(result)
         else:
@@ -49,6 +198,25 @@ class FunctionNode(Node):
             for k,v in result.items():
                 self.get_out_port(k).push_data(v)
 
+    def _get_fused_region(self) -> FusedRegion | None:
+        if not self.pure or self.editor is None or self._plan is not None:
+            return None
+        if self._fused_version != self.editor.graph_version:
+            self._fused_region = build_region(self)
+            self._fused_version = self.editor.graph_version
+        return self._fused_region
+
+    def get_adjacent_node_ids(self) -> set[str]:
+        # The task of a fused region runs and pushes for all of its nodes
+        ids = super().get_adjacent_node_ids()
+        region = self._get_fused_region()
+        if region is not None:
+            for node in region.nodes[1:]:
+                ids.add(node.get_id())
+                ids |= node.get_adjacent_node_ids()
+            ids.discard(self.get_id())
+        return ids
+
     def calculate(self, **inputs)->Any:
         '''
         Define the function of this node here.
@@ -71,12 +239,18 @@ class FunctionNode(Node):
         raise NotImplementedError
 
     def input_edge_added(self, edge: Edge, port):
+        if self._plan is not None:
+            self._plan.schedule()
+            return
         for port in self._get_func_ins():
             if not port.is_all_edge_ready():
                 return
         self.run(self.task)
 
     def input_edge_removed(self, edge: Edge, port):
+        if self._plan is not None:
+            self._plan.schedule()
+            return
         for port in self._get_func_ins():
             if not port.is_all_edge_ready():
                 return
@@ -84,19 +258,31 @@ class FunctionNode(Node):
 
     def remove(self):
         return super().remove()
-    
-    def _get_func_ins(self):
-        res = []
-        for port in self.in_ports:
-            if port.get_name() in self.inputs:
-                res.append(port)
 
-        return res
+    def destroy(self):
+        if self.cacheable:
+            self.invalidate_cache()
+        return super().destroy()
     
-    def _get_func_outs(self):
-        res = []
-        for port in self.out_ports:
-            if port.get_name() in self.outputs:
-                res.append(port)
+    def _port_lists_changed(self, *_):
+        self._func_ins = None
+        self._func_outs = None
+
+    def _watch_port_names(self, ports):
+        # the ports are picked by name, so renaming one changes the lists too
+        for port in ports:
+            if port.get_id() not in self._watched_ports:
+                self._watched_ports.add(port.get_id())
+                port.name.on_set.add_raw(self._port_lists_changed)
 
-        return res
\ No newline at end of file
+    def _get_func_ins(self) -> list[InputPort]:
+        if self._func_ins is None:
+            self._watch_port_names(self.in_ports)
+            self._func_ins = [port for port in self.in_ports if port.get_name() in self.inputs]
+        return self._func_ins
+    
+    def _get_func_outs(self) -> list[OutputPort]:
+        if self._func_outs is None:
+            self._watch_port_names(self.out_ports)
+            self._func_outs = [port for port in self.out_ports if port.get_name() in self.outputs]
+        return self._func_outs
\ No newline at end of file
@@ -4,6 +4,9 @@ import io
 from itertools import count
 import logging
 import random
+import sys
+import threading
+import time
 from grapycal.sobjects.controls.buttonControl import ButtonControl
 from grapycal.sobjects.controls.imageControl import ImageControl
 from grapycal.sobjects.controls.linePlotControl import LinePlotControl
@@ -17,7 +20,11 @@ from grapycal.utils.logging import error_extension, user_logger, warn_extension
 from contextlib import contextmanager
 import functools
 import traceback
-from typing import TYPE_CHECKING, Any, Callable, Generator, Literal, Self, TypeVar
+from typing import TYPE_CHECKING, Any, Callable, Generator, Hashable, Iterator, Literal, Self, TypeVar
+from grapycal.core.background_runner import Backpressure, CancellationToken, Priority, TaskCancelled
+from grapycal.core.output_log import OutputLog
+from grapycal.core.runtime_state import PortState
+from grapycal.core.stats import NodeStats
 from grapycal.extension.utils import NodeInfo
 from grapycal.sobjects.controls.control import Control, ValuedControl
 from grapycal.sobjects.edge import Edge
@@ -163,6 +170,14 @@ class Node(SObject, metaclass=NodeMeta):
     category = "hidden"
     instance: Self  # The singleton instance. Used by singleton nodes.
     _deprecated = False  # TODO: If set to True, the node will be marked as deprecated in the inspector.
+    backpressure: Backpressure = "yield"
+    """
+    What happens to the node's background tasks when the runner is full: ``block`` waits for room, ``drop`` discards
+    the task, and ``yield`` accepts it but pauses the node's iterations (tasks run with `to_queue=False` and generator
+    tasks) until the runner catches up. ``block`` is meant for nodes fed from their own producer threads; on the runner's
+    workers and the communication thread, where the UI's events run nodes, it acts like ``yield``. See
+    :meth:`.BackgroundRunner.push`.
+    """
 
     @classmethod
     def get_def_order(cls):
@@ -282,13 +297,18 @@ class Node(SObject, metaclass=NodeMeta):
         self.on("double_click", self.double_click, is_stateful=False)
         self.on("spawn", self.spawn, is_stateful=False)
 
-        self._output_stream = OutputStream(self.raw_print)
-        self._output_stream.set_event_loop(
-            self.workspace.get_communication_event_loop()
-        )
-        self.workspace.get_communication_event_loop().create_task(
-            self._output_stream.run()
-        )
+        self.stats = NodeStats(self.get_type_name())
+        if self.editor is not None: # preview nodes in the sidebar are not tracked
+            self.workspace.add_node_stats(self.get_id(), self.stats)
+
+        self._cancellation_token = CancellationToken() # given to tasks pushed from now on
+        self._port_states: tuple[list[PortState], list[PortState]] | None = None # cached by _get_port_states
+        self.in_ports.on_set.add_raw(self._invalidate_port_states)
+        self.out_ports.on_set.add_raw(self._invalidate_port_states)
+        self._current_task: tuple[CancellationToken, int] | None = None # token and thread of the running task
+
+        self._output_log = OutputLog(self.output, self.workspace.output_flusher, self.workspace.get_output_spill(self))
+        self._output_stream = OutputStream(self.raw_print, self.workspace.output_flusher)
 
         from grapycal.sobjects.workspaceObject import WorkspaceObject
 
@@ -425,6 +445,7 @@ class Node(SObject, metaclass=NodeMeta):
         Note: Overrided methods should call return super().destroy() at the end.
         """
         self._output_stream.close()
+        self._output_log.close()
         for port in self.in_ports:
             if len(port.edges) > 0:
                 raise RuntimeError(
@@ -440,6 +461,7 @@ class Node(SObject, metaclass=NodeMeta):
         
         if self.editor is not None:
             self.editor.set_running(self, False)
+            self.workspace.remove_node_stats(self.get_id())
         return super().destroy()
 
     T = TypeVar("T", bound=ValuedControl)
@@ -833,15 +855,23 @@ class Node(SObject, metaclass=NodeMeta):
     def raw_print(self, data):
         if data == "":
             return
-        if self.is_destroyed():
+        if self.workspace.headless:
+            sys.stdout.write(data)
+        elif self.is_destroyed():
             logger.debug(
                 f"Output received from a destroyed node {self.get_id()}: {data}"
             )
         else:
-            if len(self.output) > 100:
-                self.output.set([])
-                self.output.insert(["error", "Too many output lines. Cleared.\n"])
-            self.output.insert(["output", data])
+            self._output_log.append("output", data)
+
+    def read_output_log(self, page: int = 0) -> dict | None:
+        """
+        Read a page of the node's full output, counting from the end, if the workspace spills output to disk (see
+        ``--output-log-dir``). The `output` attribute only keeps the latest entries.
+        """
+        if self._output_log.spill is None:
+            return None
+        return self._output_log.spill.read_page(page)
 
     """
     Run tasks in the background or foreground, redirecting stdout to the node's output stream.
@@ -853,46 +883,108 @@ class Node(SObject, metaclass=NodeMeta):
         Returns a context manager that redirects stdout to the node's output stream.
         """
 
-        try:
-            self._output_stream.enable_flush()
-            with self.workspace.redirect(self._output_stream):
-                yield
-        finally:
-            self._output_stream.disable_flush()
+        if self.workspace.headless:
+            yield # stdout goes to the terminal
+            return
+        with self.workspace.redirect(self._output_stream):
+            yield
 
     def _run_in_background(
-        self, task: Callable[[], None], to_queue=True, redirect_output=False
+        self,
+        task: Callable[[], None],
+        to_queue=True,
+        redirect_output=False,
+        priority: Priority = "normal",
+        coalesce_key: Hashable | None = None,
     ):
         """
         Run a task in the background thread.
         """
 
-        def exception_callback(e):
-            self.print_exception(e, truncate=3)
-            if isinstance(e, KeyboardInterrupt):
-                self.workspace.send_message_to_all("Runner interrupted by user.")
-            self.workspace.background_runner.set_exception_callback(None)
-            self.workspace.clear_edges()
+        # Tasks pushed by a running task of this node share its token, so cancelling stops chains like ProcedureNode.next.
+        token = self.get_cancellation_token()
+
+        def run_in_context(step: Callable[[], Any]):
+            return self._run_in_context(step, token, redirect_output)
+
+        def steps(iterator: Iterator):
+            # The runner advances a returned generator one step at a time, after this task has returned, so each step
+            # is run in the node's context too
+            done = object()
+            try:
+                while not token.is_cancelled():
+                    if run_in_context(lambda: next(iterator, done)) is done:
+                        return
+                    yield
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
 
         def wrapped():
-            self.set_running(True)
-            self.workspace.background_runner.set_exception_callback(exception_callback)
+            if token.is_cancelled():
+                return
+            ret = run_in_context(task)
+            if ret is not None:
+                return steps(iter(ret))
+            return ret
+
+        runner = self.workspace.background_runner
+        if runner.get_num_workers() > 1:
+            # Tasks of adjacent nodes must not run concurrently because they exchange data through edges.
+            conflicts = self.get_adjacent_node_ids()
+        else:
+            conflicts = ()
+        runner.push(
+            wrapped,
+            to_queue=to_queue,
+            group=self.get_id(),
+            conflicts=conflicts,
+            priority=priority,
+            coalesce_key=None if coalesce_key is None else (self.get_id(), coalesce_key),
+            backpressure=self.backpressure,
+        )
+
+    def _run_in_context(self, step: Callable[[], Any], token: CancellationToken, redirect_output=False):
+        """
+        Run a step of a task of this node in the current worker thread. Exceptions are reported on the node and the
+        step sees `token` as the node's cancellation token.
+        """
+        self.set_running(True)
+        self.workspace.background_runner.set_exception_callback(self._task_exception_callback)
+        outer_task = self._current_task
+        self._current_task = (token, threading.get_ident())
+        start = time.perf_counter()
+        try:
             if redirect_output:
                 with self._redirect_output():
-                    ret = task()
+                    ret = step()
             else:
-                ret = task()
-            self.set_running(False)
-            self.workspace.background_runner.set_exception_callback(None)
-            return ret
-
-        self.workspace.background_runner.push(wrapped, to_queue=to_queue)
+                ret = step()
+        except TaskCancelled:
+            ret = None
+        finally:
+            self._current_task = outer_task
+            self.stats.record_task(time.perf_counter() - start)
+        self.set_running(False)
+        self.workspace.background_runner.set_exception_callback(None)
+        return ret
+
+    def _task_exception_callback(self, e: Exception | KeyboardInterrupt):
+        if isinstance(e, Exception):
+            self.stats.record_exception()
+        self.print_exception(e, truncate=3)
+        if isinstance(e, KeyboardInterrupt):
+            self.workspace.send_message_to_all("Runner interrupted by user.")
+        self.workspace.background_runner.set_exception_callback(None)
+        self.workspace.clear_edges()
 
     def _run_directly(self, task: Callable[[], None], redirect_output=False):
         """
         Run a task in the current thread.
         """
         self.set_running(True)
+        start = time.perf_counter()
         try:
             if redirect_output:
                 with self._redirect_output():
@@ -900,7 +992,9 @@ class Node(SObject, metaclass=NodeMeta):
             else:
                 task()
         except Exception as e:
+            self.stats.record_exception()
             self.print_exception(e, truncate=1)
+        self.stats.record_task(time.perf_counter() - start)
         self.set_running(False)
 
     def run(
@@ -910,6 +1004,8 @@ class Node(SObject, metaclass=NodeMeta):
         to_queue=True,
         redirect_output=False,
         *args,
+        priority: Priority = "normal",
+        coalesce_key: Hashable | None = None,
         **kwargs,
     ):
         """
@@ -922,40 +1018,112 @@ class Node(SObject, metaclass=NodeMeta):
 
             - to_queue: This argument is used only when `background` is True. If set to True, the task will be pushed to the :class:`.BackgroundRunner`'s queue.\
             If set to False, the task will be pushed to its stack. See :class:`.BackgroundRunner` for more details.
+
+            - priority: This argument is used only when `background` is True. Can be ``interactive`` (tasks triggered by the user), ``normal``, or ``bulk`` (long-running work\
+            such as training loops). Higher priorities get a larger share of the runner, but lower ones are never starved.
+
+            - coalesce_key: This argument is used only when `background` is True. If given, a task of this node with the same key that is still waiting\
+            to run is replaced by this one. Use it when only the latest task matters, e.g. displaying the newest frame of a stream.
         """
         task = functools.partial(task, *args, **kwargs)
         if background:
-            self._run_in_background(task, to_queue, redirect_output=False)
+            self._run_in_background(task, to_queue, redirect_output=False, priority=priority, coalesce_key=coalesce_key)
         else:
             self._run_directly(task, redirect_output=False)
 
+    def get_cancellation_token(self) -> CancellationToken:
+        """
+        Get the cancellation token of the node's task running in the current thread. Long-running tasks should check it
+        regularly or wait with its ``sleep`` method, so they stop when the node is cancelled. See :class:`.CancellationToken`.
+        """
+        if self._current_task is not None and self._current_task[1] == threading.get_ident():
+            return self._current_task[0]
+        return self._cancellation_token
+
+    def cancel(self, downstream=False):
+        """
+        Cancel the node's tasks without affecting other nodes. Pending tasks are removed, generator tasks are closed, and
+        the running task is asked to stop through its cancellation token. A node in a pull-mode subgraph also drops the
+        subgraph's pending evaluation, which skips the other nodes of the subgraph until the next activation.
+
+        Args:
+            - downstream: If set to True, the nodes receiving data from this node, directly or indirectly, are cancelled too.
+        """
+        nodes = [self]
+        if downstream:
+            nodes += self.get_downstream_nodes()
+        self.workspace.cancel(nodes)
+
+    def _renew_cancellation_token(self):
+        self._cancellation_token.cancel()
+        self._cancellation_token = CancellationToken()
+
+    def get_downstream_nodes(self) -> list["Node"]:
+        """
+        Get the nodes that receive data from this node, directly or indirectly.
+        """
+        found = {self.get_id(): self}
+        to_visit = [self]
+        while to_visit:
+            node = to_visit.pop()
+            for port in node.out_ports:
+                for edge in port.edges:
+                    head = edge.get_head().node
+                    if head.get_id() not in found:
+                        found[head.get_id()] = head
+                        to_visit.append(head)
+        del found[self.get_id()]
+        return list(found.values())
+
+    def get_adjacent_node_ids(self) -> set[str]:
+        """
+        Get the ids of the nodes connected to this node by an edge.
+        """
+        # Called for every task pushed, so it walks the port states instead of the topics
+        in_states, out_states = self._get_port_states()
+        ids = set()
+        for port in in_states:
+            for edge in port.edges:
+                if edge.tail is not None:
+                    ids.add(edge.tail.node_id)
+        for port in out_states:
+            for edge in port.edges:
+                if edge.head is not None:
+                    ids.add(edge.head.node_id)
+        ids.discard(self.get_id())
+        return ids
+
+    def _get_port_states(self) -> tuple[list[PortState], list[PortState]]:
+        if self._port_states is None:
+            self._port_states = ([port._state for port in self.in_ports], [port._state for port in self.out_ports])
+        return self._port_states
+
+    def _invalidate_port_states(self, *_):
+        self._port_states = None
+
     def print_exception(self, e, truncate=0):
         message = "".join(traceback.format_exception(e)[truncate:])
-        if self.is_destroyed():
+        if self.workspace.headless:
+            logger.error(f"Exception in {self.get_type_name()} {self.get_id()}:\n{message}")
+        elif self.is_destroyed():
             logger.warning(
                 f"Exception occured in a destroyed node {self.get_id()}: {message}"
             )
         else:
             self.set_running(False)
-            if len(self.output) > 100:
-                self.output.set([])
-                self.output.insert(["error", "Too many output lines. Cleared.\n"])
-            self.output.insert(["error", message])
+            self._output_log.append("error", message)
 
     def flash_running_indicator(self):
         self.set_running(True)
         self.set_running(False)
 
     def set_running(self, running: bool):
-        with self._server.record(
-            allow_reentry=True
-        ):  # aquire the lock to prevent setting the attribute while the sobject being deleted
-            if self.is_destroyed():
-                return
-            if running:
-                self.editor.set_running(self, True)
-            else:
-                self.editor.set_running(self, False)
+        if self.workspace.headless:
+            return # nobody is watching
+        if self.editor is None or self.is_destroyed():
+            return
+        # Buffered by the editor, which sends it on the next tick. No need to hold the record lock here.
+        self.editor.set_running(self, running)
 
     """
     Node events
@@ -2,11 +2,13 @@ import abc
 from hmac import new
 from typing import TYPE_CHECKING, Any, List, Literal
 import typing
+from grapycal.core.runtime_state import PortState
 from grapycal.sobjects.controls.control import ValuedControl
 from grapycal.sobjects.controls.nullControl import NullControl
 from objectsync import SObject, StringTopic, IntTopic
 
 from grapycal.utils.misc import Action
+from grapycal.utils.sizing import estimate_size
 
 if TYPE_CHECKING:
     from grapycal.sobjects.node import Node
@@ -26,16 +28,37 @@ class Port(SObject):
     def init(self):
         self.edges: List[Edge] = []
         self.node: Node = self.get_parent() # type: ignore
+        self._state = PortState(self, self.node.get_id())
     
     def add_edge(self, edge:'Edge'):
         if len(self.edges) >= self.max_edges.get():
             raise Exception('Max edges reached')
         self.edges.append(edge)
+        self._state.edges.append(edge._state)
+        self._graph_changed()
     
     def remove_edge(self, edge:'Edge'):
         if edge not in self.edges:
             return
         self.edges.remove(edge)
+        self._state.edges.remove(edge._state)
+        self._graph_changed()
+
+    def _graph_changed(self):
+        editor = self.node.editor
+        if editor is not None:
+            editor.graph_version += 1
+
+    def _edge_linked(self, edge: 'Edge', linked: bool):
+        # Keeps the editor's graph index in sync. Only edges with both ends connect two nodes.
+        editor = self.node.editor
+        state = edge._state
+        if editor is None or state.tail is None or state.head is None:
+            return
+        if linked:
+            editor.graph.add(edge)
+        else:
+            editor.graph.remove(edge)
 
     def is_full(self):
         return len(self.edges) >= self.max_edges.get()
@@ -66,17 +89,30 @@ class InputPort(Port, typing.Generic[T]):
 
     def add_edge(self, edge: 'Edge'):
         super().add_edge(edge)
+        with self._state.lock:
+            edge._state.head = self._state
+            if edge._state.ready:
+                self._state.num_ready += 1
+        self._edge_linked(edge, True)
         self.node.input_edge_added(edge, self)
         self.use_default = 0
 
     def remove_edge(self, edge: 'Edge'):
+        if edge in self.edges:
+            self._edge_linked(edge, False)
+            with self._state.lock:
+                if edge._state.ready:
+                    self._state.num_ready -= 1
+                edge._state.head = None
         super().remove_edge(edge)
         self.node.input_edge_removed(edge, self)
         self.use_default = len(self.edges) == 0 and not isinstance(self.default_control, NullControl)
 
     def is_all_edge_ready(self):
+        # O(1) instead of checking every edge, which made each activation of a port with many edges O(edges)
+        state = self._state
         return (self.use_default and self.default_control.value_ready()) or \
-            (all(edge.is_data_ready() for edge in self.edges) and len(self.edges) > 0)
+            (state.num_ready == len(state.edges) and len(state.edges) > 0)
 
     def get_data(self):
         return [self.default_control.get_value()] if self.use_default else \
@@ -103,6 +139,7 @@ class InputPort(Port, typing.Generic[T]):
         self.activated(control)
 
     def activated(self, source: 'Edge|ValuedControl'):
+        self.node.stats.record_activation()
         self.on_activate.invoke(self, source)
         self.node.edge_activated(source, self)
 
@@ -122,11 +159,16 @@ class OutputPort(Port):
 
     def add_edge(self, edge:'Edge'):
         super().add_edge(edge)
+        edge._state.tail = self._state
+        self._edge_linked(edge, True)
         if self._retain:
             edge.push_data(self._retained_data)
         self.node.output_edge_added(edge, self)
 
     def remove_edge(self, edge:'Edge'):
+        if edge in self.edges:
+            self._edge_linked(edge, False)
+            edge._state.tail = None
         super().remove_edge(edge)
         self.node.output_edge_removed(edge, self)
 
@@ -135,11 +177,18 @@ class OutputPort(Port):
         Push data to all connected edges.
         If retain is True, the data will be pushed to all future edges when they're connected as well.
         '''
+        workspace = self.node.workspace
+        size = None # measured once here for all the edges
+        if workspace.measure_sizes:
+            size = estimate_size(data)
+            self.node.stats.record_output(size)
         if retain:
             self._retain = True
             self._retained_data = data
+            if size is not None:
+                workspace.memory.hold(self, size)
         for edge in self.edges:
-            edge.push_data(data,label=label)
+            edge.push_data(data,label=label,size=size)
 
     def disable_retain(self):
         '''
@@ -147,3 +196,8 @@ class OutputPort(Port):
         '''
         self._retain = False
         self._retained_data = None # Release memory
+        self.node.workspace.memory.release(self)
+
+    def destroy(self):
+        self.node.workspace.memory.release(self)
+        return super().destroy()
@@ -23,7 +23,7 @@ class SourceNode(Node):
         pass
 
     def double_click(self):
-        self.run(self.task)
+        self.run(self.task, priority='interactive')
 
     def on_activate(self, edge:Edge, port:InputPort):
         self.run_port.get_data() # clear data_ready so UI looks resonable 
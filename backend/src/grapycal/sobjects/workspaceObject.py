@@ -67,7 +67,8 @@ class WorkspaceObject(SObject):
             )
             self._server.clear_history()
 
-        self._workspace.add_task_to_event_loop(add_examples_file_view())
+        if not self._workspace.headless:
+            self._workspace.add_task_to_event_loop(add_examples_file_view())
 
         # read by frontend
         self.add_attribute("main_editor", ObjTopic).set(self.main_editor)
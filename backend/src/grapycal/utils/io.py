@@ -1,86 +1,78 @@
 import gzip
+import io
 import logging
 import os
+import zlib
 
 import grapycal
 logger = logging.getLogger(__name__)
 
+import contextlib
 import json
-import asyncio
-import io
-import threading
-from typing import Any, Callable, Tuple
+from typing import TYPE_CHECKING, Any, Callable, ContextManager, Tuple
+
+if TYPE_CHECKING:
+    from grapycal.core.output_log import OutputLog
 
 class OutputStream:
-    def __init__(self, on_flush:Callable[[str],None], hz=20):
-        self._stream = io.StringIO()
-        self._enables = 0
-        self._enable_flush_event = asyncio.Event()
-        self._lock = threading.Lock()
-        self._exit_flag = False
+    '''
+    A file-like object collecting what a node prints. It does nothing on its own: the first write after a flush marks
+    it dirty in the OutputFlusher, which flushes it on the next tick.
+    '''
+    def __init__(self, on_flush:Callable[[str],None], flusher:'OutputFlusher'):
+        self._chunks: list[str] = []
+        self._dirty = False
+        self._closed = False
         self._on_flush = on_flush
-        self._gap = 1/hz
-
-    def set_event_loop(self, event_loop):
-        self._event_loop = event_loop
-
-    async def run(self):
-        self._event_loop = asyncio.get_running_loop()
-        while True:
-            if self._exit_flag:
-                self._stream.close()
-                return
-            await self._enable_flush_event.wait()
-            if self._exit_flag:
-                self._stream.close()
-                return
-            while self._enables > 0:
-                if self._exit_flag:
-                    self._stream.close()
-                    return
-                # read
-                self._stream.seek(0)
-                data = self._stream.read()
-                # clear
-                self._stream.seek(0)
-                self._stream.truncate()
-                self._on_flush(data)
-                await asyncio.sleep(self._gap)
-
-            self._enable_flush_event.clear()
-
-            # read
-            self._stream.seek(0)
-            data = self._stream.read()
-            # clear
-            self._stream.seek(0)
-            self._stream.truncate()
-            self._on_flush(data)
+        self._flusher = flusher
 
     def write(self, data):
-        # Is stream thread safe?
-        # locking makes deadlock
-        self._stream.write(data)
+        # No lock. Appending is atomic, and flush() only removes what it has read.
+        self._chunks.append(data)
+        if not self._dirty and not self._closed:
+            self._dirty = True
+            self._flusher.add(self)
 
     def flush(self): # dummy
         return
-    
-    def enable_flush(self):
-        self._event_loop.call_soon_threadsafe(self._enable_flush)
-        
-    def _enable_flush(self):
-        self._enables += 1
-        self._enable_flush_event.set()
-
-    def disable_flush(self):
-        self._event_loop.call_soon_threadsafe(self._disable_flush)
 
-    def _disable_flush(self):
-        self._enables -= 1
+    def _flush(self):
+        # Unmark before reading, so a write after the read marks the stream again
+        self._dirty = False
+        n = len(self._chunks)
+        if n == 0:
+            return
+        data = ''.join(self._chunks[:n])
+        del self._chunks[:n]
+        self._on_flush(data)
 
     def close(self):
-        self._exit_flag = True
-        self._enable_flush_event.set()
+        self._closed = True
+        self._chunks = []
+
+class OutputFlusher:
+    '''
+    Flushes the dirty OutputStreams and OutputLogs of a workspace, all in one go, on each tick of the workspace clock.
+    '''
+    def __init__(self, record: Callable[[], ContextManager] = contextlib.nullcontext):
+        self._dirty: list['OutputStream|OutputLog'] = []
+        self._record = record # the workspace records each flush as one transition
+
+    def add(self, item: 'OutputStream|OutputLog'):
+        self._dirty.append(item)
+
+    def flush(self):
+        if len(self._dirty) == 0:
+            return
+        with self._record():
+            # flushing a stream appends to the log of its node, which is then flushed in the same tick
+            while len(self._dirty) > 0:
+                n = len(self._dirty)
+                items = self._dirty[:n]
+                del self._dirty[:n]
+                for item in items:
+                    if not item._closed:
+                        item._flush()
 
 from functools import partial
 def write_workspace(path:str,metadata,data:Any,compress=False):
@@ -91,19 +83,44 @@ def write_workspace(path:str,metadata,data:Any,compress=False):
 
     with open_func() as f:
         f.write(grapycal.__version__+'\n')
-        json.dump(metadata,f)
+        f.write(json.dumps(metadata))
         f.write('\n')
-        json.dump(data,f)
+        # one write instead of the many small ones of json.dump, which are slow through gzip
+        f.write(json.dumps(data))
         
     # retun compressed file size
     return os.path.getsize(path)
 
-def read_workspace(path,metadata_only=False) -> Tuple[str,Any,Any]:
+def compress_workspace(metadata,data:Any) -> bytes:
+    '''
+    The content of a compressed workspace file, to be written later.
+    '''
+    return gzip.compress((grapycal.__version__+'\n'+json.dumps(metadata)+'\n'+json.dumps(data)).encode('utf-8'))
+
+def append_workspace_journal(path:str,entry:Any):
+    '''
+    Append a journal entry to a compressed workspace file, as a gzip member of its own. gzip readers read the members
+    of a file one after another, so the entry becomes the next line after the data, or after the last entry.
+    '''
+    with open(path,'ab') as f:
+        f.write(gzip.compress(('\n'+json.dumps(entry)).encode('utf-8')))
+    return os.path.getsize(path)
+
+def is_compressed(path) -> bool:
     # see if first two bytes are 1f 8b
     with open(path,'rb') as f:
         magic_number = f.read(2)
-    if magic_number == b'\x1f\x8b':
-        open_func = partial(gzip.open,path,'rt')
+    return magic_number == b'\x1f\x8b'
+
+def read_workspace(path,metadata_only=False) -> Tuple[str,Any,Any]:
+    '''
+    Read a workspace file. The journal entries after the data, if any, are replayed onto it, see WorkspaceJournal.
+    With metadata_only, only the version and the metadata of the base snapshot are read.
+    '''
+    if is_compressed(path) and metadata_only:
+        open_func = partial(_open_header,path)
+    elif is_compressed(path):
+        open_func = partial(_open_journaled,path)
     else:
         open_func = partial(open,path,'r',encoding='utf-8')
 
@@ -123,9 +140,94 @@ def read_workspace(path,metadata_only=False) -> Tuple[str,Any,Any]:
         f.seek(0)
         version = f.readline().strip()
         metadata = json.loads(f.readline())
-        data = json.loads(f.readline()) if not metadata_only else None
+        if metadata_only:
+            return version, metadata, None
+        data = json.loads(f.readline())
+        replay_workspace_journal(metadata, data, _read_journal(f, path))
     return version, metadata, data
 
+def _open_header(path):
+    # Only the first lines are needed, so don't decompress the whole file, unless it's small enough that gzip.open
+    # reads ahead into an incomplete journal entry.
+    f = gzip.open(path,'rt')
+    try:
+        f.readline()
+        f.readline()
+    except EOFError:
+        f.close()
+        return _open_journaled(path)
+    f.seek(0)
+    return f
+
+def _open_journaled(path):
+    # Decompress the gzip members one by one instead of with gzip.open, which fails on the whole file if the last
+    # member is incomplete, e.g. when the process was killed while appending a journal entry.
+    with open(path,'rb') as f:
+        raw = f.read()
+    chunks = []
+    while len(raw) > 0:
+        decompressor = zlib.decompressobj(wbits=31) # 31: with the gzip header
+        try:
+            chunk = decompressor.decompress(raw)
+        except zlib.error:
+            chunk = None
+        if chunk is None or not decompressor.eof:
+            logger.warning(f'{path} ends with an incomplete journal entry. It is ignored.')
+            break
+        chunks.append(chunk)
+        raw = decompressor.unused_data
+    return io.StringIO(b''.join(chunks).decode('utf-8'))
+
+def _read_journal(f, path):
+    while True:
+        line = f.readline()
+        if line == '':
+            return
+        yield json.loads(line)
+
+def replay_workspace_journal(metadata, data, entries):
+    '''
+    Apply journal entries to the metadata and data of a workspace snapshot, in place. Each entry has the metadata and
+    the data fields other than the workspace (extensions and id counts), the ids of the objects removed since the last
+    entry, and the objects changed or created since then, without their children, parents first.
+    '''
+    workspace = data['workspace_serialized']
+    index = {} # id -> (serialized object, serialized parent)
+    def add_to_index(obj, parent):
+        index[obj['id']] = (obj, parent)
+        for child in obj['children'].values():
+            add_to_index(child, obj)
+    def remove_from_index(obj):
+        del index[obj['id']]
+        for child in obj['children'].values():
+            remove_from_index(child)
+    add_to_index(workspace, None)
+
+    for entry in entries:
+        metadata.update(entry['metadata'])
+        data.update(entry['data'])
+        for id in entry['removed']:
+            if id not in index:
+                continue
+            obj, parent = index[id]
+            remove_from_index(obj)
+            if parent is not None:
+                del parent['children'][id]
+        for parent_id, changed in entry['objects']:
+            id = changed['id']
+            if id in index:
+                obj, parent = index[id]
+                obj.update({key: value for key, value in changed.items() if key != 'children'})
+                if parent is not None and parent['id'] != parent_id: # moved to another parent
+                    del parent['children'][id]
+                    new_parent = index[parent_id][0]
+                    new_parent['children'][id] = obj
+                    index[id] = (obj, new_parent)
+            elif parent_id in index:
+                parent = index[parent_id][0]
+                parent['children'][id] = changed
+                index[id] = (changed, parent)
+
     
 def file_exists(path):
     try:
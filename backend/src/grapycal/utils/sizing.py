@@ -0,0 +1,48 @@
+import sys
+from typing import Any
+
+try:
+    import torch
+    HAS_TORCH = True
+except:
+    HAS_TORCH = False
+
+try :
+    import numpy as np
+    HAS_NUMPY = True
+except:
+    HAS_NUMPY = False
+
+# Containers longer than this are estimated from their first items, so sizing a long list stays cheap.
+_SAMPLE = 64
+
+def estimate_size(data: Any, depth: int = 2) -> int:
+    '''
+    Estimate the number of bytes held by an object. Arrays and tensors count their buffers. Lists, tuples, sets and
+    dicts are looked into up to `depth` levels, and objects appearing in them more than once are counted each time.
+    Other objects count only themselves (sys.getsizeof), so what they reference is missed.
+    '''
+    if HAS_NUMPY and isinstance(data, np.ndarray):
+        return data.nbytes
+    if HAS_TORCH and isinstance(data, torch.Tensor):
+        return data.element_size() * data.nelement()
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    if isinstance(data, memoryview):
+        return data.nbytes
+    size = sys.getsizeof(data, 0)
+    if depth > 0 and isinstance(data, (list, tuple, set, frozenset, dict)):
+        items = data.items() if isinstance(data, dict) else data
+        n_items = len(data)
+        sampled = 0
+        for i, item in enumerate(items):
+            if i == _SAMPLE:
+                break
+            if isinstance(data, dict):
+                sampled += estimate_size(item[0], depth - 1) + estimate_size(item[1], depth - 1)
+            else:
+                sampled += estimate_size(item, depth - 1)
+        if n_items > _SAMPLE:
+            sampled = sampled * n_items // _SAMPLE
+        size += sampled
+    return size
@@ -0,0 +1,114 @@
+'''
+Measures pushes per second to edges while one client is connected and subscribed to the edge labels and the running
+indicators, with the labels and indicators buffered and sent once per tick, and with the old push_data that set them
+on every push. Each push is a numpy array with a different shape from the last one, so every push changes the label.
+
+    python bench_edge_sync.py [n_pushes] [n_edges]
+'''
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import websockets
+from grapycal.core.workspace import Workspace
+from grapycal.sobjects.edge import Edge
+
+N_PUSHES = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+N_EDGES = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+def legacy_push_data(self, data, label=None):
+    # Edge.push_data before the editor buffered the labels and running indicators
+    state = self._state
+    state.data = data
+    state.activated = True
+    state.set_ready(True)
+    self._memory.hold(self, 0)
+    with self._server.record(allow_reentry=True):
+        if self.is_destroyed():
+            return
+        self.editor.set_running(self, True)
+    label = str(list(data.shape))
+    self.label.set(label)
+    if state.head is not None:
+        state.head.port.activated_by_edge(self)
+    state.activated = False
+
+class Client:
+    '''
+    Connects to the workspace, subscribes to the given topics and counts the changes it receives.
+    '''
+    def __init__(self, port: int, topics: list[str]):
+        self.port = port
+        self.topics = topics
+        self.changes = 0
+        self.subscribed = threading.Event()
+        threading.Thread(target=lambda: asyncio.run(self.run()), daemon=True).start()
+
+    async def run(self):
+        async with websockets.connect(f'ws://localhost:{self.port}', max_size=2**24) as ws:
+            await ws.recv() # hello
+            for topic in self.topics:
+                await ws.send(json.dumps({'type': 'subscribe', 'args': {'topic_name': topic}}))
+            self.subscribed.set()
+            async for message in ws:
+                message = json.loads(message)
+                if message['type'] == 'update':
+                    self.changes += len(message['args']['changes'])
+
+def bench(workspace: Workspace, results: dict):
+    editor = workspace.get_workspace_object().main_editor
+    nodes = {}
+    created = threading.Event()
+    def create():
+        source = editor.create_node('grapycal_builtin.AdditionNode')
+        sink = editor.create_node('grapycal_builtin.AdditionNode')
+        sink.edge_activated = lambda edge, port: edge.get_data() # only consume the data
+        nodes['edges'] = [editor.create_edge(source.out_ports[0], sink.in_ports[0]) for _ in range(N_EDGES)]
+        created.set()
+    workspace.background_runner.push(create)
+    created.wait()
+    edges: list[Edge] = nodes['edges']
+
+    topics = [edge.label.get_name() for edge in edges] + [editor._running_nodes.get_name()]
+    client = Client(workspace.port, topics)
+    client.subscribed.wait()
+    time.sleep(1) # let the subscriptions arrive
+
+    arrays = [np.zeros((1, i + 1)) for i in range(8)]
+    buffered = Edge.push_data
+    for name, push_data in [('per push', legacy_push_data), ('per tick', buffered)]:
+        Edge.push_data = push_data
+        time.sleep(0.5)
+        changes = client.changes
+        # pushed from this thread, like a source node with its own thread does
+        start = time.perf_counter()
+        for i in range(N_PUSHES):
+            edges[i % N_EDGES].push_data(arrays[i % len(arrays)])
+        results[name] = N_PUSHES / (time.perf_counter() - start)
+        time.sleep(1) # let the last updates arrive
+        results[name + ' changes'] = client.changes - changes
+    Edge.push_data = buffered
+    workspace.exit()
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), 'bench_edge_sync.grapycal')
+    workspace = Workspace(random.randint(20000, 40000), 'localhost', path, 0)
+    results = {}
+    # drives the runner from another thread, after the workspace is loaded
+    workspace.background_runner.push(lambda: threading.Thread(target=bench, args=(workspace, results), daemon=True).start())
+    try:
+        workspace.run()
+    except KeyboardInterrupt:
+        pass
+
+    print(f'{N_PUSHES} pushes to {N_EDGES} edges, one client')
+    for name in ['per push', 'per tick']:
+        print(f'label and running indicator sent {name}: {results[name]:.0f} pushes/s, {results[name + " changes"]} changes sent')
+
+if __name__ == '__main__':
+    main()
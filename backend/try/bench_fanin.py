@@ -0,0 +1,81 @@
+'''
+Measures rounds per second of a fan-in of 512 edges into one AdditionNode, with the readiness counters of InputPort
+and with the old is_all_edge_ready that checked every edge on each activation. In each round, every edge gets a value
+and the node runs once, when the last one arrives.
+
+    python bench_fanin.py [n_edges] [n_rounds]
+'''
+import os
+import random
+import sys
+import tempfile
+import time
+from grapycal.core.workspace import Workspace
+from grapycal.sobjects.port import InputPort
+
+N_EDGES = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+N_ROUNDS = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+EDGES_PER_FEEDER = 64 # the default max_edges of an output port
+
+def scanning_is_all_edge_ready(self):
+    # is_all_edge_ready before the readiness counters
+    return (self.use_default and self.default_control.value_ready()) or \
+        (all(edge.is_data_ready() for edge in self.edges) and len(self.edges) > 0)
+
+def bench(workspace: Workspace, results: dict):
+    editor = workspace.get_workspace_object().main_editor
+
+    sink = editor.create_node('grapycal_builtin.AdditionNode')
+    feeders = []
+    for i in range(0, N_EDGES, EDGES_PER_FEEDER):
+        feeder = editor.create_node('grapycal_builtin.AdditionNode')
+        for _ in range(min(EDGES_PER_FEEDER, N_EDGES - i)):
+            editor.create_edge(feeder.out_ports[0], sink.in_ports[0])
+        feeders.append(feeder)
+
+    calculate = sink.calculate
+    state = {'count': 0}
+    def on_round(items):
+        assert len(items) == N_EDGES
+        state['count'] += 1
+        return calculate(items)
+    sink.calculate = on_round
+
+    def run(name):
+        # runs on the runner, then yields so the sink can run
+        state['count'] = 0
+        start = time.perf_counter()
+        for i in range(N_ROUNDS):
+            for feeder in feeders:
+                feeder.out_ports[0].push_data(i)
+            while state['count'] <= i:
+                yield
+        results[name] = N_ROUNDS / (time.perf_counter() - start)
+
+    def both():
+        counting = InputPort.is_all_edge_ready
+        InputPort.is_all_edge_ready = scanning_is_all_edge_ready
+        yield from run('scan')
+        InputPort.is_all_edge_ready = counting
+        yield from run('counters')
+        workspace.exit()
+
+    workspace.background_runner.push(both, to_queue=False, priority='bulk')
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), 'bench_fanin.grapycal')
+    workspace = Workspace(random.randint(20000, 40000), 'localhost', path, 0)
+    results = {}
+    workspace.background_runner.push(lambda: bench(workspace, results))
+    try:
+        workspace.run()
+    except KeyboardInterrupt:
+        pass
+
+    print(f'{N_EDGES} edges into one AdditionNode, {N_ROUNDS} rounds')
+    print(f'scanning edges: {results["scan"]:.1f} rounds/s')
+    print(f'counters: {results["counters"]:.1f} rounds/s')
+    print(f'speed-up: {results["counters"] / results["scan"]:.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+'''
+Compares the throughput of a chain of pure AdditionNodes with and without fusing them into one compiled function
+(FunctionNode.pure). Values are fed one at a time: when the last node of the chain gets a value, the next one is pushed.
+
+    python bench_fusion.py [chain_length] [n_values]
+'''
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from grapycal.core.workspace import Workspace
+
+CHAIN_LENGTH = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+N_VALUES = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+def bench(workspace: Workspace, results: dict):
+    editor = workspace.get_workspace_object().main_editor
+
+    feeder = editor.create_node('grapycal_builtin.AdditionNode')
+    chain = [editor.create_node('grapycal_builtin.AdditionNode') for _ in range(CHAIN_LENGTH)]
+    editor.create_edge(feeder.out_ports[0], chain[0].in_ports[0])
+    for tail, head in zip(chain, chain[1:]):
+        editor.create_edge(tail.out_ports[0], head.in_ports[0])
+
+    last = chain[-1]
+    calculate = last.calculate
+    state = {}
+
+    def on_result(items):
+        result = calculate(items)
+        state['count'] += 1
+        if state['count'] < N_VALUES:
+            feeder.out_ports[0].push_data(state['count'])
+        else:
+            state['done'].set()
+        return result
+    last.calculate = on_result
+
+    def measure(fused: bool):
+        for node in chain:
+            node.pure = fused
+        state['count'] = 0
+        state['done'] = threading.Event()
+        start = time.perf_counter()
+        feeder.out_ports[0].push_data(0)
+        return start
+
+    def run(fused: bool):
+        # runs on the runner, then yields so the chain can run
+        start = measure(fused)
+        while not state['done'].is_set():
+            yield
+        results['fused' if fused else 'unfused'] = N_VALUES / (time.perf_counter() - start)
+
+    def both():
+        yield from run(False)
+        yield from run(True)
+        workspace.exit()
+
+    workspace.background_runner.push(both, to_queue=False, priority='bulk')
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), 'bench_fusion.grapycal')
+    workspace = Workspace(random.randint(20000, 40000), 'localhost', path, 0)
+    results = {}
+    workspace.background_runner.push(lambda: bench(workspace, results))
+    try:
+        workspace.run()
+    except KeyboardInterrupt:
+        pass
+
+    print(f'chain of {CHAIN_LENGTH} AdditionNodes, {N_VALUES} values')
+    print(f'unfused: {results["unfused"]:.0f} values/s')
+    print(f'fused: {results["fused"]:.0f} values/s')
+    print(f'speed-up: {results["fused"] / results["unfused"]:.1f}x')
+
+if __name__ == '__main__':
+    main()
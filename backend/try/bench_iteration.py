@@ -0,0 +1,93 @@
+'''
+Measures the throughput of a RepeatNode feeding a trivial LambdaNode in each iteration mode, and with the old
+iteration that scheduled one task per item.
+
+    python bench_iteration.py [times]
+'''
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from grapycal.core.workspace import Workspace
+
+TIMES = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+# The lambda sets _done when it gets the last item
+EXPRESSIONS = {
+    'per-task': '_done.set() if x == _last else None',
+    'item': '_done.set() if x == _last else None',
+    'chunk': '_done.set() if x[-1] == _last else None',
+    'bulk': '(sum(x), _done.set())',
+}
+
+def legacy_task(node):
+    # The iteration before the modes were added: a task per item
+    def step():
+        try:
+            item = next(node.iterator)
+        except StopIteration:
+            node.iterator = None
+            return
+        node.run(step, to_queue=False)
+        node.item_port.push_data(item)
+    node.iterator = iter(range(node.times.get()))
+    node.run(step, to_queue=False)
+
+def bench(workspace: Workspace, results: dict):
+    editor = workspace.get_workspace_object().main_editor
+    done = threading.Event()
+    workspace.vars().update({'_done': done, '_last': TIMES - 1})
+
+    def setup():
+        repeat = editor.create_node('grapycal_builtin.RepeatNode')
+        lambda_ = editor.create_node('grapycal_builtin.LambdaNode')
+        editor.create_edge(repeat.item_port, lambda_.get_in_port('x'))
+        repeat.times.set(TIMES)
+        return repeat, lambda_
+    nodes = {}
+    ready = threading.Event()
+    def create():
+        nodes['repeat'], nodes['lambda'] = setup()
+        ready.set()
+    workspace.background_runner.push(create)
+    ready.wait()
+    repeat, lambda_ = nodes['repeat'], nodes['lambda']
+
+    for mode, expression in EXPRESSIONS.items():
+        configured = threading.Event()
+        def configure():
+            lambda_.text_controls[''].text.set(expression)
+            repeat.mode.set('item' if mode == 'per-task' else mode)
+            configured.set()
+        workspace.background_runner.push(configure)
+        configured.wait()
+        done.clear()
+        start = time.perf_counter()
+        if mode == 'per-task':
+            repeat.run(lambda: legacy_task(repeat))
+        else:
+            repeat.double_click()
+        done.wait()
+        results[mode] = TIMES / (time.perf_counter() - start)
+        time.sleep(0.5) # let the runner finish the last tasks
+    workspace.exit()
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), 'bench_iteration.grapycal')
+    workspace = Workspace(random.randint(20000, 40000), 'localhost', path, 0)
+    results = {}
+    # drives the runner from another thread, after the workspace is loaded
+    workspace.background_runner.push(lambda: threading.Thread(target=bench, args=(workspace, results), daemon=True).start())
+    try:
+        workspace.run()
+    except KeyboardInterrupt:
+        pass
+
+    print(f'Repeat {TIMES} -> Lambda')
+    for mode, items_per_second in results.items():
+        print(f'{mode:>8}: {items_per_second:.0f} items/s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+'''
+Measures the lag of the communication event loop with many nodes loaded, while idle and while every node runs tasks
+that print. The lag is how late a 10 ms sleep on the loop wakes up.
+
+    python bench_output_flush.py [n_nodes] [n_rounds]
+'''
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from grapycal.core.workspace import Workspace
+
+N_NODES = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+N_ROUNDS = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+class LagProbe:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.lags = []
+        self.running = True
+        asyncio.run_coroutine_threadsafe(self.run(), loop)
+
+    async def run(self):
+        while self.running:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            self.lags.append(time.perf_counter() - start - 0.01)
+
+    def take(self) -> str:
+        lags, self.lags = self.lags, []
+        return f'mean {statistics.mean(lags) * 1000:.2f} ms, max {max(lags) * 1000:.1f} ms'
+
+def bench(workspace: Workspace, results: dict):
+    editor = workspace.get_workspace_object().main_editor
+    nodes = []
+    created = threading.Event()
+    def create():
+        start = time.perf_counter()
+        for _ in range(N_NODES):
+            nodes.append(editor.create_node('grapycal_builtin.AdditionNode'))
+        results['load'] = f'{time.perf_counter() - start:.1f} s'
+        created.set()
+    workspace.background_runner.push(create)
+    created.wait()
+
+    probe = LagProbe(workspace.get_communication_event_loop())
+    time.sleep(0.5)
+    probe.take()
+    time.sleep(3)
+    results['idle'] = probe.take()
+
+    done = threading.Event()
+    remaining = [N_NODES * N_ROUNDS]
+    def task(node):
+        with node._redirect_output():
+            print('step')
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            done.set()
+    start = time.perf_counter()
+    for _ in range(N_ROUNDS):
+        for node in nodes:
+            node.run(task, node=node)
+    done.wait()
+    results['printing'] = probe.take() + f', {N_NODES * N_ROUNDS / (time.perf_counter() - start):.0f} tasks/s'
+    probe.running = False
+    workspace.exit()
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), 'bench_output_flush.grapycal')
+    workspace = Workspace(random.randint(20000, 40000), 'localhost', path, 0)
+    results = {}
+    # drives the runner from another thread, after the workspace is loaded
+    workspace.background_runner.push(lambda: threading.Thread(target=bench, args=(workspace, results), daemon=True).start())
+    try:
+        workspace.run()
+    except KeyboardInterrupt:
+        pass
+
+    print(f'{N_NODES} nodes, loaded in {results["load"]}')
+    print(f'event loop lag while idle: {results["idle"]}')
+    print(f'event loop lag while every node prints {N_ROUNDS} times: {results["printing"]}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+'''
+Compares running a CPU-bound FunctionNode.calculate in the runner thread with running it in the ProcessPool.
+'''
+import os
+import time
+from grapycal.core.process_pool import ProcessPool
+from grapycal.sobjects.functionNode import FunctionNode
+
+class HeavyNode(FunctionNode):
+    inputs = ['n']
+    outputs = ['sum']
+    use_process_pool = True
+
+    def calculate(self, n):
+        return sum(i * i % 7 for i in range(n))
+
+N_TASKS = 16
+N = 2_000_000
+
+def main():
+    node = HeavyNode.__new__(HeavyNode)
+    start = time.perf_counter()
+    inline_results = [node.calculate(n=N) for _ in range(N_TASKS)]
+    inline_time = time.perf_counter() - start
+
+    pool = ProcessPool()
+    pool.submit(HeavyNode, {'n': 1}).result() # start the processes
+    start = time.perf_counter()
+    futures = [pool.submit(HeavyNode, {'n': N}) for _ in range(N_TASKS)]
+    pool_results = [future.result() for future in futures]
+    pool_time = time.perf_counter() - start
+    pool.shutdown()
+
+    assert inline_results == pool_results
+    print(f'{N_TASKS} tasks on {os.cpu_count()} cores')
+    print(f'runner thread: {inline_time:.2f}s')
+    print(f'process pool:  {pool_time:.2f}s ({inline_time / pool_time:.1f}x)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+'''
+Measures the push-to-start latency of BackgroundRunner when it is idle, and its throughput for empty tasks pushed from
+another thread and from the runner thread itself.
+'''
+import statistics
+import threading
+import time
+from grapycal.core.background_runner import BackgroundRunner
+
+N_LATENCY = 200
+N_THROUGHPUT = 200_000
+
+def percentile(data, p):
+    data = sorted(data)
+    return data[min(len(data) - 1, int(len(data) * p))]
+
+def main():
+    runner = BackgroundRunner()
+    latencies = []
+    results = {}
+
+    def bench():
+        for _ in range(N_LATENCY):
+            done = threading.Event()
+            def task(pushed=time.perf_counter()):
+                latencies.append(time.perf_counter() - pushed)
+                done.set()
+            runner.push(task)
+            done.wait()
+            time.sleep(0.005) # let the runner go idle
+
+        done = threading.Event()
+        start = time.perf_counter()
+        for _ in range(N_THROUGHPUT - 1):
+            runner.push(lambda: None)
+        runner.push(done.set)
+        done.wait()
+        results['cross_thread'] = N_THROUGHPUT / (time.perf_counter() - start)
+
+        done = threading.Event()
+        def from_runner():
+            for _ in range(N_THROUGHPUT - 1):
+                runner.push(lambda: None)
+            runner.push(done.set)
+        start = time.perf_counter()
+        runner.push(from_runner)
+        done.wait()
+        results['same_thread'] = N_THROUGHPUT / (time.perf_counter() - start)
+
+        runner.exit()
+
+    threading.Thread(target=bench, daemon=True).start()
+    try:
+        runner.run()
+    except KeyboardInterrupt:
+        pass
+
+    print(f'push-to-start latency: p50 {percentile(latencies, 0.5)*1e6:.0f}us, p99 {percentile(latencies, 0.99)*1e6:.0f}us, mean {statistics.mean(latencies)*1e6:.0f}us')
+    print(f'empty tasks pushed from another thread: {results["cross_thread"]:.0f}/s')
+    print(f'empty tasks pushed from the runner thread: {results["same_thread"]:.0f}/s')
+
+if __name__ == '__main__':
+    main()
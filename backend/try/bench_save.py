@@ -0,0 +1,100 @@
+'''
+Measures how long saving blocks the runner with many nodes loaded: writing the whole workspace like before the
+journal, writing a base snapshot, and appending the changes after moving a few nodes. Also measures reading the file.
+
+    python bench_save.py [n_nodes] [n_moved]
+'''
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import grapycal
+from grapycal.core.workspace import Workspace
+from grapycal.utils.io import read_workspace
+
+N_NODES = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+N_MOVED = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+def legacy_save(workspace: Workspace, path: str):
+    # Workspace.save_workspace before the journal, without the counting and the messages, and write_workspace then
+    metadata = {
+        "version": grapycal.__version__,
+        "extensions": workspace._extention_manager.get_extensions_info(),
+    }
+    data = {
+        "extensions": workspace._extention_manager.get_extention_names(),
+        "client_id_count": workspace._objectsync.get_client_id_count(),
+        "id_count": workspace._objectsync.get_id_count(),
+        "grapycal_id_count": workspace.grapycal_id_count,
+        "workspace_serialized": workspace.get_workspace_object().serialize().to_dict(),
+    }
+    with gzip.open(path, 'wt') as f:
+        f.write(grapycal.__version__ + '\n')
+        json.dump(metadata, f)
+        f.write('\n')
+        json.dump(data, f)
+
+def on_runner(workspace: Workspace, task) -> tuple[float, float]:
+    '''
+    Run the task on the runner. Returns how long it blocked the runner and how long until the file was written.
+    '''
+    done = threading.Event()
+    times = {}
+    def run():
+        start = time.perf_counter()
+        task()
+        times['blocked'] = time.perf_counter() - start
+        done.set()
+    start = time.perf_counter()
+    workspace.background_runner.push(run)
+    done.wait()
+    workspace._journal.close() # waits for the pending writes
+    return times['blocked'], time.perf_counter() - start
+
+def bench(workspace: Workspace, results: dict):
+    editor = workspace.get_workspace_object().main_editor
+    nodes = []
+    def create():
+        for _ in range(N_NODES):
+            nodes.append(editor.create_node('grapycal_builtin.AdditionNode'))
+    on_runner(workspace, create)
+    path = os.path.join(os.path.dirname(workspace.path), 'saved.grapycal') # a new file, so a snapshot is written
+
+    results['legacy'] = on_runner(workspace, lambda: legacy_save(workspace, path))
+    os.remove(path)
+    results['snapshot'] = on_runner(workspace, lambda: workspace.save_workspace(path))
+    def move():
+        for node in random.sample(nodes, N_MOVED):
+            node.translation.set(f'{random.random()},{random.random()}')
+    on_runner(workspace, move)
+    results['journal'] = on_runner(workspace, lambda: workspace.save_workspace(path))
+
+    start = time.perf_counter()
+    read_workspace(path)
+    results['read'] = time.perf_counter() - start
+    workspace.exit()
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), 'bench_save.grapycal')
+    workspace = Workspace(random.randint(20000, 40000), 'localhost', path, 0)
+    results = {}
+    # drives the runner from another thread, after the workspace is loaded
+    workspace.background_runner.push(lambda: threading.Thread(target=bench, args=(workspace, results), daemon=True).start())
+    try:
+        workspace.run()
+    except KeyboardInterrupt:
+        pass
+
+    print(f'{N_NODES} nodes')
+    for name, label in [('legacy', 'whole workspace, written on the runner'), ('snapshot', 'base snapshot'),
+                        (f'journal', f'journal entry after moving {N_MOVED} nodes')]:
+        blocked, written = results[name]
+        print(f'{label}: runner blocked {blocked * 1000:.0f} ms, written after {written * 1000:.0f} ms')
+    print(f'read with the journal: {results["read"] * 1000:.0f} ms')
+
+if __name__ == '__main__':
+    main()
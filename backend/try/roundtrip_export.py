@@ -0,0 +1,107 @@
+'''
+Checks that a graph exported with grapycal.core.export gives the same outputs as the interactive run. A graph of
+FunctionNodes, a LambdaNode, an ExecNode and a SplitNode (which runs in the exported module's mini-runtime) is fed
+a few values. The outputs are recorded by probe nodes outside the exported nodes, then the exported module is run
+with the same values.
+
+    python roundtrip_export.py
+'''
+import importlib.util
+import os
+import random
+import tempfile
+from grapycal.core.export import export_module
+from grapycal.core.workspace import Workspace
+
+VALUES = [1, 2, 5, -3]
+
+def build(editor):
+    feeder = editor.create_node('grapycal_builtin.AdditionNode')
+    add = editor.create_node('grapycal_builtin.AdditionNode')
+    editor.create_edge(feeder.out_ports[0], add.in_ports[0])
+    editor.create_edge(feeder.out_ports[0], add.in_ports[0])
+
+    lambda_ = editor.create_node('grapycal_builtin.LambdaNode')
+    lambda_.text_controls[''].text.set('x * 3')
+    lambda_.outputs.insert('pair')
+    lambda_.text_controls['pair'].text.set('[x, x + 1]')
+    editor.create_edge(add.out_ports[0], lambda_.get_in_port('x'))
+
+    exec_ = editor.create_node('grapycal_builtin.ExecNode')
+    exec_.inputs.insert('y')
+    exec_.outputs.insert('z')
+    exec_.text_control.set('z = y - 1\nz * 2')
+    exec_.print_last_expr.set('no')
+    editor.create_edge(lambda_.get_out_port(''), exec_.get_in_port('y'))
+
+    multiply = editor.create_node('grapycal_builtin.MultiplicationNode')
+    editor.create_edge(exec_.get_out_port('z'), multiply.in_ports[0])
+    editor.create_edge(add.out_ports[0], multiply.in_ports[0])
+
+    split = editor.create_node('grapycal_builtin.SplitNode')
+    split.key_mode.set('eval')
+    split.keys.insert('1')
+    editor.create_edge(lambda_.get_out_port('pair'), split.in_port)
+
+    exported = [add, lambda_, exec_, multiply, split]
+    outputs = [multiply.out_ports[0], exec_.out_port, split.get_out_port('1')]
+    return feeder, exported, outputs
+
+def interactive(workspace: Workspace, results: dict):
+    editor = workspace.get_workspace_object().main_editor
+    feeder, exported, outputs = build(editor)
+
+    received = {f'{port.node.get_id()}.{port.get_name()}': [] for port in outputs}
+    for port in outputs:
+        probe = editor.create_node('grapycal_builtin.AdditionNode')
+        editor.create_edge(port, probe.in_ports[0])
+        def record(items, key=f'{port.node.get_id()}.{port.get_name()}'):
+            received[key].append(items[0])
+        probe.calculate = record
+
+    def feed():
+        # runs on the runner, then yields so the graph can run
+        for value in VALUES:
+            feeder.out_ports[0].push_data(value)
+            while any(len(values) < len(results['inputs']) + 1 for values in received.values()):
+                yield
+            results['inputs'].append(value)
+        results['interactive'] = received
+        results['path'] = os.path.join(tempfile.mkdtemp(), 'exported_graph.py')
+        export_module(editor, results['path'], exported)
+        results['feeder'] = f'{feeder.get_id()}.{feeder.out_ports[0].get_name()}'
+        workspace.exit()
+
+    results['inputs'] = []
+    workspace.background_runner.push(feed, to_queue=False)
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), 'roundtrip_export.grapycal')
+    workspace = Workspace(random.randint(20000, 40000), 'localhost', path, 0)
+    results = {}
+    workspace.background_runner.push(lambda: interactive(workspace, results))
+    try:
+        workspace.run()
+    except KeyboardInterrupt:
+        pass
+
+    spec = importlib.util.spec_from_file_location('exported_graph', results['path'])
+    module = importlib.util.module_from_spec(spec) # type: ignore
+    spec.loader.exec_module(module) # type: ignore
+    exported = {key: [] for key in results['interactive']}
+    for value in VALUES:
+        outputs = module.run({results['feeder']: value})
+        for key in exported:
+            exported[key].append(outputs[key])
+
+    failed = False
+    for key, values in results['interactive'].items():
+        same = values == exported[key]
+        failed |= not same
+        print(f'{key}: interactive {values}, exported {exported[key]} {"ok" if same else "MISMATCH"}')
+    print(f'exported module: {results["path"]}')
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
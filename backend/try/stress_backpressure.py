@@ -0,0 +1,106 @@
+'''
+Pushes 1M items through a slow consumer with each backpressure policy of BackgroundRunner and checks that the peak RSS
+stays bounded. Without a capacity the pending tasks alone would hold more than 1GB.
+
+    python stress_backpressure.py [n_items]
+'''
+import resource
+import sys
+import threading
+import time
+from grapycal.core.background_runner import BackgroundRunner
+
+N_ITEMS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+ITEM_SIZE = 1024
+MAX_PENDING = 1000
+RSS_LIMIT = 200 * 1024 * 1024
+
+def peak_rss() -> int:
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def main():
+    runner = BackgroundRunner(max_pending=MAX_PENDING)
+    consumed = 0
+    results = {}
+
+    def consume(item: bytearray):
+        nonlocal consumed
+        for _ in range(20): # be slower than the producer
+            item[0] = (item[0] + 1) % 256
+        consumed += 1
+
+    def wait_until_idle():
+        while any(runner.get_queue_depths().values()):
+            time.sleep(0.01)
+        # wait for the last consumer task to finish
+        done = threading.Event()
+        runner.push(done.set, group='consumer')
+        done.wait()
+
+    def block():
+        for _ in range(N_ITEMS):
+            item = bytearray(ITEM_SIZE)
+            runner.push(lambda item=item: consume(item), group='consumer', backpressure='block')
+
+    def generate():
+        # Like a data loader: a generator task on the runner that feeds a downstream node at each step
+        for _ in range(N_ITEMS):
+            item = bytearray(ITEM_SIZE)
+            runner.push(lambda item=item: consume(item), group='consumer', backpressure='yield')
+            yield
+
+    def drop():
+        dropped = 0
+        for _ in range(N_ITEMS):
+            item = bytearray(ITEM_SIZE)
+            if not runner.push(lambda item=item: consume(item), group='consumer', backpressure='drop'):
+                dropped += 1
+        return dropped
+
+    def stress():
+        nonlocal consumed
+        baseline = peak_rss()
+
+        start = time.perf_counter()
+        block()
+        wait_until_idle()
+        results['block'] = (consumed, time.perf_counter() - start)
+
+        consumed = 0
+        start = time.perf_counter()
+        runner.push(lambda: generate(), group='loader', backpressure='yield')
+        wait_until_idle()
+        results['yield'] = (consumed, time.perf_counter() - start)
+
+        consumed = 0
+        start = time.perf_counter()
+        dropped = drop()
+        wait_until_idle()
+        results['drop'] = (consumed, time.perf_counter() - start)
+        results['dropped'] = dropped
+
+        results['rss_growth'] = peak_rss() - baseline
+        runner.exit()
+
+    threading.Thread(target=stress, daemon=True).start()
+    try:
+        runner.run()
+    except KeyboardInterrupt:
+        pass
+
+    for policy in ('block', 'yield', 'drop'):
+        consumed, elapsed = results[policy]
+        print(f'{policy}: consumed {consumed} of {N_ITEMS} items in {elapsed:.1f}s')
+    print(f'drop: dropped {results["dropped"]} items')
+    print(f'peak RSS growth: {results["rss_growth"] / 1024 / 1024:.1f}MB (pending items would take {N_ITEMS * ITEM_SIZE / 1024 / 1024:.0f}MB)')
+
+    assert results['block'][0] == N_ITEMS
+    assert results['yield'][0] == N_ITEMS
+    assert results['drop'][0] + results['dropped'] == N_ITEMS
+    assert results['rss_growth'] < RSS_LIMIT, 'peak RSS is not bounded'
+    print('OK')
+
+if __name__ == '__main__':
+    main()
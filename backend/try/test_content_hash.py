@@ -0,0 +1,28 @@
+'''
+Regression tests for content_hash. Run with pytest, or directly.
+'''
+import numpy as np
+from grapycal.core.cache import content_hash
+
+def test_split_strings_differ():
+    # the bytes of the items are the same when concatenated
+    assert content_hash(['abstr', '']) != content_hash(['ab', 'str'])
+    assert content_hash([b'abstr', b'']) != content_hash([b'ab', b'str'])
+    assert content_hash({'ab': 'str'}) != content_hash({'abs': 'tr'})
+
+def test_types_differ():
+    assert content_hash('1') != content_hash(1)
+    assert content_hash(b'ab') != content_hash('ab')
+
+def test_arrays():
+    a = np.arange(6).reshape(2, 3)
+    assert content_hash(a) == content_hash(a.copy())
+    assert content_hash(a.T) == content_hash(np.ascontiguousarray(a.T))
+    assert content_hash(a) != content_hash(a.reshape(3, 2))
+    assert content_hash(np.array([object()])) is None
+
+if __name__ == '__main__':
+    test_split_strings_differ()
+    test_types_differ()
+    test_arrays()
+    print('ok')
@@ -16,6 +16,7 @@ class AdditionNode(FunctionNode):
     inputs = ['items']
     max_in_degree = [None]
     outputs = ['sum']
+    pure = True
     display_port_names = False
 
     def build_node(self):
@@ -48,6 +49,7 @@ class SubtractionNode(FunctionNode):
     inputs = ['a', 'b']
     max_in_degree = [None, None]
     outputs = ['a-b']
+    pure = True
     display_port_names = False
 
     def build_node(self):
@@ -74,6 +76,7 @@ class MultiplicationNode(FunctionNode):
     inputs = ['items']
     max_in_degree = [None]
     outputs = ['product']
+    pure = True
     display_port_names = False
 
     def build_node(self):
@@ -106,6 +109,7 @@ class DivisionNode(FunctionNode):
     inputs = ['a', 'b']
     max_in_degree = [None,None]
     outputs = ['a/b']
+    pure = True
     display_port_names = False
     
     def build_node(self):
@@ -64,7 +64,7 @@ class WebcamNode(Node):
     def _on_image_set(self,_):
         if len(self.out_port.edges) == 0:
             return
-        self.run(self._on_image_set_task)
+        self.run(self._on_image_set_task, coalesce_key='frame')
 
     def _on_image_set_task(self):
         image_bytes:bytes = self.workspace.get_workspace_object().webcam.image.to_binary()
@@ -212,7 +212,7 @@ class ImageDisplayNode(Node):
         self.icon_path.set("image")
 
     def edge_activated(self, edge: Edge, port: InputPort):
-        self.run(self.update_image, data=self.in_port.get_one_data())
+        self.run(self.update_image, data=self.in_port.get_one_data(), coalesce_key="image")
 
     def find_valid_slice(self, data: np.ndarray) -> str | None:
         if data.ndim == 2:
@@ -318,7 +318,7 @@ class ScatterPlotNode(Node):
 
     def edge_activated(self, edge: Edge, port: InputPort):
         if self.in_port.is_all_edge_ready():
-            self.run(self.update_image, data=self.in_port.get_data())
+            self.run(self.update_image, data=self.in_port.get_data(), coalesce_key="image")
 
     def find_valid_slice(self, data: np.ndarray) -> str | None:
         if data.ndim == 2:
@@ -458,7 +458,10 @@ class LinePlotNode(Node):
             case self.x_coord_port:
                 self.x_coord = to_list(port.get_one_data())
             case _:
-                self.run(self.update_plot, ys=port.get_one_data(), name=port.name.get())
+                name = port.name.get()
+                # In "continue" mode every update appends points, so none of them can be skipped
+                coalesce_key = name if self.x_gen_mode.get() == "from 0" else None
+                self.run(self.update_plot, ys=port.get_one_data(), name=name, coalesce_key=coalesce_key)
 
     def gen_x_coord(self, ys):
         if self.x_gen_mode.get() == "from 0":
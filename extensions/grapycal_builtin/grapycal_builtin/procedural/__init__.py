@@ -10,7 +10,6 @@ from .forNode import *
 from .procedureNode import ProcedureNode
 from .limiterNode import LimiterNode
 from .funcDef import *
-import time
 
 class PortalManager:
     ins = ListDict['InPortalNode']()
@@ -100,5 +99,9 @@ class SleepNode(FunctionNode):
         self.time_control = time_port.default_control
 
     def calculate(self, **inputs) -> Any:
-        time.sleep(float(self.time_control.get_value()))
-        return inputs['start']
\ No newline at end of file
+        # wake up early if the node is cancelled
+        self.get_cancellation_token().sleep(float(self.time_control.get_value()))
+        return inputs['start']
+
+    def double_click(self):
+        self.cancel()
@@ -1,15 +1,72 @@
-from typing import Iterable
+import itertools
+import time
+from typing import Iterable, Iterator
 from grapycal import Node
 from grapycal.extension.utils import NodeInfo
 from grapycal.sobjects.edge import Edge
-from grapycal.sobjects.port import InputPort
+from grapycal.sobjects.port import InputPort, OutputPort
 from grapycal.sobjects.sourceNode import SourceNode
-from objectsync import IntTopic
+from objectsync import FloatTopic, IntTopic, StringTopic
+
+def _add_iteration_attributes(node: Node):
+    node.mode = node.add_attribute('mode', StringTopic, 'item', editor_type='options', options=['item', 'chunk', 'bulk']) # type: ignore
+    node.chunk_size = node.add_attribute('chunk size', IntTopic, 1000, editor_type='int') # type: ignore
+    node.chunk_time = node.add_attribute('chunk time', FloatTopic, 20, editor_type='float') # type: ignore
+
+class _Branches:
+    '''
+    Lets the edges of a port each iterate the items of an iterator once: every iter() call returns its own branch of
+    itertools.tee. The items are read lazily and kept only until every branch has passed them.
+    '''
+    def __init__(self, iterator: Iterator, n: int):
+        self._branches = list(itertools.tee(iterator, n))
+
+    def __iter__(self):
+        if len(self._branches) == 0:
+            raise RuntimeError('Every branch of the items has been taken')
+        return self._branches.pop()
+
+def _push_items(node: Node, iterator: Iterator, port: OutputPort):
+    '''
+    A generator task that pushes the items of the iterator to the port, once per step, in the node's mode. Between
+    steps, the runner runs the tasks of the downstream nodes, which are queued and therefore come first.
+    '''
+    mode = node.mode.get() # type: ignore
+    if mode == 'bulk':
+        # an iterator can only be consumed once, so each edge gets its own
+        port.push_data(iterator if len(port.edges) <= 1 else _Branches(iterator, len(port.edges)))
+        return
+    if mode == 'item':
+        for item in iterator:
+            port.push_data(item)
+            yield
+        return
+    chunk_size = max(1, node.chunk_size.get()) # type: ignore
+    chunk_time = node.chunk_time.get() / 1000 # type: ignore
+    while True:
+        chunk = []
+        deadline = time.perf_counter() + chunk_time
+        for item in iterator:
+            chunk.append(item)
+            if len(chunk) >= chunk_size or time.perf_counter() >= deadline:
+                break
+        if len(chunk) == 0:
+            return
+        port.push_data(chunk)
+        yield
 
 class ForNode(Node):
     '''
     Iterate through an iterable object. Each iteration will push the next item to the ``item`` port.
     Double click to interrupt the iteration.
+
+    The ``mode`` attribute sets how the items are pushed:
+
+    - item: one item per push.
+    - chunk: a list of items per push. A list ends after ``chunk size`` items or ``chunk time`` milliseconds, so the
+      scheduling and edge costs are paid once per list instead of once per item.
+    - bulk: push an iterator over all items once, for nodes that consume iterables directly, e.g. a Lambda node with
+      ``sum(x)``.
     '''
     category = 'procedural'
 
@@ -19,7 +76,7 @@ class ForNode(Node):
         self.item_port = self.add_out_port('item')
         self.label.set('For')
         self.shape.set('simple')
-
+        _add_iteration_attributes(self)
 
     def init_node(self):
         self.iterator:Iterable|None = None
@@ -29,28 +86,25 @@ class ForNode(Node):
 
     def task(self):
         self.iterator = iter(self.iterable_port.get_one_data()) #type: ignore
-        self.run(self.next,to_queue=False)
+        # a separate task, so the iteration has normal priority even if the node was double clicked
+        self.run(self.iterate, to_queue=False)
 
-    def next(self):
-        if self.iterator is None:
-            return
+    def iterate(self):
         try:
-            item = next(self.iterator) #type: ignore
-        except StopIteration:
-            return
-        self.run(self.next,to_queue=False)
-        for edge in self.item_port.edges:
-            edge.push_data(item)
+            yield from _push_items(self, self.iterator, self.item_port) #type: ignore
+        finally:
+            self.iterator = None
 
     def double_click(self):
-        self.iterator = None
+        self.cancel()
+        self.iterator = None # release the iterable
         self.print('Iteration interrupted')
 
 class RepeatNode(SourceNode):
     '''
     𝄆 Repeatly push numbers from 0 to ``times``-1 to the ``item`` port. 𝄇
 
-    Shortcut for ``For`` node with ``range`` as iterable.
+    Shortcut for ``For`` node with ``range`` as iterable. The ``mode`` attribute works as in the ``For`` node.
     '''
     category = 'procedural'
 
@@ -59,6 +113,7 @@ class RepeatNode(SourceNode):
         self.item_port = self.add_out_port('item')
         self.shape.set('simple')
         self.times = self.add_attribute('times',IntTopic,editor_type='int',init_value=10)
+        _add_iteration_attributes(self)
         
     def init_node(self):
         super().init_node()
@@ -71,23 +126,19 @@ class RepeatNode(SourceNode):
 
     def task(self):
         self.iterator = iter(range(self.times.get()))
-        self.run(self.next,to_queue=False)
+        # a separate task, so the iteration has normal priority even if the node was double clicked
+        self.run(self.iterate, to_queue=False)
 
-    def next(self):
-        if self.iterator is None:
-            return
+    def iterate(self):
         try:
-            item = next(self.iterator) #type: ignore
-        except StopIteration:
+            yield from _push_items(self, self.iterator, self.item_port) #type: ignore
+        finally:
             self.iterator = None
-            return
-        self.run(self.next,to_queue=False)
-        for edge in self.item_port.edges:
-            edge.push_data(item)
 
     def double_click(self):
         if self.iterator is None:
             super().double_click()
         else:
+            self.cancel()
             self.iterator = None
             self.print('Iteration interrupted')
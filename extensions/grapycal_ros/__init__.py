@@ -115,6 +115,8 @@ class RosbridgeNode(Node):
     def on_tick(self):
         if self.status != RosbridgeNode.Status.CONNECTED:
             return
+        if self.workspace.background_runner.is_full():
+            return # leave the messages in the socket until the runner catches up
         msgs = []
         while True:
             try:
@@ -92,21 +92,11 @@ class NetManager:
         self.on_network_names_changed = Action()
 
     def get_module_nodes(self, name)->list['moduleNode.ModuleNode']:
-        def _get_modules_after(node:Node,res:set['moduleNode.ModuleNode'])->None:
-            if node in res:
-                return 
-            if isinstance(node,moduleNode.ModuleNode):
-                res.add(node)
-            output_edges = [edge for port in node.out_ports for edge in port.edges]
-            if isinstance(node,moduleNode.ModuleNode):
-                if node.module is not None:
-                    res.add(node)
-            for edge in output_edges:
-                _get_modules_after(edge.head.get().node,res)
-
-        res = set()
-        _get_modules_after(self.ins[name],res)
-        return list(res)
+        # Called on every training step. The editor's graph index memoizes the downstream nodes until the graph changes.
+        in_node = self.ins[name]
+        assert in_node.editor is not None
+        downstream = in_node.editor.graph.downstream(in_node)
+        return [node for node in downstream if isinstance(node,moduleNode.ModuleNode)]
     
     def has_network(self, name):
         return name in self.ins and name in self.outs
@@ -157,6 +157,7 @@ class FConv2DNode(FunctionNode):
     inputs = ['x','kernel']
     max_in_degree = [1,1]
     outputs = ['result']
+    cacheable = True
     def build_node(self):
         super().build_node()
         self.label.set('Conv2D')
@@ -187,6 +188,7 @@ class SinNode(FunctionNode):
     category = 'torch/operations'
     inputs = ['inp']
     outputs = ['result']
+    pure = True
     max_in_degree = [1]
     display_port_names = False
     def build_node(self):
@@ -201,6 +203,7 @@ class CosNode(FunctionNode):
     category = 'torch/operations'
     inputs = ['inp']
     outputs = ['result']
+    pure = True
     max_in_degree = [1]
     display_port_names = False
     def build_node(self):
@@ -215,6 +218,7 @@ class CumprodNode(FunctionNode):
     category = 'torch/operations'
     inputs = ['inp']
     outputs = ['result']
+    pure = True
     max_in_degree = [1]
     display_port_names = False
     def build_node(self):
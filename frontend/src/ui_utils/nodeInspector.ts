@@ -115,6 +115,7 @@ export class NodeInspector extends Componentable{
         }
         this.linker.unlink(this.addOutput,false)
         this.linker.unlink(this.onOutputSet,false)
+        this.linker.unlink(this.removeOldestOutput,false)
         if(this.nodes.length === 1){
             let fullType = this.nodes[0].type_topic.getValue();
             let type = fullType.split('.')[1];
@@ -128,6 +129,7 @@ export class NodeInspector extends Componentable{
             }
             this.linker.link(outputAttribute.onInsert,this.addOutput);
             this.linker.link(outputAttribute.onSet,this.onOutputSet);
+            this.linker.link(outputAttribute.onPop,this.removeOldestOutput);
             
         }
         else{//multiple nodes
@@ -186,6 +188,11 @@ export class NodeInspector extends Componentable{
         if(value.length === 0)
             this.outputDisplayDiv.innerText = '';
     }
+
+    private removeOldestOutput(){
+        // The backend only evicts the oldest entries of the output
+        this.outputDisplayDiv.firstElementChild?.remove();
+    }
     
     private updateHierarchy(){
         